@@ -1,12 +1,28 @@
+from shared.batch import BatchRequest
+from shared.clock import Clock, MONOTONIC_CLOCK, ns_to_s, s_to_ns
 from shared.comm import Comm
-from shared.datetime import diff_ms
 from shared.types import MessageType, ResponseType
 from shared.comms_manager import CommsManager
+from shared.datetime import datetime_to_ns
+from shared.flow_control import RequestWindow, WINDOW_DEPTH, WINDOW_QUEUE_CAPACITY
+from shared.history import RETAINED_SEGMENTS, ShareHistory
+from shared.identity import IdentityCache
+from shared.queues import DropPolicy, MessagePriority
+from shared.request_template import OutgoingMessage, RequestTemplate
+from shared.ring_buffer import RecentShares, RING_CAPACITY, ShareValue
+from shared.scheduler import Scheduler, ScheduledRequest
+from shared.share_cache import ShareCache
+from shared.subscriptions import Subscription, SubscriptionKey
+from shared.transaction_codec import Capability, DATA_MAX_SIZE, FIXED32_STRUCT, Transaction, TokenGenerator, TransactionAction, \
+    TransactionDecodeError, decode_transaction, encode_compact_request, encode_share_ids
+from shared.transfers import CHUNK_HEADER_STRUCT, CHUNK_SIZE, TRANSFER_WINDOW, Transfer, TransferDirection, TransferError
+from shared.transactions import TransactionTable, RequestRecord, TRANSACTIONS_CAPACITY, TRANSACTION_TIMEOUT_S
 from datetime import datetime
-from time import sleep
-from typing import Any, List, Dict, Callable, Optional
+from functools import partial
+from typing import Any, List, Dict, Callable, Hashable, Iterable, Optional, Set, Tuple, Union
+from concurrent.futures import Future, CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from time import perf_counter, time_ns
 from uuid import uuid4
-from tinydb import TinyDB, Query
 import threading
 import base64
 
@@ -19,61 +35,16 @@ import logging
 logger = logging.getLogger(__name__)
 
 # Defaults
-DATA_MAX_SIZE = 80
 TRANSACTION_MESSAGE_SIZE = 99
+# Time for all devices to answer a device listing
+PROBE_TIMEOUT_S = 1.0
 
 """Developer Notes:
-Tiny DB Reference - https://tinydb.readthedocs.io/en/latest/getting-started.html
 Writing docs - https://sphinx-rtd-tutorial.readthedocs.io/en/latest/docstrings.html
 
 """
 
 
-class ScheduledRequest():
-    """Scheduled Request Message Object
-    """
-    device_id: str
-    message_type: MessageType
-    share_id: int
-    interval_ms: int
-    last_scheduled: datetime = datetime.now()
-    updated_at: datetime
-    created_at: datetime = datetime.now()
-
-    def tick(self):
-        self.last_scheduled = datetime.now()
-
-    def update_interval(self, interval_ms: int):
-        self.interval_ms = interval_ms
-        self.updated_at = datetime.now()
-
-    def __str__(self) -> str:
-        return f"ScheduledRequest(device_id: {self.device_id} message_type: {self.message_type} share_id: {self.share_id} interval: {self.interval_ms})"
-
-
-class RequestRecord():
-    """API Transactions with the device
-    """
-    id: int
-    device_id: str
-    sent_at: datetime = datetime.now()
-    received_at: Optional[datetime] = None
-    created_at: datetime = datetime.now()
-
-    def get_processing_time_ms(self) -> int:
-        if self.sent_at is None or self.received_at is None:
-            return -1
-        else:
-            return int(diff_ms(self.received_at, self.sent_at, 5))
-
-    def __str__(self) -> str:
-        if self.received_at is not None:
-            return f"""RequestRecord(id: {self.id} device_id: {self.device_id} sent_at: {self.sent_at}
-            received_at: {self.received_at} created_at: {self.created_at} duration: {self.get_processing_time_ms()}ms)"""
-        else:
-            return f"RequestRecord(id: {self.id} device_id: {self.device_id} sent_at: {self.sent_at} created_at: {self.created_at})"
-
-
 class API(threading.Thread):
 
     """API
@@ -82,19 +53,81 @@ class API(threading.Thread):
     to package the data into Frames.
     """
 
-    def __init__(self, comms_manager: CommsManager,  database_storage_file: str = "./adapter-db.json") -> None:
+    def __init__(self, comms_manager: CommsManager, history_directory: Optional[str] = None,
+                 history_retained_segments: int = RETAINED_SEGMENTS, window_depth: int = WINDOW_DEPTH,
+                 drop_superseded_polls: bool = True, transactions_capacity: int = TRANSACTIONS_CAPACITY,
+                 transactions_policy: DropPolicy = DropPolicy.DROP_OLDEST, transaction_timeout_s: float = TRANSACTION_TIMEOUT_S,
+                 clock: Clock = MONOTONIC_CLOCK, compact_requests: bool = True, transfer_window: int = TRANSFER_WINDOW,
+                 recent_capacity: int = RING_CAPACITY, window_queue_capacity: int = WINDOW_QUEUE_CAPACITY) -> None:
         """Constructor method
+
+        :param history_directory: Directory of the store of received shares, None to keep no history
+        :type history_directory: str or None
+        :param history_retained_segments: Segment files kept per share in the history, 0 to keep all
+        :type history_retained_segments: int
+        :param window_depth: Initial amount of requests allowed in flight per device
+        :type window_depth: int
+        :param drop_superseded_polls: Replace a scheduled poll still waiting to be sent with the next poll of the same share
+        :type drop_superseded_polls: bool
+        :param transactions_capacity: Maximum amount of transactions awaiting a response, 0 for unbounded
+        :type transactions_capacity: int
+        :param transactions_policy: What to do with a new transaction while the table is full
+        :type transactions_policy: DropPolicy
+        :param transaction_timeout_s: Time in seconds after which an unanswered request is counted as timed out
+        :type transaction_timeout_s: float
+        :param clock: Time source of the schedules, request windows and transactions
+        :type clock: Clock
+        :param compact_requests: Send single frame requests to devices with the COMPACT_REQUESTS capability
+        :type compact_requests: bool
+        :param transfer_window: Chunks of a large share in flight per transfer
+        :type transfer_window: int
+        :param recent_capacity: Latest values kept in memory per share
+        :type recent_capacity: int
+        :param window_queue_capacity: Requests per device waiting for room in the request window, the oldest of the lowest class is dropped beyond it
+        :type window_queue_capacity: int
         """
         # Thread
         threading.Thread.__init__(self)
         self.stop_flag: bool = False
-        # Process scheduled messages loop
-        self.scheduled: List[ScheduledRequest] = list()
+        self.clock: Clock = clock
+        # Process scheduled messages loop, the event is set when the schedules or request windows change
+        self.scheduler: Scheduler = Scheduler(clock)
+        self.wakeup_event: threading.Event = threading.Event()
         # API
         self.connections: Dict[str, Comm] = dict()
         self.fns: List[Callable[[ResponseType], None]] = list()
-        self.transactions: List[RequestRecord] = list()
-        self.db = TinyDB(f"{database_storage_file}")
+        # Transaction tokens
+        self.tokens: TokenGenerator = TokenGenerator()
+        # Transactions awaiting a response by device id and token
+        self.transactions: TransactionTable = TransactionTable(transactions_capacity, transactions_policy, transaction_timeout_s, clock=clock)
+        # Requests waiting on a response by device id and token
+        self.pending_requests: Dict[Tuple[str, int], Future[bytes]] = dict()
+        # Batch requests waiting on responses by device id and token, with the last share id of the request
+        self.pending_batches: Dict[Tuple[str, int], Tuple[BatchRequest, int]] = dict()
+        # Requests in flight by device id
+        self.window_depth: int = window_depth
+        self.window_queue_capacity: int = window_queue_capacity
+        self.windows: Dict[str, RequestWindow] = dict()
+        self.drop_superseded_polls: bool = drop_superseded_polls
+        # Capabilities by device id, read from the device's Common1
+        self.compact_requests: bool = compact_requests
+        self.capabilities: Dict[str, Capability] = dict()
+        # Subscriptions by device id and share id
+        self.subscriptions: Dict[SubscriptionKey, Subscription] = dict()
+        # Chunked transfers of large shares, with their chunks in flight by device id and token
+        self.transfer_window: int = transfer_window
+        self.transfers: Set[Transfer] = set()
+        self.pending_chunks: Dict[Tuple[str, int], Transfer] = dict()
+        # Every received share by device, share id and receive time
+        self.history: Optional[ShareHistory] = None
+        if history_directory is not None:
+            self.history = ShareHistory(history_directory, retained_segments=history_retained_segments)
+        # The latest received values of each share, for charts
+        self.recent: RecentShares = RecentShares(recent_capacity)
+        # The latest value of each common message and share, answering reads that accept an age
+        self.cache: ShareCache = ShareCache()
+        # The Common1 of each device, listing devices without reading them
+        self.identities: IdentityCache = IdentityCache()
         self.comms_manager: CommsManager = comms_manager
 
     def start(self) -> None:
@@ -111,8 +144,12 @@ class API(threading.Thread):
         for _, con in self.connections.items():
             con.stop()
             con.join()
+        # Write the buffered history
+        if self.history is not None:
+            self.history.close()
         # Stops the thread
         self.stop_flag = True
+        self.wakeup_event.set()
 
     def run(self) -> None:
         """Run method used by python threading
@@ -125,24 +162,127 @@ class API(threading.Thread):
                 break
 
             # Process logic
-            self._process_scheduled_messages()
+            wait_s: Optional[float] = None
+            for process_wait_s in (self._process_scheduled_messages(), self._process_request_windows(), self._process_transactions(),
+                                   self._process_subscriptions(), self._process_transfers()):
+                if wait_s is None or (process_wait_s is not None and process_wait_s < wait_s):
+                    wait_s = process_wait_s
+
+            # Sleep until the next schedule or request timeout is due, or the schedules change
+            self.wakeup_event.wait(wait_s)
+            self.wakeup_event.clear()
+
+    def _process_request_windows(self) -> Optional[float]:
+        """Process Request Windows
+        Times out requests that have not been answered, releasing queued requests.
+
+        :return: Seconds until the next request times out, None without requests in flight
+        :rtype: float or None
+        """
+        next_deadline: Optional[int] = None
+        for window in list(self.windows.values()):
+            window.expire()
+            deadline = window.next_deadline()
+            if deadline is not None and (next_deadline is None or deadline < next_deadline):
+                next_deadline = deadline
+        return self._wait_s(next_deadline)
+
+    def _process_transactions(self) -> Optional[float]:
+        """Process Transactions
+        Expires transactions that have not been answered.
+
+        :return: Seconds until the next transaction expires, None without transactions
+        :rtype: float or None
+        """
+        self.transactions.expire()
+        return self._wait_s(self.transactions.next_deadline())
+
+    def _process_subscriptions(self) -> Optional[float]:
+        """Process Subscriptions
+        Renews streamed subscriptions that stopped receiving notifications, as after the device
+        restarted.
+
+        :return: Seconds until the next subscription goes stale, None without streamed subscriptions
+        :rtype: float or None
+        """
+        now = self.clock.now_ns()
+        next_deadline: Optional[int] = None
+        for subscription in list(self.subscriptions.values()):
+            if not subscription.pushed or not subscription.active:
+                continue
+            if subscription.deadline_ns() <= now:
+                logger.debug(f"Renewing stale {subscription}")
+                subscription.resubscribes += 1
+                self._send_subscribe(subscription)
+            deadline = subscription.deadline_ns()
+            if next_deadline is None or deadline < next_deadline:
+                next_deadline = deadline
+        return self._wait_s(next_deadline)
 
-            # Sleep the thread
-            sleep(0.0001)  # 0.1ms
+    def _process_transfers(self) -> Optional[float]:
+        """Process Transfers
+        Sends the chunks of large shares again that were not answered in time.
 
-    def _process_scheduled_messages(self) -> None:
+        :return: Seconds until the next chunk times out, None without chunks in flight
+        :rtype: float or None
+        """
+        now = self.clock.now_ns()
+        next_deadline: Optional[int] = None
+        for transfer in list(self.transfers):
+            expired = transfer.expire(now)
+            for token in expired:
+                self.pending_chunks.pop((transfer.device_id, token), None)
+            if len(expired) > 0:
+                self._send_chunks(transfer)
+            deadline = transfer.next_deadline()
+            if deadline is not None and (next_deadline is None or deadline < next_deadline):
+                next_deadline = deadline
+        return self._wait_s(next_deadline)
+
+    def _process_scheduled_messages(self) -> Optional[float]:
         """Process Scheduled Messages
-        Loop through the schedules and determine if the process time
-        has elapsed the interval time.
+        Requests the shares of the schedules that are due.
+
+        :return: Seconds until the next schedule is due, None without schedules
+        :rtype: float or None
+        """
+        for schedule in self.scheduler.pop_due():
+            self._request_scheduled_message(schedule)
+        return self._wait_s(self.scheduler.next_deadline())
+
+    def _request_scheduled_message(self, schedule: ScheduledRequest) -> None:
+        """Requests the share of a schedule from its prebuilt template, only the token changes
+        between polls.
+
+        :param schedule: A due schedule
+        :type schedule: ScheduledRequest
         """
-        for schedule in self.scheduled:
-            if diff_ms(datetime.now(), schedule.last_scheduled) > schedule.interval_ms:
-                self.request_message(schedule.device_id, schedule.message_type, schedule.share_id)
-                logger.debug(f"Processing schedule {schedule.share_id} {schedule.interval_ms}")
-                schedule.tick()
+        window = self.get_window(schedule.device_id)
+        if window is None:
+            return
+        compact = self._compact_requests(schedule.device_id)
+        if schedule.template is None or schedule.template_compact != compact:
+            schedule.template = RequestTemplate(self._request_bytes(schedule.device_id, schedule.message_type, schedule.share_id, 1))
+            schedule.template_compact = compact
+        token = self.tokens.next()
+        if not self.transactions.add(RequestRecord(token, schedule.device_id, self.clock.now_ns())):
+            logger.debug(f"Transaction table full, dropped request {token}")
+            return
+        # Polls of a share supersede each other while waiting for room in the window
+        key: Optional[Hashable] = None
+        if self.drop_superseded_polls:
+            key = (schedule.message_type, schedule.share_id)
+        self._send_request(schedule.device_id, window, token, schedule.template.render(token), MessagePriority.POLL, key)
 
-    def set_scheduled_message(self, device_id: str, message_type: MessageType, shareId: int, interval_ms: int = 100) -> None:
+    def _wait_s(self, deadline_ns: Optional[int]) -> Optional[float]:
+        # Seconds until a clock deadline
+        if deadline_ns is None:
+            return None
+        return max(ns_to_s(deadline_ns - self.clock.now_ns()), 0)
+
+    def set_scheduled_message(self, device_id: str, message_type: MessageType, shareId: int, interval_ms: int = 100, jitter_ms: int = 0) -> None:
         """Set Schedule Message
+        Requests are sent on fixed deadlines, staggered against the device's other schedules.
 
         :param device_id: A Comms device id
         :type device_id: str
@@ -150,24 +290,23 @@ class API(threading.Thread):
         :type device_id: int
         :param interval_ms: The scheduled interval time
         :type device_id: float
+        :param jitter_ms: Upper bound of the random delay added to each request
+        :type jitter_ms: int
         """
-        # Check if schedule already exists
-        schedule = next(filter(lambda schedule: schedule.share_id == shareId and schedule.device_id ==
-                        device_id and schedule.message_type == message_type, self.scheduled), None)
         # Create or modify the schedule
-        if schedule is None:
-            # Create new schedule
-            schedule = ScheduledRequest()
-            schedule.device_id = device_id
-            schedule.message_type = message_type
-            schedule.share_id = shareId
-            schedule.interval_ms = interval_ms
-            self.scheduled.append(schedule)
-            logger.debug(f"Added schedule {shareId} {interval_ms}")
-        else:
-            # Update the schedule
-            schedule.update_interval(interval_ms)
-            logger.debug(f"Updated schedule {shareId} {interval_ms}")
+        self.scheduler.set(device_id, message_type, shareId, interval_ms, jitter_ms)
+        self.wakeup_event.set()
+
+    def get_schedule_stats(self, device_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get Schedule Stats
+        The requested and achieved request rate of each schedule.
+
+        :param device_id: A Comms device id, None for the schedules of all devices
+        :type device_id: str or None
+        :return: Rates in Hz and fired and missed counts per schedule
+        :rtype: List[Dict[str, Any]]
+        """
+        return self.scheduler.stats(device_id)
 
     def clear_scheduled_message(self, device_id: str, message_type: MessageType, shareId: int) -> None:
         """Clear Scheduled Message
@@ -177,11 +316,7 @@ class API(threading.Thread):
         :param shareId: A share id
         :type device_id: int
         """
-        schedule = next(filter(lambda schedule: schedule.share_id == shareId and schedule.device_id ==
-                        device_id and schedule.message_type == message_type, self.scheduled), None)
-        if schedule is not None:
-            self.scheduled.remove(schedule)
-            logger.debug(f"Removed schedule {shareId}")
+        self.scheduler.clear(device_id, message_type, shareId)
 
     def clear_all_schedules(self, device_id: str) -> None:
         """Clear All Schedules
@@ -190,10 +325,105 @@ class API(threading.Thread):
         :param device_id: A Comms device id
         :type device_id: str
         """
-        schedules = list(filter(lambda schedule: schedule.device_id == device_id, self.scheduled))
-        if schedules is not None:
-            for schedule in schedules:
-                self.scheduled.remove(schedule)
+        self.scheduler.clear_device(device_id)
+
+    def subscribe(self, device_id: str, shareId: int, interval_ms: int = 100) -> bool:
+        """Subscribe
+        The device streams the share at the interval, each notification is passed to the
+        callbacks as a share response. Devices without the SUBSCRIPTIONS capability are polled at
+        the interval instead, replacing a schedule of the share. Subscribing again changes the
+        interval. The subscription outlives a disconnect and is sent again once the device
+        reconnects, until unsubscribed.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param shareId: A share id
+        :type shareId: int
+        :param interval_ms: The interval of the notifications
+        :type interval_ms: int
+        :raises ValueError: If the interval is not positive
+        :return: False if the device is not connected
+        :rtype: bool
+        """
+        if interval_ms <= 0:
+            raise ValueError(f"Expected a positive interval got {interval_ms}")
+        if not self.check_device(device_id):
+            return False
+        subscription = self.subscriptions.get((device_id, shareId))
+        if subscription is None:
+            subscription = self.subscriptions.setdefault((device_id, shareId), Subscription(device_id, shareId, interval_ms, self.clock.now_ns()))
+        subscription.interval_ms = interval_ms
+        self._activate_subscription(subscription)
+        return True
+
+    def unsubscribe(self, device_id: str, shareId: int) -> bool:
+        """Unsubscribe
+        Stops the notifications or polls of a subscribed share.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param shareId: A share id
+        :type shareId: int
+        :return: True if the share was subscribed
+        :rtype: bool
+        """
+        subscription = self.subscriptions.pop((device_id, shareId), None)
+        if subscription is None:
+            return False
+        if subscription.pushed:
+            device = self.get_device(device_id)
+            if device is not None:
+                # Not answered, sent ahead of requests like a publish
+                device.send_message(self._subscription_message(TransactionAction.SHARE_UNSUBSCRIBE, shareId, self.tokens.next()),
+                                    MessagePriority.PUBLISH)
+        else:
+            self.scheduler.clear(device_id, MessageType.SHARE, shareId)
+        return True
+
+    def get_subscription_stats(self, device_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get Subscription Stats
+        Whether each subscription is streamed or polled, with its received, lost and duplicate
+        notification counts.
+
+        :param device_id: A Comms device id, None for the subscriptions of all devices
+        :type device_id: str or None
+        :return: The counters per subscription
+        :rtype: List[Dict[str, Any]]
+        """
+        return [subscription.to_dict() for subscription in list(self.subscriptions.values())
+                if device_id is None or subscription.device_id == device_id]
+
+    def _activate_subscription(self, subscription: Subscription) -> None:
+        # Stream the share from devices that support it, otherwise poll it
+        subscription.active = True
+        if self.has_capability(subscription.device_id, Capability.SUBSCRIPTIONS):
+            if not subscription.pushed:
+                self.scheduler.clear(subscription.device_id, MessageType.SHARE, subscription.share_id)
+                subscription.pushed = True
+            self._send_subscribe(subscription)
+        else:
+            subscription.pushed = False
+            self.set_scheduled_message(subscription.device_id, MessageType.SHARE, subscription.share_id, subscription.interval_ms)
+
+    def _send_subscribe(self, subscription: Subscription) -> None:
+        # The device answers with the share, then starts a new sequence of notifications
+        subscription.subscribe(self.clock.now_ns())
+        window = self.get_window(subscription.device_id)
+        if window is None:
+            return
+        token = self.tokens.next()
+        if not self.transactions.add(RequestRecord(token, subscription.device_id, self.clock.now_ns())):
+            logger.debug(f"Transaction table full, dropped subscription {token}")
+            return
+        self._send_request(subscription.device_id, window, token,
+                           self._subscription_message(TransactionAction.SHARE_SUBSCRIBE, subscription.share_id, token, subscription.interval_ms))
+
+    def _deactivate_subscriptions(self, device_id: str) -> None:
+        # Kept to be sent again once the device reconnects, the polls are cleared with the schedules
+        # A snapshot, the reader threads add and remove subscriptions meanwhile
+        for subscription in list(self.subscriptions.values()):
+            if subscription.device_id == device_id:
+                subscription.active = False
 
     def get_devices(self) -> List[str]:
         """Returns a list of Programmor compatible device ids.
@@ -203,32 +433,146 @@ class API(threading.Thread):
         """
         return self.comms_manager.get_devices()
 
-    def get_devices_detailed(self) -> List[Dict[str, Any]]:
+    def get_devices_detailed(self, max_age_ms: int = 0, timeout_s: float = PROBE_TIMEOUT_S,
+                             on_device: Optional[Callable[[Dict[str, Any]], None]] = None, refresh: bool = False) -> List[Dict[str, Any]]:
         """Get Devices Detailed
+        Devices with a known identity are listed from the identity cache, unless refreshed. The
+        Common1 of the other devices is read from all of them at the same time, devices that are
+        not connected are connected for the read. Devices that do not answer before the deadline
+        are left out.
+
+        :param max_age_ms: Age in milliseconds of the oldest Common1 accepted from the share cache for the devices read, 0 to read them
+        :type max_age_ms: int
+        :param timeout_s: Time in seconds for all devices to answer
+        :type timeout_s: float
+        :param on_device: Called with each device as soon as it answered, from the thread that read it
+        :type on_device: Callable[[Dict[str, Any]], None] or None
+        :param refresh: Read every device instead of listing known identities, with a max_age_ms of 0 this reads a fresh Common1
+        :type refresh: bool
+        :return: The devices that answered, in the order of get_devices
+        :rtype: List[Dict[str, Any]]
         """
         device_ids = self.get_devices()
-        devices = list()
-        # Request the common 1 message for each device
+        # Unplugged devices are read again when they return
+        self.identities.retain(device_ids)
+        deadline_s = perf_counter() + timeout_s
+        answered: Dict[str, Dict[str, Any]] = dict()
+        lock = threading.Lock()
+        finished = [False]
+        unknown = list()
         for device_id in device_ids:
+            if refresh:
+                unknown.append(device_id)
+                continue
+            identity = self.identities.get(device_id, self.comms_manager.get_device_instance(device_id))
+            if identity is None:
+                unknown.append(device_id)
+                continue
+            answered[device_id] = self._device_detailed(device_id, self.check_device(device_id), transaction_pb2.Common1.FromString(identity))  # type: ignore
+            if on_device is not None:
+                on_device(answered[device_id])
+        if len(unknown) == 0:
+            return [answered[device_id] for device_id in device_ids]
+
+        # Devices connected for the read, disconnected by whoever finishes with them first
+        connected: Set[str] = set()
+        requests: List[Future[bytes]] = list()
+
+        def claim(device_id: str) -> bool:
+            with lock:
+                connected.add(device_id)
+                return not finished[0]
+
+        def track(future: Future[bytes]) -> bool:
+            with lock:
+                requests.append(future)
+                return not finished[0]
+
+        def probe(device_id: str) -> None:
             device_online = self.check_device(device_id)
-            if not device_online:
-                self.connect_device(device_id)
-            common = transaction_pb2.Common1()  # type: ignore
             try:
-                common.ParseFromString(self.request_message_sync(device_id, MessageType.COMMON, 1))
-            except BaseException as e:
-                print(f"Failed to parse common message: {e}")
-                continue
-            device = {
-                "deviceId": device_id,
-                "connected": device_online,
-                "common1": MessageToJson(common)
-            }
-            devices.append(device)
-            if not device_online:
-                self.disconnect_device(device_id)
+                device = self._probe_device(device_id, device_online, max_age_ms, deadline_s, claim, track)
+                with lock:
+                    # Devices answering after the deadline are not reported
+                    if device is None or finished[0]:
+                        return
+                    answered[device_id] = device
+                if on_device is not None:
+                    on_device(device)
+            finally:
+                # Devices connected for the read are disconnected once reported, unless the deadline already did
+                with lock:
+                    release = device_id in connected
+                    connected.discard(device_id)
+                if release:
+                    self.disconnect_device(device_id)
+
+        executor = ThreadPoolExecutor(max_workers=len(unknown), thread_name_prefix="probe")
+        probes = [executor.submit(probe, device_id) for device_id in unknown]
+        wait(probes, timeout=max(deadline_s - perf_counter(), 0))
+        executor.shutdown(wait=False)
+        with lock:
+            finished[0] = True
+            # Late probes stop waiting and leave the devices alone, a caller may connect them as soon as this returns
+            for future in requests:
+                future.cancel()
+            late = list(connected)
+            connected.clear()
+            devices = [answered[device_id] for device_id in device_ids if device_id in answered]
+        for device_id in late:
+            self.disconnect_device(device_id)
         return devices
 
+    def _probe_device(self, device_id: str, device_online: bool, max_age_ms: int, deadline_s: float,
+                      claim: Callable[[str], bool], track: Callable[[Future[bytes]], bool]) -> Optional[Dict[str, Any]]:
+        """Reads the Common1 of a device, connecting it for the read if it is not connected.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param device_online: Whether the device was connected before the read
+        :type device_online: bool
+        :param max_age_ms: Age in milliseconds of the oldest Common1 accepted from the cache
+        :type max_age_ms: int
+        :param deadline_s: perf_counter time by which the device has to answer
+        :type deadline_s: float
+        :param claim: Called with the device once connected for the read, False if the listing is over
+        :type claim: Callable[[str], bool]
+        :param track: Called with the request so the listing can cancel it, False if the listing is over
+        :type track: Callable[[Future[bytes]], bool]
+        :return: The device id, whether it was connected and its Common1 as json, None if it did not answer
+        :rtype: Dict[str, Any] or None
+        """
+        common = transaction_pb2.Common1()  # type: ignore
+        cached = self._cached(device_id, MessageType.COMMON, 1, max_age_ms)
+        if cached is not None:
+            common.ParseFromString(cached)
+        else:
+            if not device_online and (not self.connect_device(device_id) or not claim(device_id)):
+                return None
+            future = self.request_message_future(device_id, MessageType.COMMON, 1)
+            if future is None:
+                return None
+            try:
+                if not track(future):
+                    return None
+                data = future.result(max(deadline_s - perf_counter(), 0))
+                common.ParseFromString(data)
+                self._on_common(device_id, common)
+            except BaseException as e:
+                logger.debug(f"Failed to parse common message: {e}")
+                return None
+            finally:
+                future.cancel()
+        return self._device_detailed(device_id, device_online, common)
+
+    @staticmethod
+    def _device_detailed(device_id: str, device_online: bool, common: transaction_pb2.Common1) -> Dict[str, Any]:  # type: ignore
+        return {
+            "deviceId": device_id,
+            "connected": device_online,
+            "common1": MessageToJson(common)
+        }
+
     def get_device(self, device_id: str) -> Optional[Comm]:
         """Gets a connected Comms device by id, returns None if the device is not connected.
 
@@ -250,14 +594,23 @@ class API(threading.Thread):
         return self.comms_manager.check_device(device_id)
 
     def connect_device(self, device_id: str) -> bool:
-        """Connects to a Programmor compatible Comms device.
+        """Connects to a Programmor compatible Comms device, then reads the device's Common1 to
+        learn its capabilities. Requests use the full encoding and subscriptions are polled until it
+        answers.
 
         :param device_id: A Comm's device id
         :type device_id: str
         :return: Status
         :rtype: bool
         """
-        return self.comms_manager.connect_device(device_id, self._on_receive)
+        if not self.comms_manager.connect_device(device_id, self._on_receive):
+            return False
+        # The identity is read again on every connect
+        self.identities.invalidate(device_id)
+        future = self.request_message_future(device_id, MessageType.COMMON, 1)
+        if future is not None:
+            future.add_done_callback(lambda done: self._on_common_response(device_id, done))
+        return True
 
     def disconnect_device(self, device_id: str) -> bool:
         """Disconnects a Comms device.
@@ -267,44 +620,215 @@ class API(threading.Thread):
         :return: Status
         :rtype: bool
         """
-        # Clear all schedules with this device
+        # Clear all schedules and requests with this device, subscriptions wait for a reconnect
         self.clear_all_schedules(device_id)
+        self._deactivate_subscriptions(device_id)
+        self._clear_device_requests(device_id)
         return self.comms_manager.disconnect_device(device_id)
 
     def disconnect_all_devices(self) -> None:
         """Disconnects all devices from the adapter
         """
-        # Clear all schedules with this device
+        # Clear all schedules and requests with this device, subscriptions wait for a reconnect
         for device_id in self.get_devices():
             self.clear_all_schedules(device_id)
+            self._deactivate_subscriptions(device_id)
+            self._clear_device_requests(device_id)
         self.comms_manager.disconnect_all_devices()
 
-    def request_message(self, device_id: str, message_type: MessageType, shareId: int) -> None:
+    def get_capabilities(self, device_id: str) -> Capability:
+        """Gets the protocol capabilities a device advertised in its Common1.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :return: The capability flags, NO_CAPABILITIES until the device's Common1 has been read
+        :rtype: Capability
+        """
+        return self.capabilities.get(device_id, Capability.NO_CAPABILITIES)
+
+    def has_capability(self, device_id: str, capability: Capability) -> bool:
+        """Checks if a device advertised a protocol capability.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param capability: A capability flag
+        :type capability: Capability
+        :return: True if the device supports the capability
+        :rtype: bool
+        """
+        return bool(self.get_capabilities(device_id) & capability)
+
+    def _on_common_response(self, device_id: str, future: Future[bytes]) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        common = transaction_pb2.Common1()  # type: ignore
+        try:
+            common.ParseFromString(future.result())
+        except BaseException as e:
+            logger.debug(f"Failed to parse common message: {e}")
+            return
+        self._on_common(device_id, common)
+
+    def _on_common(self, device_id: str, common: transaction_pb2.Common1) -> None:  # type: ignore
+        # Keep the identity of the device
+        if self.identities.update(device_id, self.comms_manager.get_device_instance(device_id), common.firmwareVersion, common.SerializeToString()):
+            # Shares of the previous firmware may have changed
+            logger.info(f"Device {device_id} reports firmware version {common.firmwareVersion}")
+            self.cache.forget_device(device_id)
+        # Negotiate the protocol features of a connected device
+        if not self.check_device(device_id):
+            return
+        self.capabilities[device_id] = Capability(common.capabilities)
+        # Switch subscriptions made before the capabilities were known, or send them again after a reconnect or restart
+        for subscription in [subscription for subscription in list(self.subscriptions.values()) if subscription.device_id == device_id]:
+            self._activate_subscription(subscription)
+
+    def _compact_requests(self, device_id: str) -> bool:
+        return self.compact_requests and self.has_capability(device_id, Capability.COMPACT_REQUESTS)
+
+    def _clear_device_requests(self, device_id: str) -> None:
+        # Drop the requests, transactions, pending futures and capabilities of a device
+        self._clear_window(device_id)
+        self.transactions.clear_device(device_id)
+        # Snapshots, the reader threads resolve and remove entries meanwhile
+        for key in [key for key, _ in list(self.pending_requests.items()) if key[0] == device_id]:
+            future = self.pending_requests.pop(key, None)
+            if future is not None:
+                future.cancel()
+        for key in [key for key, _ in list(self.pending_batches.items()) if key[0] == device_id]:
+            batch = self.pending_batches.pop(key, None)
+            if batch is not None:
+                batch[0].future.cancel()
+        for transfer in [transfer for transfer in list(self.transfers) if transfer.device_id == device_id]:
+            transfer.fail(TransferError(f"Device {device_id} disconnected"))
+        self.capabilities.pop(device_id, None)
+
+    def get_window(self, device_id: str) -> Optional[RequestWindow]:
+        """Gets the request window of a connected device.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :return: The request window, None if the device is not connected
+        :rtype: RequestWindow or None
+        """
+        device = self.get_device(device_id)
+        if device is None:
+            return None
+        window = self.windows.get(device_id)
+        if window is None:
+            window = self.windows.setdefault(device_id, RequestWindow(device.send_message, depth=self.window_depth, clock=self.clock,
+                                                                      queue_capacity=self.window_queue_capacity))
+        return window
+
+    def _clear_window(self, device_id: str) -> None:
+        window = self.windows.pop(device_id, None)
+        if window is not None:
+            window.clear()
+
+    def get_queue_stats(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Gets the outgoing queue, request window and transaction table counters of a connected
+        device, including how long each priority class waited to be written.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :return: The counters, None if the device is not connected
+        :rtype: Dict[str, Any] or None
+        """
+        device = self.get_device(device_id)
+        window = self.get_window(device_id)
+        if device is None or window is None:
+            return None
+        return {"outgoing": device.messages_outgoing.stats(), "window": window.stats(), "window_queue": window.queued.stats(),
+                "transactions": self.transactions.stats(device_id).get(device_id)}
+
+    def get_transaction_stats(self, device_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Get Transaction Stats
+        Outstanding, completed, timed out, late and dropped transaction counts by device id.
+
+        :param device_id: A Comms device id, None for all devices
+        :type device_id: str or None
+        :return: The counters by device id
+        :rtype: Dict[str, Dict[str, int]]
+        """
+        return self.transactions.stats(device_id)
+
+    def _send_request(self, device_id: str, window: RequestWindow, token: int, request_message_bytes: OutgoingMessage,
+                      priority: MessagePriority = MessagePriority.REQUEST, key: Optional[Hashable] = None) -> None:
+        superseded = window.submit(token, request_message_bytes, priority, key)
+        if superseded is not None:
+            # The superseded or dropped request is never sent, nor answered
+            self.transactions.discard(device_id, superseded)
+            future = self.pending_requests.pop((device_id, superseded), None)
+            if future is not None:
+                future.cancel()
+            batch = self.pending_batches.pop((device_id, superseded), None)
+            if batch is not None:
+                batch[0].future.cancel()
+            logger.debug(f"Request {superseded} superseded or dropped by {token}")
+        # Wake the thread to time out the request
+        self.wakeup_event.set()
+
+    def request_message(self, device_id: str, message_type: MessageType, shareId: int,
+                        priority: MessagePriority = MessagePriority.REQUEST) -> None:
         """Request a Share from the Comms device
 
         :param device_id: A Comm's device id
         :type device_id: str
         :param shareId: A share id
         :type shareId: int
+        :param priority: Class of the request, scheduled polls use MessagePriority.POLL
+        :type priority: MessagePriority
         """
-        device = self.get_device(device_id)
-        if device is None:
+        window = self.get_window(device_id)
+        if window is None:
             return
-        # Request share from device
-        request_message = self._request_message(message_type, shareId)
         # Generate transaction record
-        record = RequestRecord()
-        record.id = request_message.token
-        record.device_id = device_id
-        record.sent_at = datetime.now()
-        self.transactions.append(record)
-        # Convert message to bytes
-        request_message_bytes = request_message.SerializeToString()
-        # Send data
-        device.send_message(request_message_bytes)
+        token = self.tokens.next()
+        record = RequestRecord(token, device_id, self.clock.now_ns())
+        if not self.transactions.add(record):
+            logger.debug(f"Transaction table full, dropped request {record.id}")
+            return
+        # Request share from device
+        request_message_bytes = self._request_bytes(device_id, message_type, shareId, token)
+        # Polls of a share supersede each other while waiting for room in the window
+        key: Optional[Hashable] = None
+        if priority == MessagePriority.POLL and self.drop_superseded_polls:
+            key = (message_type, shareId)
+        # Send data once there is room in the window
+        self._send_request(device_id, window, token, request_message_bytes, priority, key)
+
+    def request_message_future(self, device_id: str, message_type: MessageType, shareId: int) -> Optional[Future[bytes]]:
+        """Request a Share from the Comms device, the response is matched by its transaction token.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param shareId: A share id
+        :type shareId: int
+        :return: A future resolving to the response share, cancel it to stop waiting; None if the device is not connected
+        :rtype: Future[bytes] or None
+        """
+        window = self.get_window(device_id)
+        if window is None:
+            return None
+        # Request share from device, with a token that is not already pending
+        token = self.tokens.next()
+        while (device_id, token) in self.pending_requests:
+            token = self.tokens.next()
+        key = (device_id, token)
+        future: Future[bytes] = Future()
+        self.pending_requests[key] = future
+        # Forget the request once resolved, cancelled or timed out
+        future.add_done_callback(lambda _: self._forget_pending_request(key, future))
+        self._send_request(device_id, window, token, self._request_bytes(device_id, message_type, shareId, token))
+        return future
+
+    def _forget_pending_request(self, key: Tuple[str, int], future: Future[bytes]) -> None:
+        if self.pending_requests.get(key) is future:
+            self.pending_requests.pop(key, None)
 
-    def request_message_sync(self, device_id: str, message_type: MessageType, shareId: int, timeout_s: float = 1) -> bytes:
-        """Request a Share from the Comms device and wait for a response within the timeout.
+    def request_message_sync(self, device_id: str, message_type: MessageType, shareId: int, timeout_s: float = 1, max_age_ms: int = 0) -> bytes:
+        """Request a Share from the Comms device and wait for a response within the timeout. A share
+        received at most max_age_ms ago, such as by a scheduled poll, is returned without a request.
 
         :param device_id: A Comms device id
         :type device_id: str
@@ -312,23 +836,236 @@ class API(threading.Thread):
         :type shareId: int
         :param timeout_s: Waiting timeout in seconds
         :type timeout_s: float
+        :param max_age_ms: Age in milliseconds of the oldest share accepted from the cache, 0 to always request
+        :type max_age_ms: int
         :return: A response share
         :rtype: bytes
         """
-        device = self.get_device(device_id)
-        if device is None:
+        cached = self._cached(device_id, message_type, shareId, max_age_ms)
+        if cached is not None:
+            return cached
+        future = self.request_message_future(device_id, message_type, shareId)
+        if future is None:
             return bytes(0)
-        # Request share from device
-        request_message_bytes = self._request_message(message_type, shareId).SerializeToString()
-        response = transaction_pb2.TransactionMessage()  # type: ignore
         try:
-            response.ParseFromString(bytes(device.send_then_receive_message(request_message_bytes, timeout_s)[0:TRANSACTION_MESSAGE_SIZE]))
-        except BaseException:
+            return future.result(timeout_s)
+        except (FutureTimeoutError, CancelledError):
             return bytes(0)
-        return bytes(response.data[0:response.dataLength])
+        finally:
+            future.cancel()
+
+    def _cached(self, device_id: str, message_type: MessageType, shareId: int, max_age_ms: int) -> Optional[bytes]:
+        # The latest value of a share from the cache, if reads of it accept an age
+        if max_age_ms <= 0:
+            return None
+        return self.cache.get((device_id, message_type.value, shareId), max_age_ms, self.clock.now_ns())
+
+    def get_identity_stats(self) -> Dict[str, int]:
+        """Gets the counters of the device identity cache.
+
+        :return: Identities held, devices listed from the cache, devices read, identities invalidated and firmware changes seen
+        :rtype: Dict[str, int]
+        """
+        return self.identities.stats()
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """Gets the counters of the latest share cache.
+
+        :return: Values held, reads answered from the cache, reads sent to the device and values invalidated by publishes
+        :rtype: Dict[str, int]
+        """
+        return self.cache.stats()
+
+    def request_many(self, device_id: str, share_ids: List[int]) -> Optional[Future[Dict[int, bytes]]]:
+        """Request several Shares from the Comms device in one transaction. The device answers
+        each share under the token of the request. Devices without the BATCH_REQUESTS capability
+        are sent a request per share.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param share_ids: The share ids
+        :type share_ids: List[int]
+        :return: A future resolving to the response shares by share id, cancel it to stop waiting; None if the device is not connected
+        :rtype: Future[Dict[int, bytes]] or None
+        """
+        window = self.get_window(device_id)
+        if window is None:
+            return None
+        batch = BatchRequest(share_ids)
+        if not self.has_capability(device_id, Capability.BATCH_REQUESTS):
+            futures = [self.request_message_future(device_id, MessageType.SHARE, share_id) for share_id in batch.share_ids]
+            # Stop waiting on the remaining shares once the batch is resolved or cancelled
+            batch.future.add_done_callback(lambda _: self._cancel_futures(futures))
+            for share_id, future in zip(batch.share_ids, futures):
+                if future is None:
+                    batch.future.cancel()
+                    break
+                future.add_done_callback(partial(batch.add_future, share_id))
+            return batch.future
+        keys: List[Tuple[str, int]] = list()
+        for chunk in batch.chunks():
+            # A token that is not already pending
+            token = self.tokens.next()
+            while (device_id, token) in self.pending_batches:
+                token = self.tokens.next()
+            key = (device_id, token)
+            self.pending_batches[key] = (batch, chunk[-1])
+            keys.append(key)
+            self._send_request(device_id, window, token, self._batch_request_bytes(token, chunk))
+        # Forget the requests once resolved or cancelled
+        batch.future.add_done_callback(lambda _: self._forget_pending_batch(keys, batch))
+        return batch.future
+
+    @staticmethod
+    def _cancel_futures(futures: Iterable[Optional[Future[bytes]]]) -> None:
+        for future in futures:
+            if future is not None:
+                future.cancel()
+
+    def _forget_pending_batch(self, keys: List[Tuple[str, int]], batch: BatchRequest) -> None:
+        for key in keys:
+            pending = self.pending_batches.get(key)
+            if pending is not None and pending[0] is batch:
+                self.pending_batches.pop(key, None)
+
+    def _on_batch_response(self, device_id: str, response: Transaction, batch: BatchRequest, last_share_id: int) -> None:
+        batch.add(response.shareId, bytes(response.payload()))
+        # Shares are answered in the requested order, the last one completes the request
+        if response.shareId == last_share_id:
+            self._forget_pending_batch([(device_id, response.token)], batch)
+            window = self.windows.get(device_id)
+            if window is not None:
+                window.complete(response.token)
+
+    def read_share(self, device_id: str, shareId: int, progress: Optional[Callable[[Transfer], None]] = None) -> Optional[Transfer]:
+        """Read Share
+        Reads a share of any size from a device with the STREAMING capability, in chunks of
+        CHUNK_SIZE bytes with up to transfer_window chunks in flight.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param shareId: A share id
+        :type shareId: int
+        :param progress: Called with the transfer after each chunk, from the thread that received it
+        :type progress: Callable[[Transfer], None] or None
+        :return: The transfer, its future resolves to the share or fails with a TransferError; None if the device is not
+            connected or does not support streaming
+        :rtype: Transfer or None
+        """
+        transfer = Transfer(device_id, shareId, TransferDirection.READ, progress=progress, window=self.transfer_window,
+                            started_ns=self.clock.now_ns())
+        return transfer if self._start_transfer(transfer) else None
+
+    def write_share(self, device_id: str, shareId: int, data: bytes,
+                    progress: Optional[Callable[[Transfer], None]] = None) -> Optional[Transfer]:
+        """Write Share
+        Publishes a share of any size to a device with the STREAMING capability, in chunks of
+        CHUNK_SIZE bytes. Each chunk is acknowledged, the device applies the share once it has
+        every chunk.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param shareId: A share id
+        :type shareId: int
+        :param data: The share to publish to the device
+        :type data: bytes
+        :param progress: Called with the transfer after each chunk, from the thread that received it
+        :type progress: Callable[[Transfer], None] or None
+        :raises ValueError: If the data is larger than TRANSFER_MAX_SIZE
+        :return: The transfer, its future resolves to the data or fails with a TransferError; None if the device is not
+            connected or does not support streaming
+        :rtype: Transfer or None
+        """
+        transfer = Transfer(device_id, shareId, TransferDirection.WRITE, data, progress=progress, window=self.transfer_window,
+                            started_ns=self.clock.now_ns())
+        return transfer if self._start_transfer(transfer) else None
+
+    def resume_transfer(self, transfer: Transfer) -> bool:
+        """Resume Transfer
+        Continues a failed or cancelled transfer with the chunks that are missing, as after the
+        device reconnected. The transfer gets a new future.
+
+        :param transfer: A transfer returned by read_share or write_share
+        :type transfer: Transfer
+        :return: False if the transfer is still running or complete, or the device is not connected or does not support streaming
+        :rtype: bool
+        """
+        if not self._can_stream(transfer.device_id) or not transfer.resume(self.clock.now_ns()):
+            return False
+        return self._start_transfer(transfer)
+
+    def get_transfer_stats(self, device_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get Transfer Stats
+        Progress and throughput of the running transfers.
+
+        :param device_id: A Comms device id, None for the transfers of all devices
+        :type device_id: str or None
+        :return: The counters per transfer
+        :rtype: List[Dict[str, Any]]
+        """
+        now = self.clock.now_ns()
+        return [transfer.to_dict(now) for transfer in list(self.transfers) if device_id is None or transfer.device_id == device_id]
+
+    def _can_stream(self, device_id: str) -> bool:
+        if not self.has_capability(device_id, Capability.STREAMING):
+            logger.debug(f"Device {device_id} does not support streaming")
+            return False
+        return True
+
+    def _start_transfer(self, transfer: Transfer) -> bool:
+        if self.get_window(transfer.device_id) is None or not self._can_stream(transfer.device_id):
+            return False
+        self.transfers.add(transfer)
+        future = transfer.future
+        # Forget the chunks in flight once complete, failed or cancelled
+        future.add_done_callback(lambda _: self._forget_transfer(transfer, future))
+        self._send_chunks(transfer)
+        return True
+
+    def _forget_transfer(self, transfer: Transfer, future: Future[bytes]) -> None:
+        if transfer.future is not future:
+            return
+        self.transfers.discard(transfer)
+        for key in [key for key, pending in list(self.pending_chunks.items()) if pending is transfer]:
+            self.pending_chunks.pop(key, None)
+
+    def _next_chunk_token(self, device_id: str) -> int:
+        # A token that is not already pending
+        token = self.tokens.next()
+        while (device_id, token) in self.pending_chunks:
+            token = self.tokens.next()
+        return token
+
+    def _send_chunks(self, transfer: Transfer) -> None:
+        # Fill the transfer window, the chunks share the device's request window with other requests
+        window = self.get_window(transfer.device_id)
+        if window is None:
+            return
+        for token, offset in transfer.take(self.clock.now_ns(), self.transactions.timeout_ns,
+                                           partial(self._next_chunk_token, transfer.device_id)):
+            self.pending_chunks[(transfer.device_id, token)] = transfer
+            if transfer.direction == TransferDirection.READ:
+                message = self._chunk_message(TransactionAction.SHARE_CHUNK_REQUEST, transfer.share_id, token, offset, CHUNK_SIZE)
+            else:
+                message = self._chunk_message(TransactionAction.SHARE_CHUNK_PUBLISH, transfer.share_id, token, offset,
+                                              transfer.total or 0, transfer.chunk_data(offset))
+            self._send_request(transfer.device_id, window, token, message)
+
+    def _on_chunk_response(self, device_id: str, response: Transaction, transfer: Transfer) -> None:
+        window = self.windows.get(device_id)
+        if window is not None:
+            window.complete(response.token)
+        if transfer.receive(response.token, response.payload(), self.clock.now_ns()) and transfer.progress is not None:
+            try:
+                transfer.progress(transfer)
+            except Exception as e:
+                logger.debug("Progress callback failed to execute")
+                logger.debug(e)
+        self._send_chunks(transfer)
 
     def publish_message(self, device_id: str, message_type: MessageType, shareId: int, data: bytes) -> None:
-        """Publish a Share to the Comms device
+        """Publish a Share to the Comms device. Shares larger than DATA_MAX_SIZE are written in chunks
+        to devices with the STREAMING capability.
 
         :param device_id: A Comms device id
         :type device_id: str
@@ -341,32 +1078,113 @@ class API(threading.Thread):
         device = self.get_device(device_id)
         if device is None:
             return None
+        # The cached value is outdated by the write, as are the responses to requests sent before it
+        token = self.tokens.next()
+        self.cache.invalidate((device_id, message_type.value, shareId), token)
+        if len(data) > DATA_MAX_SIZE:
+            if message_type != MessageType.COMMON and self.has_capability(device_id, Capability.STREAMING):
+                self.write_share(device_id, shareId, data)
+            else:
+                logger.error(f"Share {shareId} of {len(data)} bytes exceeds {DATA_MAX_SIZE} bytes and device {device_id} does not support streaming")
+            return None
         # Generate publish message
-        publish_message = self._publish_message(message_type, shareId, data)
-        # Generate transaction record
-        record = RequestRecord()
-        record.id = publish_message.token
-        record.device_id = device_id
-        record.sent_at = datetime.now()
-        self.transactions.append(record)
-        logger.debug(record)
+        publish_message = self._publish_message(message_type, shareId, data, token)
+        # Publishes are not answered so no transaction is kept
+        logger.debug(f"Publishing share {shareId} to {device_id} with token {publish_message.token}")
         # Convert message to bytes
         publish_message_bytes = publish_message.SerializeToString()
-        # Send data
-        device.send_message(publish_message_bytes)
+        # Send data ahead of requests and polls
+        device.send_message(publish_message_bytes, MessagePriority.PUBLISH)
+
+    def _request_bytes(self, device_id: str, message_type: MessageType, shareId: int, token: int) -> bytes:
+        """A serialised Request Message in the encoding negotiated with the device.
+
+        :param token: The transaction token
+        :type token: int
+        :return: A compact request if the device supports it, otherwise a full request
+        :rtype: bytes
+        """
+        if self._compact_requests(device_id):
+            action = TransactionAction.COMMON_REQUEST if message_type == MessageType.COMMON else TransactionAction.SHARE_REQUEST
+            return encode_compact_request(token, action, shareId)
+        return bytes(self._request_message(message_type, shareId, token).SerializeToString())
+
+    @staticmethod
+    def _batch_request_bytes(token: int, share_ids: List[int]) -> bytes:
+        """A serialised Batch Request Message.
+
+        :param token: The transaction token, shared by the responses
+        :type token: int
+        :param share_ids: At most BATCH_MAX_SHARES share ids
+        :type share_ids: List[int]
+        :return: A transaction message
+        :rtype: bytes
+        """
+        batchMessage = transaction_pb2.TransactionMessage()  # type: ignore
+        batchMessage.token = token
+        batchMessage.action = transaction_pb2.TransactionMessage.SHARE_BATCH_REQUEST  # type: ignore
+        batchMessage.data = encode_share_ids(share_ids)
+        batchMessage.dataLength = len(batchMessage.data)
+        return bytes(batchMessage.SerializeToString())
+
+    @staticmethod
+    def _subscription_message(action: TransactionAction, shareId: int, token: int, interval_ms: int = 0) -> bytes:
+        """A serialised Subscribe or Unsubscribe Message.
+
+        :param action: SHARE_SUBSCRIBE or SHARE_UNSUBSCRIBE
+        :type action: TransactionAction
+        :param interval_ms: The interval of the notifications, only for SHARE_SUBSCRIBE
+        :type interval_ms: int
+        :return: A transaction message
+        :rtype: bytes
+        """
+        subscriptionMessage = transaction_pb2.TransactionMessage()  # type: ignore
+        subscriptionMessage.token = token
+        subscriptionMessage.action = int(action)
+        subscriptionMessage.shareId = shareId
+        if action == TransactionAction.SHARE_SUBSCRIBE:
+            subscriptionMessage.data = FIXED32_STRUCT.pack(interval_ms)
+            subscriptionMessage.dataLength = len(subscriptionMessage.data)
+        return bytes(subscriptionMessage.SerializeToString())
+
+    @staticmethod
+    def _chunk_message(action: TransactionAction, shareId: int, token: int, offset: int, size: int,
+                       chunk: Union[bytes, memoryview] = bytes(0)) -> bytes:
+        """A serialised Chunk Request or Chunk Publish Message.
+
+        :param action: SHARE_CHUNK_REQUEST or SHARE_CHUNK_PUBLISH
+        :type action: TransactionAction
+        :param offset: Offset of the chunk in the share
+        :type offset: int
+        :param size: The length of the requested chunk, or the total size of the published share
+        :type size: int
+        :param chunk: The bytes of a published chunk, at most CHUNK_SIZE
+        :type chunk: bytes or memoryview
+        :return: A transaction message
+        :rtype: bytes
+        """
+        chunkMessage = transaction_pb2.TransactionMessage()  # type: ignore
+        chunkMessage.token = token
+        chunkMessage.action = int(action)
+        chunkMessage.shareId = shareId
+        chunkMessage.data = CHUNK_HEADER_STRUCT.pack(offset, size) + bytes(chunk)
+        chunkMessage.dataLength = len(chunkMessage.data)
+        return bytes(chunkMessage.SerializeToString())
 
     # Private Request Message
     @staticmethod
-    def _request_message(message_type: MessageType, shareId: int) -> transaction_pb2.TransactionMessage:  # type: ignore
+    def _request_message(message_type: MessageType, shareId: int, token: Optional[int] = None) -> transaction_pb2.TransactionMessage:  # type: ignore
         """A Request Message
 
         :param shareId: A share id
         :type shareId: int
+        :param token: The transaction token, None for a random token
+        :type token: int or None
         :return: A transaction message
         :rtype: transaction_pb2.TransactionMessage
         """
         requestMessage = transaction_pb2.TransactionMessage()  # type: ignore
-        requestMessage.token = uuid4().int >> 96
+        requestMessage.token = uuid4().int >> 96 if token is None else token
         if message_type == MessageType.COMMON:
             requestMessage.action = transaction_pb2.TransactionMessage.COMMON_REQUEST  # type: ignore
         else:
@@ -377,16 +1195,19 @@ class API(threading.Thread):
         return requestMessage
 
     @staticmethod
-    def _publish_message(message_type: MessageType, shareId: int, data: Optional[bytes]) -> transaction_pb2.TransactionMessage:  # type: ignore
+    def _publish_message(message_type: MessageType, shareId: int, data: Optional[bytes],
+                         token: Optional[int] = None) -> transaction_pb2.TransactionMessage:  # type: ignore
         """A Publish Message
 
         :param shareId: A share id
         :type shareId: int
+        :param token: The transaction token, None for a random token
+        :type token: int or None
         :return: A transaction message
         :rtype: transaction_pb2.TransactionMessage
         """
         publishMessage = transaction_pb2.TransactionMessage()  # type: ignore
-        publishMessage.token = uuid4().int >> 96
+        publishMessage.token = uuid4().int >> 96 if token is None else token
         if message_type == MessageType.COMMON:
             publishMessage.action = transaction_pb2.TransactionMessage.COMMON_PUBLISH  # type: ignore
         else:
@@ -404,54 +1225,141 @@ class API(threading.Thread):
         return publishMessage
 
     def get_shares(self, device_id: str, to_time: datetime, from_time: datetime, shareId: int) -> List[bytes]:
-        """Get a range of shares from the database.
+        """Get a range of received shares from the history.
 
         :param device_id: A Comm's device id
         :type device_id: str
-        :param to_time: To datetime range
+        :param to_time: Start of the range
         :type to_time: datetime
-        :param from_time: From datetime range
+        :param from_time: End of the range, included
         :type datetime: datetime
         :param shareId: A share id
         :type shareId: int
+        :return: The data of the shares received in the range, oldest first, none without a history
+        :rtype: List[bytes]
+        """
+        if self.history is None:
+            return list()
+        return [data for _, data in self.history.query(device_id, shareId, datetime_to_ns(to_time), datetime_to_ns(from_time))]
+
+    def get_recent_shares(self, device_id: str, shareId: int, seconds: float, width: int = 0) -> List[Tuple[int, bytes]]:
+        """Get the shares received in the last seconds from memory, downsampled for a chart.
+
+        :param device_id: A Comm's device id
+        :type device_id: str
+        :param shareId: A share id
+        :type shareId: int
+        :param seconds: Length of the range up to now
+        :type seconds: float
+        :param width: Buckets of the range, such as the pixel width of the chart, 0 for every share
+        :type width: int
+        :return: The receive time in nanoseconds since the epoch and data of each share, oldest first
+        :rtype: List[Tuple[int, bytes]]
         """
-        item = Query()
-        items = self.db.search(item.device == device_id and item.shareId == shareId and item.receivedAt >= to_time and item.receivedAt <= from_time)
-        messages = list()
-        for i in items:
-            messages.append(i.data)
-        return messages
+        now_ns = time_ns()
+        return self.recent.query(device_id, shareId, now_ns - s_to_ns(seconds), now_ns, width)
 
-    def _on_receive(self, device_id: str, data: bytes) -> None:
+    def set_share_value(self, device_id: str, shareId: int, value: Optional[ShareValue]) -> None:
+        """Set the number recent shares are downsampled by, keeping the smallest and largest per bucket.
+
+        :param device_id: A Comm's device id
+        :type device_id: str
+        :param shareId: A share id
+        :type shareId: int
+        :param value: Called with the data of the share, None to keep the first share per bucket
+        :type value: Callable[[bytes], float] or None
+        """
+        self.recent.set_value(device_id, shareId, value)
+
+    def _on_receive(self, device_id: str, data: memoryview) -> None:
         """A Request Message as bytes
 
         :param device_id: A Comm's device id
         :type device_id: str
-        :param data: Return data from the device
-        :type data: bytes
+        :param data: Return data from the device, only valid for the duration of the call
+        :type data: memoryview
         """
-        response = transaction_pb2.TransactionMessage()  # type: ignore
         try:
-            response.ParseFromString(bytes(data[0:TRANSACTION_MESSAGE_SIZE]))
-        except BaseException:
+            response = decode_transaction(data[0:TRANSACTION_MESSAGE_SIZE])
+        except TransactionDecodeError:
             return
-        # Confirm the received data is in response to a transaction
-        filtered_transactions_list = filter(lambda record: record.id == response.token and record.device_id == device_id, self.transactions)
-        filtered_transactions = list(filtered_transactions_list)
-        if len(filtered_transactions) == 0:
+        # Keep the latest value and record every received share
+        if response.action == TransactionAction.COMMON_RESPONSE:
+            self.cache.update((device_id, MessageType.COMMON.value, response.shareId), response.payload(), self.clock.now_ns(), response.token)
+        elif response.action == TransactionAction.SHARE_RESPONSE or response.action == TransactionAction.SHARE_NOTIFY:
+            # The token of a notification is its sequence number
+            token = response.token if response.action == TransactionAction.SHARE_RESPONSE else None
+            self.cache.update((device_id, MessageType.SHARE.value, response.shareId), response.payload(), self.clock.now_ns(), token)
+            received_ns = time_ns()
+            try:
+                self.recent.append(device_id, response.shareId, response.payload(), received_ns)
+                if self.history is not None:
+                    self.history.append(device_id, response.shareId, response.payload(), received_ns)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not record share {response.shareId} of {device_id}: {e}")
+        # Shares streamed by a subscription carry a sequence number instead of a token
+        if response.action == TransactionAction.SHARE_NOTIFY:
+            self._on_notify(device_id, response)
+            return
+        # Chunks of a transfer are matched by their own token
+        if len(self.pending_chunks) > 0 and response.action == TransactionAction.SHARE_CHUNK_RESPONSE:
+            transfer = self.pending_chunks.pop((device_id, response.token), None)
+            if transfer is not None:
+                self._on_chunk_response(device_id, response, transfer)
+                return
+        # Responses to a batch request share its token
+        if len(self.pending_batches) > 0:
+            pending_batch = self.pending_batches.get((device_id, response.token))
+            if pending_batch is not None:
+                self._on_batch_response(device_id, response, *pending_batch)
+                return
+        # Release the next request waiting on the window
+        window = self.windows.get(device_id)
+        if window is not None:
+            window.complete(response.token)
+        # Resolve a pending request waiting on this token
+        pending = self.pending_requests.pop((device_id, response.token), None)
+        if pending is not None:
+            if pending.set_running_or_notify_cancel():
+                pending.set_result(bytes(response.payload()))
+            return
+        # Confirm the received data is in response to a transaction, late responses are still passed on
+        metadata = self.transactions.match(device_id, response.token)
+        if metadata is None:
             logger.debug("Could not match received data to a transaction record")
             return
-        # Update transaction, then remove
-        metadata: RequestRecord = filtered_transactions[0]
-        metadata.received_at = datetime.now()
         logger.debug(metadata)
-        self.transactions.remove(metadata)
-        # Save data to database
-        # self.db.insert({"id": metadata.id, "device": device_id, "action": response.action, "shareId": response.shareId ,
-        # "data": str(base64.b64encode(response.data)), "requestedAt": str(metadata.sent_at), "receivedAt": str(metadata.received_at)})
-        # Pass data to callback functions
-        responseData: bytes = response.data[0:response.dataLength]
-        responseJson: ResponseType = ResponseType(deviceId=device_id, actionType=response.action, shareId=int(
+        self._on_response(device_id, response.action, response)
+
+    def _on_notify(self, device_id: str, notification: Transaction) -> None:
+        """A Share streamed by a subscription
+
+        :param device_id: A Comm's device id
+        :type device_id: str
+        :param notification: The notification, its token is the sequence number
+        :type notification: Transaction
+        """
+        subscription = self.subscriptions.get((device_id, notification.shareId))
+        if subscription is None:
+            logger.debug(f"Notification of share {notification.shareId} without a subscription")
+            return
+        if not subscription.receive(notification.token, self.clock.now_ns()):
+            return
+        # Passed on like the response to a poll
+        self._on_response(device_id, TransactionAction.SHARE_RESPONSE, notification)
+
+    def _on_response(self, device_id: str, action: int, response: Transaction) -> None:
+        """Passes a received share to the callback functions.
+
+        :param device_id: A Comm's device id
+        :type device_id: str
+        :param action: The action reported to the callbacks
+        :type action: int
+        :param response: The received share
+        :type response: Transaction
+        """
+        responseData = response.payload()
+        responseJson: ResponseType = ResponseType(deviceId=device_id, actionType=action, shareId=int(
             response.shareId), data=str(base64.b64encode(responseData).decode("utf-8")))
         self._callback(responseJson)
 
@@ -0,0 +1,72 @@
+import threading
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Set
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Share ids that fit the data of a single SHARE_BATCH_REQUEST, as fixed32
+BATCH_MAX_SHARES = 20
+
+
+class BatchRequest:
+    """Batch Request
+    Collects the responses to a request for several shares. The future resolves to the shares
+    by id once every share has been answered, cancelling it stops the collection.
+    """
+
+    def __init__(self, share_ids: Iterable[int]) -> None:
+        """Constructor method
+
+        :param share_ids: The requested share ids, repeated ids are requested once
+        :type share_ids: Iterable[int]
+        """
+        self.share_ids: List[int] = list(dict.fromkeys(share_ids))
+        self.remaining: Set[int] = set(self.share_ids)
+        self.responses: Dict[int, bytes] = dict()
+        self.future: Future[Dict[int, bytes]] = Future()
+        self.lock = threading.Lock()
+        if len(self.remaining) == 0:
+            self.future.set_result(self.responses)
+
+    def chunks(self, size: int = BATCH_MAX_SHARES) -> List[List[int]]:
+        """The share ids split into requests of at most size shares.
+        """
+        return [self.share_ids[start:start + size] for start in range(0, len(self.share_ids), size)]
+
+    def add(self, share_id: int, data: bytes) -> bool:
+        """Adds the response of a share.
+
+        :param share_id: The share id of the response
+        :type share_id: int
+        :param data: The response share
+        :type data: bytes
+        :return: True if the share completed the batch
+        :rtype: bool
+        """
+        with self.lock:
+            if share_id not in self.remaining or self.future.done():
+                return False
+            self.remaining.discard(share_id)
+            self.responses[share_id] = data
+            if len(self.remaining) > 0:
+                return False
+        if not self.future.set_running_or_notify_cancel():
+            return False
+        self.future.set_result({share_id: self.responses[share_id] for share_id in self.share_ids})
+        return True
+
+    def add_future(self, share_id: int, future: Future[bytes]) -> None:
+        """Adds the response of a share requested on its own, a share that is not answered
+        cancels the batch.
+
+        :param share_id: The requested share id
+        :type share_id: int
+        :param future: The resolved request of the share
+        :type future: Future[bytes]
+        """
+        if future.cancelled() or future.exception() is not None:
+            self.future.cancel()
+            return
+        self.add(share_id, future.result())
@@ -0,0 +1,84 @@
+from time import perf_counter_ns
+
+NS_PER_S = 1_000_000_000
+NS_PER_MS = 1_000_000
+
+
+def s_to_ns(seconds: float) -> int:
+    return round(seconds * NS_PER_S)
+
+
+def ms_to_ns(milliseconds: float) -> int:
+    return round(milliseconds * NS_PER_MS)
+
+
+def ns_to_s(nanoseconds: int) -> float:
+    return nanoseconds / NS_PER_S
+
+
+class Clock:
+    """Monotonic Clock
+    The time source of the adapter's timers, in integer nanoseconds so timestamps are exact and
+    cheap to compare. Components take a clock so tests can replace it with a VirtualClock.
+    """
+
+    def now_ns(self) -> int:
+        """The current monotonic time.
+
+        :return: Time in nanoseconds from an arbitrary reference
+        :rtype: int
+        """
+        return perf_counter_ns()
+
+    def now_s(self) -> float:
+        """The current monotonic time in seconds.
+
+        :return: Time in seconds from an arbitrary reference
+        :rtype: float
+        """
+        return self.now_ns() / NS_PER_S
+
+
+class VirtualClock(Clock):
+    """Virtual Clock
+    A clock that only moves when told to, so timers can be tested over long simulated periods
+    without sleeping.
+    """
+
+    def __init__(self, start_s: float = 0) -> None:
+        self.time_ns: int = s_to_ns(start_s)
+
+    def now_ns(self) -> int:
+        return self.time_ns
+
+    def set(self, seconds: float) -> None:
+        """Moves the clock to a time.
+
+        :param seconds: Time in seconds, not before the current time
+        :type seconds: float
+        :raises ValueError: If the time is before the current time
+        """
+        self.set_ns(s_to_ns(seconds))
+
+    def advance(self, seconds: float) -> None:
+        """Moves the clock forward.
+
+        :param seconds: Time in seconds to move forward
+        :type seconds: float
+        """
+        self.set_ns(self.time_ns + s_to_ns(seconds))
+
+    def set_ns(self, time_ns: int) -> None:
+        """Moves the clock to a time in nanoseconds.
+
+        :param time_ns: Time in nanoseconds, not before the current time
+        :type time_ns: int
+        :raises ValueError: If the time is before the current time
+        """
+        if time_ns < self.time_ns:
+            raise ValueError(f"A monotonic clock can not go back from {self.time_ns}ns to {time_ns}ns")
+        self.time_ns = time_ns
+
+
+# Shared default clock
+MONOTONIC_CLOCK = Clock()
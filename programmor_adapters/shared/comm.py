@@ -1,37 +1,83 @@
 import threading
 import random
 from math import ceil
-from typing import Callable, Dict, List, Optional
-from queue import Queue
-from time import sleep, perf_counter
+from array import array
+from typing import Callable, Dict, List, Union
+from queue import Empty
 
-from shared.frame import Frame, ProcessState, FRAME_PAYLOAD_SIZE
+from shared.frame import Frame, FrameView, ProcessState, FRAME_PAYLOAD_SIZE, FRAME_SIZE, pack_frame_into  # noqa: F401
+from shared.multidrop import ADDRESS_NEXT_DEVICE, ADDRESS_PC, DROP_QUANTUM_FRAMES, DropComm
+from shared.queues import DropPolicy, MessagePriority, PriorityMessageQueue
+from shared.reassembly import Reassembler
+from shared.request_template import FramedMessage, OutgoingMessage
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Default amount of frames the receive buffer holds
+RECEIVE_BUFFER_FRAMES = 8
+# Default time a blocking read waits for data
+READ_TIMEOUT_MS = 10
+# Time to idle between reads of a transport that does not block
+IDLE_POLL_S = 0.001
+# Soft limit of frames gathered into one write
+WRITE_BATCH_FRAMES = 32
+# Maximum amount of queued outgoing messages
+OUTGOING_CAPACITY = 256
+
 
 # Comm base class.
 class Comm(threading.Thread):
     """Communication Interface
     To be extended to support Programmor communication methods, self contained class using
     python threading. Supports packeting data into Frames to receive & send to the device.
-    """
 
-    def __init__(self) -> None:
+    A Comm can also be the link to several devices on a local network, each attached by its
+    network address. The link then routes received frames by their source address and writes
+    the messages of the attached devices in turns, so no device can starve the others.
+    """
+    # Transports whose read waits up to read_timeout_ms for data should set this
+    blocking_read: bool = False
+    # Transports that can write several contiguous frames in one transfer should set this, they are
+    # given a view of the write buffer that is only valid for the duration of the write
+    batch_write: bool = False
+
+    def __init__(self, receive_buffer_frames: int = RECEIVE_BUFFER_FRAMES, outgoing_capacity: int = OUTGOING_CAPACITY,
+                 outgoing_policy: DropPolicy = DropPolicy.DROP_OLDEST) -> None:
         """Constructor method
+
+        :param receive_buffer_frames: The amount of frames a single read can return
+        :type receive_buffer_frames: int
+        :param outgoing_capacity: Maximum amount of queued outgoing messages, 0 for unbounded
+        :type outgoing_capacity: int
+        :param outgoing_policy: What to do with a message sent while the outgoing queue is full
+        :type outgoing_policy: DropPolicy
         """
         threading.Thread.__init__(self)
         self.stop_flag: bool = False
-        self.blocking: bool = False
-        # Message as bytes
-        self.messages_outgoing: Queue[bytes] = Queue()
-        # Map of FrameIds by Queue of Frames
-        self.inFrames: Dict[int, List[Frame]] = {}
-        self.outFrames: Dict[int, List[Frame]] = {}
+        self.stop_event: threading.Event = threading.Event()
+        # Messages by priority, the event is set when a message is queued
+        self.messages_outgoing: PriorityMessageQueue[OutgoingMessage] = PriorityMessageQueue(capacity=outgoing_capacity, policy=outgoing_policy)
+        self.outgoing_event: threading.Event = threading.Event()
+        # Reusable buffer the outgoing frames are packed into
+        self.write_batch_frames: int = WRITE_BATCH_FRAMES
+        self.write_buffer: bytearray = bytearray(FRAME_SIZE * WRITE_BATCH_FRAMES)
+        # Reusable receive buffer with a view for each frame it can hold
+        self.receive_buffer: array[int] = array("B", bytes(FRAME_SIZE * receive_buffer_frames))
+        receive_memory = memoryview(self.receive_buffer)
+        self.receive_views: List[FrameView] = [FrameView(receive_memory[i*FRAME_SIZE:(i+1)*FRAME_SIZE]) for i in range(receive_buffer_frames)]
+        # Joins received frames into messages
+        self.reassembler: Reassembler = Reassembler(self.on_message)
         # Received message callback
-        self.fn: Callable[[bytes], None] | None = None
+        self.fn: Callable[[memoryview], None] | None = None
         self.lastMessage: bytes = bytes()
+        self.read_timeout_ms: int = READ_TIMEOUT_MS
+        # Frames read beyond the receive buffer, processed on the next pass
+        self.unread: bytes = bytes()
+        # Devices reached through this link by network address, in round robin order
+        self.drops_lock: threading.Lock = threading.Lock()
+        self.drops: Dict[int, DropComm] = dict()
+        self.drop_cursor: int = 0
 
     def start(self) -> None:
         """Starts the thread
@@ -44,30 +90,42 @@ class Comm(threading.Thread):
         """
         logger.debug("Stopping Comms Thread")
         self.stop_flag = True
-        self.blocking = True
+        self.stop_event.set()
+        self.outgoing_event.set()
         self.close()
 
     def run(self) -> None:
         """Run method used by python threading
+        Incoming frames are read on this thread while outgoing messages are written from a
+        writer thread, both wait for work instead of polling.
         """
+        writer = threading.Thread(target=self.run_writer, name=f"{self.name}-writer")
+        writer.start()
         while True:
             # Stop thread
             if self.stop_flag:
                 logger.debug("Stopped Comms Thread")
                 break
 
-            # Skip if blocking
-            if self.blocking:
-                continue
+            # Process incoming messages, a blocking read waits for data up to the read timeout
+            if self.process_incoming_frames() == ProcessState.ERROR and not self.blocking_read:
+                # Idle until the transport may have data
+                self.stop_event.wait(IDLE_POLL_S)
 
-            # Process incoming messages
-            self.process_incoming_frames()
+        writer.join()
 
+    def run_writer(self) -> None:
+        """Writer loop, sleeps until a message is queued
+        """
+        while not self.stop_flag:
+            self.outgoing_event.wait()
+            self.outgoing_event.clear()
             # Process outgoing messages
-            self.process_outgoing_frames()
-
-            # Sleep the thread
-            sleep(0.0001)  # 0.1ms
+            try:
+                while not self.stop_flag and self.process_outgoing_frames() == ProcessState.OK:
+                    pass
+            except Exception as e:
+                logger.error(f"Failed to write to device: {e}")
 
     def process_incoming_frames(self) -> ProcessState:
         """Processes the incoming frames.
@@ -75,15 +133,30 @@ class Comm(threading.Thread):
         :return: State of the process
         :rtype: ProcessState
         """
-        # Read data
-        data = self.read()
-
-        if len(data) != 64:
+        # Read data into the receive buffer, transports may return several frames at once
+        length = self.read_into(self.receive_buffer)
+
+        if length == 0 or length % FRAME_SIZE != 0:
+            # Nothing received, drop frame sets that will not complete
+            self.reassembler.evict_stale()
+            for drop in list(self.drops.values()):
+                drop.reassembler.evict_stale()
             return ProcessState.ERROR
 
-        # Ok frame
-        frame = Frame()
-        frame.from_bytes(data)
+        state = ProcessState.ERROR
+        for index in range(length // FRAME_SIZE):
+            if self.process_incoming_frame(self.receive_views[index]) == ProcessState.OK:
+                state = ProcessState.OK
+        return state
+
+    def process_incoming_frame(self, frame: FrameView) -> ProcessState:
+        """Processes a single received frame.
+
+        :param frame: View of the received frame
+        :type frame: FrameView
+        :return: State of the process
+        :rtype: ProcessState
+        """
         # print(f"Received {frame}")
 
         # Check if crc is correct
@@ -95,132 +168,212 @@ class Comm(threading.Thread):
             return ProcessState.ERROR
 
         # Is this frame for PC.. 0x01?
-        if frame.destinationAddress != 0x01:
+        if frame.destinationAddress != ADDRESS_PC:
             return ProcessState.ERROR
 
-        # Get Queue of frames for the FrameId
-        frames: Optional[List[Frame]] = self.inFrames.get(frame.frameId)
-        if frames is None:
-            self.inFrames[frame.frameId] = list()
-            self.inFrames[frame.frameId].append(frame)
-        else:
-            # Push on new frame
-            frames.append(frame)
-
-        remove_frames: list[int] = list()
-
-        # Process a valid set of frames
-        for _, frames in self.inFrames.items():
-            # Check if we have a complete set
-            for frame in frames:
-                if frame.frameOrder != 1:
-                    continue
-                # Single frame
-                if frame.frameTotal == 1:
-                    # Callback
-                    remove_frames.append(frame.frameId)
-                    self.lastMessage = frame.payload
-                    if self.fn is not None:
-                        self.fn(frame.payload)
-                # Multiple frames
-                else:
-                    # Check if we have the remaining data..
-                    if len(frames) == frame.frameTotal:
-                        message_bytes: bytearray = bytearray()
-                        for order in range(frame.frameTotal):
-                            # frame = next(frame for frame in frames if frame.frameOrder == order)
-                            frames_filtered = filter(lambda x: x.frameOrder == order+1, frames)
-                            count = 0
-                            # Add payload to bytearray
-                            for f in frames_filtered:
-                                message_bytes.extend(f.payload)
-                                count = count+1
-                            # Could not find frame with order
-                            if count == 0:
-                                message_bytes.clear()
-                                break
-                        if len(message_bytes) > 0:
-                            # Callback
-                            remove_frames.append(frame.frameId)
-                            self.lastMessage = message_bytes
-                            if self.fn is not None:
-                                self.callback(message_bytes)
-
-        # Remove used frame sets
-        for setId in remove_frames:
-            _ = self.inFrames.pop(setId, None)
+        # Join the frame into its message, on a multi-drop link with the frames of the same device
+        reassembler = self.reassembler
+        if len(self.drops) > 0:
+            drop = self.drops.get(frame.sourceAddress)
+            if drop is None:
+                return ProcessState.ERROR
+            reassembler = drop.reassembler
+        if not reassembler.push(frame):
+            return ProcessState.ERROR
 
         return ProcessState.OK
 
+    def on_message(self, message: memoryview) -> None:
+        """Called with each complete message received from the device.
+
+        :param message: The message, only valid for the duration of the call
+        :type message: memoryview
+        """
+        self.lastMessage = message.tobytes()
+        self.callback(message)
+
     def process_outgoing_frames(self) -> ProcessState:
         """Processes the outgoing frames.
+        The frames of all queued messages, up to write_batch_frames, are gathered into one
+        buffer and written together.
 
         :return: State of the process
         :rtype: ProcessState
         """
-        # Check if we have data to send
-        if self.messages_outgoing.empty():
+        # Gather the frames of the queued messages
+        frame_count = 0
+        if len(self.drops) > 0:
+            frame_count = self.pack_drop_messages()
+        elif self.messages_outgoing.empty():
+            # Nothing to send
+            return ProcessState.ERROR
+        while frame_count < self.write_batch_frames:
+            try:
+                data = self.messages_outgoing.get_nowait()
+            except Empty:
+                break
+            frame_count = self.pack_message(data, frame_count)
+
+        if frame_count == 0:
             return ProcessState.ERROR
 
-        # The message to send
-        data = self.messages_outgoing.get()
+        # Write data, transports writing one frame at a time may keep the frames they are given
+        frames = memoryview(self.write_buffer)[0:frame_count*FRAME_SIZE]
+        self.write_frames(frames if self.batch_write else bytes(frames))
+
+        return ProcessState.OK
+
+    def pack_drop_messages(self) -> int:
+        """Packs the queued messages of the attached devices into the outgoing buffer, by deficit
+        round robin. Each turn a device with queued messages may write DROP_QUANTUM_FRAMES more
+        frames, so the devices share the link equally by frames whatever the size of their
+        messages. The next call continues with the device after the last one served.
+
+        :return: Index of the next free frame
+        :rtype: int
+        """
+        with self.drops_lock:
+            drops = list(self.drops.values())
+        frame_count = 0
+        while frame_count < self.write_batch_frames:
+            served = False
+            for _ in range(len(drops)):
+                drop = drops[self.drop_cursor % len(drops)]
+                self.drop_cursor += 1
+                if drop.messages_outgoing.empty():
+                    # Idle devices do not save up turns
+                    drop.deficit = 0
+                    continue
+                served = True
+                drop.deficit += DROP_QUANTUM_FRAMES
+                while drop.deficit > 0 and frame_count < self.write_batch_frames:
+                    try:
+                        data = drop.messages_outgoing.get_nowait()
+                    except Empty:
+                        break
+                    next_count = self.pack_message(data, frame_count, drop.address)
+                    drop.deficit -= next_count - frame_count
+                    drop.frames_written += next_count - frame_count
+                    frame_count = next_count
+                if frame_count >= self.write_batch_frames:
+                    break
+            if not served:
+                break
+        return frame_count
+
+    def pack_message(self, data: OutgoingMessage, frame_index: int, destination_address: int = ADDRESS_NEXT_DEVICE) -> int:
+        """Packs a message into frames in the outgoing buffer, a framed message is copied as it is.
+
+        :param data: The message to send
+        :type data: bytes or FramedMessage
+        :param frame_index: Index of the first free frame in the outgoing buffer
+        :type frame_index: int
+        :param destination_address: Network address of the device, the next device by default
+        :type destination_address: int
+        :return: Index of the next free frame
+        :rtype: int
+        """
+        if isinstance(data, FramedMessage) and destination_address != ADDRESS_NEXT_DEVICE:
+            # Prebuilt frames are addressed to the next device, frame the message again
+            data = data.message
+        if isinstance(data, FramedMessage):
+            # Already framed, the frames are copied as they are
+            start = frame_index * FRAME_SIZE
+            end = start + len(data.frames)
+            self.reserve_write_buffer(end)
+            self.write_buffer[start:end] = data.frames
+            return end // FRAME_SIZE
 
         # The amount of frames required to send the message
         required_frames = ceil(len(data)/FRAME_PAYLOAD_SIZE)
 
+        # Grow the buffer for large batches
+        self.reserve_write_buffer((frame_index + required_frames) * FRAME_SIZE)
+
         # frame id
         frameId = random.getrandbits(32)
 
         for i in range(0, required_frames):
-            # Frame i
-            frame = Frame()
-            frame.frameId = frameId
-            frame.frameTotal = required_frames
-            frame.frameOrder = i+1
-            payload = bytearray(data[i*FRAME_PAYLOAD_SIZE:(i+1)*FRAME_PAYLOAD_SIZE])
-            payload.extend(bytes(FRAME_PAYLOAD_SIZE-len(payload)))
-            frame.payload = payload
-            frame.checksum()
-            # print(f"Sending {frame}")
-            # Write data
-            frame_data = frame.to_bytes()
-            self.write(frame_data)
+            # Data frame from the PC to the device, the payload is zero padded when packed
+            pack_frame_into(self.write_buffer, (frame_index + i) * FRAME_SIZE, 0x01, destination_address, ADDRESS_PC, frameId,
+                            i+1, required_frames, data[i*FRAME_PAYLOAD_SIZE:(i+1)*FRAME_PAYLOAD_SIZE])
 
-        return ProcessState.OK
+        return frame_index + required_frames
 
-    def send_then_receive_message(self, message_bytes: bytes, wait_s: float = 0.5) -> bytes:
-        """Send a message then wait for a response.
+    def reserve_write_buffer(self, size: int) -> None:
+        """Grows the outgoing buffer to at least size bytes.
+        """
+        if len(self.write_buffer) < size:
+            self.write_buffer.extend(bytes(size - len(self.write_buffer)))
 
-        :param message_bytes: Data to send to the device
-        :type message_bytes: bytes
-        :param wait_s: Waiting timeout in seconds
-        :type wait_s: float
-        :return: Response from the device
-        :rtype: bytes
+    def write_frames(self, frames_data: Union[bytes, memoryview]) -> None:
+        """Writes a buffer of frames, as one write if the transport supports batching.
+
+        :param frames_data: Contiguous frames
+        :type frames_data: bytes or memoryview
         """
-        oldMessage = self.lastMessage
-        self.messages_outgoing.put(message_bytes)
-        startTime = perf_counter()
-        currentTime = perf_counter()
-        while ((currentTime - startTime) < wait_s):
-            # asyncio.sleep(0.001)
-            currentTime = perf_counter()
-            sleep(0.001)
-            if self.lastMessage != oldMessage:
-                logger.debug(f"Sent and received message in {currentTime-startTime}ms")
-                return self.lastMessage
-        return bytes(0)
-
-    def send_message(self, message_bytes: bytes) -> None:
+        if self.batch_write:
+            self.write(frames_data)
+            return
+        # One frame at a time
+        for offset in range(0, len(frames_data), FRAME_SIZE):
+            self.write(frames_data[offset:offset+FRAME_SIZE])
+
+    def send_message(self, message_bytes: OutgoingMessage, priority: MessagePriority = MessagePriority.REQUEST) -> None:
         """Send a message to the device.
 
-        :param message_bytes: Message to send as bytes
-        :type message_bytes: bytes
+        :param message_bytes: Message to send as bytes, or already framed
+        :type message_bytes: bytes or FramedMessage
+        :param priority: Class of the message, higher priority messages are sent first
+        :type priority: MessagePriority
         """
-        self.messages_outgoing.put(message_bytes)
-        # instead of a list, simply create the frames and write
-
-    def set_received_message_callback(self, fn: Callable[[bytes], None]) -> None:
+        self.messages_outgoing.put(message_bytes, priority)
+        self.outgoing_event.set()
+
+    def attach(self, address: int, outgoing_capacity: int = OUTGOING_CAPACITY,
+               outgoing_policy: DropPolicy = DropPolicy.DROP_OLDEST) -> DropComm:
+        """Attaches a device on the local network, making this a multi-drop link. From then on
+        received frames are routed by their source address and frames of unattached addresses
+        are dropped. Messages sent to the link itself are still written to the next device.
+
+        :param address: Network address of the device, 0x02-0x7F
+        :type address: int
+        :param outgoing_capacity: Maximum amount of queued outgoing messages of the device, 0 for unbounded
+        :type outgoing_capacity: int
+        :param outgoing_policy: What to do with a message sent while the device's outgoing queue is full
+        :type outgoing_policy: DropPolicy
+        :raises ValueError: If the address is not a device address or is already attached
+        :return: The device, it is used like a Comm of its own
+        :rtype: DropComm
+        """
+        drop = DropComm(address, self.outgoing_event.set, self._on_drop_stopped, outgoing_capacity, outgoing_policy)
+        with self.drops_lock:
+            if address in self.drops:
+                raise ValueError(f"Address {address:#04x} is already attached")
+            self.drops[address] = drop
+        logger.debug(f"Attached {drop}")
+        return drop
+
+    def detach(self, address: int) -> bool:
+        """Detaches a device from the link, its queued messages are dropped.
+
+        :param address: Network address of the device
+        :type address: int
+        :return: True if the device was attached
+        :rtype: bool
+        """
+        with self.drops_lock:
+            drop = self.drops.pop(address, None)
+        if drop is None:
+            return False
+        drop.close()
+        logger.debug(f"Detached {drop}")
+        return True
+
+    def _on_drop_stopped(self, drop: DropComm) -> None:
+        self.detach(drop.address)
+
+    def set_received_message_callback(self, fn: Callable[[memoryview], None]) -> None:
         """Set the callback function to be called when a new message
         has been received.
 
@@ -229,11 +382,11 @@ class Comm(threading.Thread):
         """
         self.fn = fn
 
-    def callback(self, message_bytes: bytes) -> None:
+    def callback(self, message_bytes: memoryview) -> None:
         """To be called on successful response from device.
 
-        :param message_bytes: Message to send as bytes
-        :type message_bytes: bytes
+        :param message_bytes: Received message, only valid for the duration of the call
+        :type message_bytes: memoryview
         """
         if self.fn is not None:
             self.fn(message_bytes)
@@ -254,7 +407,30 @@ class Comm(threading.Thread):
         """
         raise NotImplementedError("Read method not implemented")
 
-    def write(self, buffer: bytes) -> None:
+    def read_into(self, buffer: "array[int]") -> int:
+        """Reads data from the device into the receive buffer, transports that can read
+        straight into a buffer should override this to avoid the copy. Blocking transports
+        wait up to read_timeout_ms for data.
+
+        :param buffer: The receive buffer
+        :type buffer: array
+        :return: The amount of bytes read
+        :rtype: int
+        """
+        # Frames that did not fit into the buffer last time are taken before reading more, a copy is
+        # taken of a bytearray as the transport may still be filling it
+        data = self.unread if len(self.unread) > 0 else bytes(self.read())
+        self.unread = bytes()
+        if len(data) % FRAME_SIZE != 0:
+            return 0
+        length = min(len(data), len(buffer))
+        if length > 0:
+            memoryview(buffer)[0:length] = memoryview(data)[0:length]
+        if length < len(data):
+            self.unread = data[length:]
+        return length
+
+    def write(self, buffer: Union[bytes, memoryview]) -> None:
         """Writes data to the device.
 
         :return: 64 bytes to the device
@@ -1,5 +1,7 @@
-from typing import List, Dict, Callable, Optional
+import threading
+from typing import List, Dict, Callable, Hashable, Optional
 from shared.comm import Comm
+from shared.multidrop import DropComm
 
 # Logging
 import logging
@@ -20,10 +22,16 @@ class CommsManager:
     def get_device(self, device_id: str) -> Optional[Comm]:
         return self.connections.get(device_id, None)
 
+    def get_device_instance(self, device_id: str) -> Optional[Hashable]:
+        """Identifies the attachment of a device found by get_devices, such as its USB bus and
+        address, which changes when the device is plugged in again. None if it is not known.
+        """
+        return None
+
     def check_device(self, device_id: str) -> bool:
         return self.get_device(device_id) is not None
 
-    def connect_device(self, device_id: str, callback: Callable[[str, bytes], None]) -> bool:
+    def connect_device(self, device_id: str, callback: Callable[[str, memoryview], None]) -> bool:
         raise NotImplementedError("connect_device method not implemented")
 
     def disconnect_device(self, device_id: str) -> bool:
@@ -47,3 +55,60 @@ class CommsManager:
             device_ids.append(device_id)
         for device_id in device_ids:
             self.disconnect_device(device_id)
+
+
+class MultidropManager(CommsManager):
+
+    def __init__(self, link_factory: Callable[[], Comm], addresses: Dict[str, int]) -> None:
+        """MultidropManager
+        Manages the devices sharing one link, such as the ECUs behind a bus gateway, each
+        reached by its network address. The link is connected with the first device and
+        stopped with the last, so any amount of devices cost one Comm.
+
+        :param link_factory: Creates the Comm of the link, not yet started
+        :type link_factory: Callable[[], Comm]
+        :param addresses: Network addresses of the devices by device id
+        :type addresses: Dict[str, int]
+        """
+        super().__init__()
+        self.link_factory = link_factory
+        self.addresses: Dict[str, int] = dict(addresses)
+        self.link: Optional[Comm] = None
+        self.lock = threading.Lock()
+
+    def get_devices(self) -> List[str]:
+        return list(self.addresses.keys())
+
+    def connect_device(self, device_id: str, callback: Callable[[str, memoryview], None]) -> bool:
+        if self.check_device(device_id):
+            logger.debug(f"Device already connected {device_id}")
+            return False
+        address = self.addresses.get(device_id)
+        if address is None:
+            return False
+        with self.lock:
+            if self.link is None:
+                # Open the link with its first device
+                link = self.link_factory()
+                link.start()
+                if not link.connect():
+                    logger.debug(f"Failed to connect the link of device {device_id}")
+                    link.stop()
+                    return False
+                self.link = link
+            drop = self.link.attach(address)
+            drop.on_stop = self._on_drop_stopped
+            drop.set_received_message_callback(lambda data: callback(device_id, data))
+            self.connections[device_id] = drop  # type: ignore
+        logger.info(f"Connected to device {device_id} at address {address:#04x}")
+        return True
+
+    def _on_drop_stopped(self, drop: DropComm) -> None:
+        # Close the link with its last device
+        with self.lock:
+            if self.link is None:
+                return
+            self.link.detach(drop.address)
+            if len(self.link.drops) == 0:
+                self.link.stop()
+                self.link = None
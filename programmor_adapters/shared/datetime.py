@@ -1,6 +1,18 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 
+from shared.clock import NS_PER_S
+
+NS_PER_US = 1_000
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 
 def diff_ms(now: datetime, then: datetime, precision: Optional[int] = None) -> float:
     return round((now - then).total_seconds()*1000, precision)
+
+
+def datetime_to_ns(value: datetime) -> int:
+    """Nanoseconds since the epoch, like time.time_ns(). Naive datetimes are local time.
+    """
+    delta = (value if value.tzinfo is not None else value.astimezone()) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * NS_PER_S + delta.microseconds * NS_PER_US
@@ -0,0 +1,176 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from shared.clock import Clock, MONOTONIC_CLOCK, s_to_ns
+from shared.queues import DropPolicy, MessagePriority, PriorityMessageQueue
+from shared.request_template import OutgoingMessage
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Defaults
+WINDOW_DEPTH = 4
+WINDOW_MIN_DEPTH = 1
+WINDOW_MAX_DEPTH = 16
+WINDOW_TIMEOUT_S = 0.5
+# Requests waiting for room in the window, beyond it the queue's policy drops one
+WINDOW_QUEUE_CAPACITY = 256
+
+
+class RequestWindow:
+    """Request Window
+    A sliding window of outstanding transactions with a device. At most depth requests are
+    in flight, the next queued request is released when a response arrives or a request
+    times out. The depth grows by one after a full window of responses and halves on a
+    timeout, following the loss observed on the link. Queued requests are released by priority,
+    at most queue_capacity wait so a device that stopped answering does not pile them up.
+    """
+
+    def __init__(self, send: Callable[[OutgoingMessage, MessagePriority], None], depth: int = WINDOW_DEPTH, min_depth: int = WINDOW_MIN_DEPTH,
+                 max_depth: int = WINDOW_MAX_DEPTH, timeout_s: float = WINDOW_TIMEOUT_S, clock: Clock = MONOTONIC_CLOCK,
+                 queue_capacity: int = WINDOW_QUEUE_CAPACITY, queue_policy: DropPolicy = DropPolicy.DROP_OLDEST) -> None:
+        """Constructor method
+
+        :param send: Sends a message of a priority class to the device
+        :type send: Callable[[OutgoingMessage, MessagePriority], None]
+        :param depth: Initial amount of requests allowed in flight
+        :type depth: int
+        :param min_depth: Lower bound of the adapted depth
+        :type min_depth: int
+        :param max_depth: Upper bound of the adapted depth
+        :type max_depth: int
+        :param timeout_s: Time in seconds to wait on a response before the request is counted as lost
+        :type timeout_s: float
+        :param clock: Time source
+        :type clock: Clock
+        :param queue_capacity: Maximum amount of requests waiting for room in the window, 0 for unbounded
+        :type queue_capacity: int
+        :param queue_policy: What to do with a request submitted while the queue is full, DROP_OLDEST drops the oldest of the lowest class
+        :type queue_policy: DropPolicy
+        :raises ValueError: If the queue policy is BLOCK, room is only made by the responses the caller waits on
+        """
+        if queue_policy == DropPolicy.BLOCK:
+            raise ValueError("The request window queue can not block")
+        self.send = send
+        self.depth = depth
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.timeout_s = timeout_s
+        self.timeout_ns = s_to_ns(timeout_s)
+        self.clock = clock
+        self.lock = threading.Lock()
+        # Requests waiting for room in the window
+        self.queued: PriorityMessageQueue[Tuple[int, OutgoingMessage, MessagePriority]] = \
+            PriorityMessageQueue(clock=clock, capacity=queue_capacity, policy=queue_policy)
+        # Deadlines of the requests in flight by token, oldest first
+        self.in_flight: OrderedDict[int, int] = OrderedDict()
+        # Responses since the depth last changed
+        self.responses_at_depth: int = 0
+        # Counters
+        self.completed: int = 0
+        self.timeouts: int = 0
+
+    def submit(self, token: int, message_bytes: OutgoingMessage, priority: MessagePriority = MessagePriority.REQUEST,
+               key: Optional[Hashable] = None) -> Optional[int]:
+        """Queues a request, it is sent once there is room in the window.
+
+        :param token: The transaction token of the request
+        :type token: int
+        :param message_bytes: The request as bytes, or already framed
+        :type message_bytes: bytes or FramedMessage
+        :param priority: Class of the request
+        :type priority: MessagePriority
+        :param key: Identifies requests that supersede each other while queued, None to always queue
+        :type key: Hashable or None
+        :return: The token of the request that was replaced or dropped and is never sent, if any, this request's own token if it was dropped
+        :rtype: int or None
+        """
+        with self.lock:
+            superseded = self.queued.put((token, message_bytes, priority), priority, key)
+            self._release()
+            if superseded is None:
+                return None
+            return superseded[0]
+
+    def complete(self, token: int) -> bool:
+        """Marks a request as answered.
+
+        :param token: The transaction token of the response
+        :type token: int
+        :return: True if the token was in flight
+        :rtype: bool
+        """
+        with self.lock:
+            if self.in_flight.pop(token, None) is None:
+                return False
+            self.completed += 1
+            # Additive increase
+            self.responses_at_depth += 1
+            if self.responses_at_depth >= self.depth and self.depth < self.max_depth:
+                self.depth += 1
+                self.responses_at_depth = 0
+            self._release()
+            return True
+
+    def expire(self) -> int:
+        """Drops requests that have not been answered within the timeout.
+
+        :return: The amount of requests timed out
+        :rtype: int
+        """
+        with self.lock:
+            now = self.clock.now_ns()
+            count = 0
+            # Deadlines are in send order, so only the oldest need checking
+            while len(self.in_flight) > 0:
+                token, deadline = next(iter(self.in_flight.items()))
+                if deadline > now:
+                    break
+                del self.in_flight[token]
+                count += 1
+            if count > 0:
+                self.timeouts += count
+                # Multiplicative decrease
+                self.depth = max(self.min_depth, self.depth // 2)
+                self.responses_at_depth = 0
+                logger.debug(f"{count} requests timed out, window depth {self.depth}")
+                self._release()
+            return count
+
+    def next_deadline(self) -> Optional[int]:
+        """The deadline of the oldest request in flight.
+
+        :return: Clock time of the deadline in nanoseconds, None if nothing is in flight
+        :rtype: int or None
+        """
+        with self.lock:
+            if len(self.in_flight) == 0:
+                return None
+            return next(iter(self.in_flight.values()))
+
+    def clear(self) -> None:
+        """Drops all queued and in flight requests.
+        """
+        with self.lock:
+            self.queued.clear()
+            self.in_flight.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Window counters.
+
+        :return: Depth, in flight, queued, completed and timeout counts, and the queued requests dropped and superseded
+        :rtype: Dict[str, int]
+        """
+        with self.lock:
+            return {"depth": self.depth, "in_flight": len(self.in_flight), "queued": len(self.queued),
+                    "completed": self.completed, "timeouts": self.timeouts, "dropped": self.queued.dropped,
+                    "superseded": self.queued.superseded}
+
+    def _release(self) -> None:
+        # Send queued requests while there is room in the window
+        while len(self.queued) > 0 and len(self.in_flight) < self.depth:
+            token, message_bytes, priority = self.queued.get_nowait()
+            self.in_flight[token] = self.clock.now_ns() + self.timeout_ns
+            self.send(message_bytes, priority)
@@ -1,9 +1,20 @@
 import struct
-from typing import Optional
+from typing import Iterable, List, Optional
 import zlib
 from enum import Enum
 
+FRAME_SIZE = 64
 FRAME_PAYLOAD_SIZE = 50
+FRAME_CRC_OFFSET = 60
+
+# preamble, destinationAddress, sourceAddress, frameId, frameOrder, frameTotal, payload
+FRAME_BODY_STRUCT = struct.Struct(f"<HBBIBB{FRAME_PAYLOAD_SIZE}s")
+# Body followed by the crc
+FRAME_STRUCT = struct.Struct(f"<HBBIBB{FRAME_PAYLOAD_SIZE}sI")
+FRAME_CRC_STRUCT = struct.Struct("<I")
+FRAME_ID_STRUCT = struct.Struct("<I")
+FRAME_ID_OFFSET = 4
+FRAME_PAYLOAD_OFFSET = 10
 
 
 class BytesLengthError(Exception):
@@ -11,7 +22,7 @@ class BytesLengthError(Exception):
     """
 
     def __init__(self, length) -> None:
-        super().__init__(f"Expected a bytes size of 64 got {length}")
+        super().__init__(f"Expected a bytes size of {FRAME_SIZE} got {length}")
 
 
 class PayloadLengthError(Exception):
@@ -32,37 +43,45 @@ class ProcessState(Enum):
 class Frame:
     """Automotive Frame Protocol (AFP) Version 1.
     """
-    # Null = 0x00
-    # Data packet = 0x01
-    # Programmor Compatible Request = 0x02
-    # Programmor Compatible Response = 0x03
-    # ARP Request packet = 0x04
-    # ARP Response packet = 0x05
-    preamble: int = 0x01  # Data frame
-    # 0x00 = A catch all address, first receiving device to respond
-    # 0x01 = PC software Programmor.com
-    # 0x02 - 0x7F = A specific device on the local network
-    destinationAddress: int = 0x00  # Next device
-    # 0x00 = Reserved
-    # 0x01 = PC software Programmor.com
-    # 0x02 - 0x7F = A specific device on the local network
-    sourceAddress: int = 0x01  # From PC
-    frameId: int = 1
-    frameOrder: int = 1  # this frame's order
-    frameTotal: int = 1  # total amount of frames for the message
-    payload: bytes = bytes()  # size of 50 bytes
-    crc: int = 0  # check sum of the all the above variables
+    __slots__ = ("preamble", "destinationAddress", "sourceAddress", "frameId", "frameOrder", "frameTotal", "payload", "crc")
 
     def __init__(self, frame_bytes: Optional[bytes] = None) -> None:
+        # Null = 0x00
+        # Data packet = 0x01
+        # Programmor Compatible Request = 0x02
+        # Programmor Compatible Response = 0x03
+        # ARP Request packet = 0x04
+        # ARP Response packet = 0x05
+        self.preamble: int = 0x01  # Data frame
+        # 0x00 = A catch all address, first receiving device to respond
+        # 0x01 = PC software Programmor.com
+        # 0x02 - 0x7F = A specific device on the local network
+        self.destinationAddress: int = 0x00  # Next device
+        # 0x00 = Reserved
+        # 0x01 = PC software Programmor.com
+        # 0x02 - 0x7F = A specific device on the local network
+        self.sourceAddress: int = 0x01  # From PC
+        self.frameId: int = 1
+        self.frameOrder: int = 1  # this frame's order
+        self.frameTotal: int = 1  # total amount of frames for the message
+        self.payload: bytes = bytes()  # size of 50 bytes
+        self.crc: int = 0  # check sum of the all the above variables
         if frame_bytes is not None:
             self.from_bytes(frame_bytes)
 
-    def __bytes__(self) -> bytearray:
-        return self.to_bytes()
+    def __bytes__(self) -> bytes:
+        return bytes(self.to_bytes())
+
+    def _pack_body(self) -> bytes:
+        # Check if the payload is the correct size, struct pads shorter payloads with zeros
+        if len(self.payload) > FRAME_PAYLOAD_SIZE:
+            raise PayloadLengthError(len(self.payload))
+        return FRAME_BODY_STRUCT.pack(self.preamble, self.destinationAddress, self.sourceAddress,
+                                      self.frameId, self.frameOrder, self.frameTotal, self.payload)
 
     def calculate_crc(self) -> int:
         # Check sum the frame up to the crc
-        return zlib.crc32(self.to_bytes()[0:60]) & 0xffffffff
+        return zlib.crc32(self._pack_body()) & 0xffffffff
 
     def checksum(self) -> None:
         self.crc = self.calculate_crc()
@@ -73,41 +92,149 @@ class Frame:
 
     def __str__(self) -> str:
         return f"""Frame(preamble: {self.preamble} destinationAddress: {self.destinationAddress} sourceAddress: {self.sourceAddress}
-        id: {self.frameId} order: {self.frameOrder} total: {self.frameTotal} payload: {self.payload.hex('/')} crc: {self.crc})"""
+        id: {self.frameId} order: {self.frameOrder} total: {self.frameTotal} payload: {bytes(self.payload).hex('/')} crc: {self.crc})"""
 
-    def from_bytes(self, frame_bytes: bytes):
-        if len(frame_bytes) != 64:
+    def from_bytes(self, frame_bytes: bytes) -> None:
+        if len(frame_bytes) != FRAME_SIZE:
             raise BytesLengthError(len(frame_bytes))
         # Unpack
-        self.preamble = struct.unpack("<H", frame_bytes[0:2])[0]
-        self.destinationAddress = struct.unpack("<B", frame_bytes[2:3])[0]
-        self.sourceAddress = struct.unpack("<B", frame_bytes[3:4])[0]
-        self.frameId = struct.unpack("<I", frame_bytes[4:8])[0]
-        self.frameOrder = struct.unpack("<B", frame_bytes[8:9])[0]
-        self.frameTotal = struct.unpack("<B", frame_bytes[9:10])[0]
-        self.payload = frame_bytes[10:60]
-        self.crc = struct.unpack("<I", frame_bytes[60:64])[0]
+        (self.preamble, self.destinationAddress, self.sourceAddress, self.frameId,
+         self.frameOrder, self.frameTotal, self.payload, self.crc) = FRAME_STRUCT.unpack(frame_bytes)
 
     def to_bytes(self) -> bytearray:
-        # Pack
-        frame_bytes: bytearray = bytearray()
-        frame_bytes.extend(struct.pack("<H", self.preamble))
-        frame_bytes.extend(struct.pack("<B", self.destinationAddress))
-        frame_bytes.extend(struct.pack("<B", self.sourceAddress))
-        frame_bytes.extend(struct.pack("<I", self.frameId))
-        frame_bytes.extend(struct.pack("<B", self.frameOrder))
-        frame_bytes.extend(struct.pack("<B", self.frameTotal))
-        # Check if the payload is the correct size
-        if len(self.payload) > FRAME_PAYLOAD_SIZE:
-            raise PayloadLengthError(len(self.payload))
-        elif len(self.payload) < FRAME_PAYLOAD_SIZE:
-            # Pad out the payload to equal FRAME_PAYLOAD_SIZE
-            frame_bytes.extend(self.payload)
-            frame_bytes.extend(bytes(FRAME_PAYLOAD_SIZE-len(self.payload)))
-        else:
-            frame_bytes.extend(self.payload)
-        # Calculate checksum
-        self.crc = zlib.crc32(frame_bytes[0:60]) & 0xffffffff
-        frame_bytes.extend(struct.pack("<I", self.crc))
-        # Check if the
+        frame_bytes = bytearray(FRAME_SIZE)
+        self.pack_into(frame_bytes)
         return frame_bytes
+
+    def pack_into(self, buffer: bytearray, offset: int = 0) -> None:
+        """Packs the frame and its checksum into a buffer at the given offset.
+
+        :param buffer: Writable buffer with room for the frame
+        :type buffer: bytearray
+        :param offset: Byte offset of the frame within the buffer
+        :type offset: int
+        """
+        self.crc = pack_frame_into(buffer, offset, self.preamble, self.destinationAddress, self.sourceAddress,
+                                   self.frameId, self.frameOrder, self.frameTotal, self.payload)
+
+
+class FrameView:
+    """Read-only Automotive Frame Protocol (AFP) Version 1 frame over a buffer.
+    Fields are read straight from the buffer, so a view over a reusable receive buffer
+    can be inspected without copying. The payload is a memoryview into the buffer and
+    is only valid until the buffer is next written.
+    """
+    __slots__ = ("buffer", "body", "payload")
+
+    def __init__(self, buffer: memoryview) -> None:
+        if len(buffer) != FRAME_SIZE:
+            raise BytesLengthError(len(buffer))
+        # Slices are taken once so reading the view does not allocate
+        self.buffer: memoryview = buffer
+        self.body: memoryview = buffer[0:FRAME_CRC_OFFSET]
+        self.payload: memoryview = buffer[FRAME_PAYLOAD_OFFSET:FRAME_CRC_OFFSET]
+
+    @property
+    def preamble(self) -> int:
+        return self.buffer[0] | (self.buffer[1] << 8)
+
+    @property
+    def destinationAddress(self) -> int:
+        return self.buffer[2]
+
+    @property
+    def sourceAddress(self) -> int:
+        return self.buffer[3]
+
+    @property
+    def frameId(self) -> int:
+        return int(FRAME_ID_STRUCT.unpack_from(self.buffer, FRAME_ID_OFFSET)[0])
+
+    @property
+    def frameOrder(self) -> int:
+        return self.buffer[8]
+
+    @property
+    def frameTotal(self) -> int:
+        return self.buffer[9]
+
+    @property
+    def crc(self) -> int:
+        return int(FRAME_CRC_STRUCT.unpack_from(self.buffer, FRAME_CRC_OFFSET)[0])
+
+    def calculate_crc(self) -> int:
+        # Check sum the frame up to the crc
+        return zlib.crc32(self.body) & 0xffffffff
+
+    # Usually called after receiving data
+    def is_valid(self) -> bool:
+        return self.crc == self.calculate_crc()
+
+    def to_frame(self) -> Frame:
+        """Copies the view into an owned Frame.
+
+        :return: The frame
+        :rtype: Frame
+        """
+        return Frame(self.buffer.tobytes())
+
+    def __str__(self) -> str:
+        return f"""FrameView(preamble: {self.preamble} destinationAddress: {self.destinationAddress} sourceAddress: {self.sourceAddress}
+        id: {self.frameId} order: {self.frameOrder} total: {self.frameTotal} payload: {self.payload.hex('/')} crc: {self.crc})"""
+
+
+def pack_frame_into(buffer: bytearray, offset: int, preamble: int, destinationAddress: int, sourceAddress: int,
+                    frameId: int, frameOrder: int, frameTotal: int, payload: bytes) -> int:
+    """Packs a frame and its checksum into a buffer without creating a Frame.
+
+    :param buffer: Writable buffer with room for the frame
+    :type buffer: bytearray
+    :param offset: Byte offset of the frame within the buffer
+    :type offset: int
+    :param payload: Up to FRAME_PAYLOAD_SIZE bytes, zero padded when shorter
+    :type payload: bytes
+    :return: The frame's crc
+    :rtype: int
+    """
+    if len(payload) > FRAME_PAYLOAD_SIZE:
+        raise PayloadLengthError(len(payload))
+    FRAME_BODY_STRUCT.pack_into(buffer, offset, preamble, destinationAddress, sourceAddress, frameId, frameOrder, frameTotal, payload)
+    # Calculate checksum
+    crc = zlib.crc32(memoryview(buffer)[offset:offset + FRAME_CRC_OFFSET]) & 0xffffffff
+    FRAME_CRC_STRUCT.pack_into(buffer, offset + FRAME_CRC_OFFSET, crc)
+    return crc
+
+
+def encode_many(frames: Iterable[Frame]) -> bytearray:
+    """Encodes frames into one contiguous buffer, each frame occupies FRAME_SIZE bytes.
+
+    :param frames: Frames to encode in order
+    :type frames: Iterable[Frame]
+    :return: The encoded frames
+    :rtype: bytearray
+    """
+    frame_list = list(frames)
+    buffer = bytearray(FRAME_SIZE * len(frame_list))
+    for index, frame in enumerate(frame_list):
+        frame.pack_into(buffer, index * FRAME_SIZE)
+    return buffer
+
+
+def decode_many(buffer: bytes) -> List[Frame]:
+    """Decodes a contiguous buffer holding a whole number of frames.
+
+    :param buffer: Buffer of N * FRAME_SIZE bytes
+    :type buffer: bytes
+    :return: The decoded frames, crcs are not validated
+    :rtype: List[Frame]
+    """
+    if len(buffer) % FRAME_SIZE != 0:
+        raise BytesLengthError(len(buffer))
+    frames: List[Frame] = list()
+    for fields in FRAME_STRUCT.iter_unpack(buffer):
+        # Skip the constructor defaults, every slot is assigned below
+        frame = Frame.__new__(Frame)
+        (frame.preamble, frame.destinationAddress, frame.sourceAddress, frame.frameId,
+         frame.frameOrder, frame.frameTotal, frame.payload, frame.crc) = fields
+        frames.append(frame)
+    return frames
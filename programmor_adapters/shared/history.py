@@ -0,0 +1,268 @@
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+from urllib.parse import quote, unquote
+
+from shared.transaction_codec import DATA_MAX_SIZE
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Bytes of share data per record, the data of a transaction message
+RECORD_DATA_SIZE = DATA_MAX_SIZE
+# Receive time in nanoseconds, data length and data, padded to RECORD_DATA_SIZE
+RECORD_STRUCT = struct.Struct(f"<qB{RECORD_DATA_SIZE}s")
+RECORD_SIZE = RECORD_STRUCT.size
+TIMESTAMP_STRUCT = struct.Struct("<q")
+SEGMENT_SUFFIX = ".seg"
+# Defaults
+# Records per segment file, about 5.7MB
+SEGMENT_RECORDS = 1 << 16
+# Segments kept per share, the oldest is deleted when a new one starts, about 90MB and a million records
+RETAINED_SEGMENTS = 16
+
+
+class ShareStream:
+    """Share Stream
+    The received values of one share of one device, appended in time order to segment files of
+    fixed size records. A full segment is closed and the next one started, the oldest segments
+    beyond the retained amount are deleted. Receive times that go back, as the wall clock may,
+    are recorded as the last time so every segment stays sorted for binary search.
+    """
+
+    def __init__(self, directory: str, segment_records: int, retained_segments: int) -> None:
+        self.directory: str = directory
+        self.segment_records: int = segment_records
+        self.retained_segments: int = retained_segments
+        self.lock = threading.Lock()
+        # Segment numbers in order, with the time of their first record
+        self.segments: List[int] = list()
+        self.first_timestamps: List[int] = list()
+        self.file: Optional[BinaryIO] = None
+        self.records: int = 0
+        self.last_timestamp_ns: Optional[int] = None
+        self.appended: int = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:010d}{SEGMENT_SUFFIX}")
+
+    def _load(self) -> None:
+        # Find the segments of an earlier run, a partly written record at the end is dropped
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue
+            segment = int(name[:-len(SEGMENT_SUFFIX)])
+            path = self._path(segment)
+            size = os.path.getsize(path)
+            if size % RECORD_SIZE != 0:
+                logger.warning(f"Dropping {size % RECORD_SIZE} bytes of a partly written record from {path}")
+                size -= size % RECORD_SIZE
+                os.truncate(path, size)
+            if size == 0:
+                os.remove(path)
+                continue
+            with open(path, "rb") as file:
+                self.segments.append(segment)
+                self.first_timestamps.append(TIMESTAMP_STRUCT.unpack(file.read(TIMESTAMP_STRUCT.size))[0])
+                file.seek(size - RECORD_SIZE)
+                self.last_timestamp_ns = TIMESTAMP_STRUCT.unpack(file.read(TIMESTAMP_STRUCT.size))[0]
+            self.records = size // RECORD_SIZE
+
+    def append(self, timestamp_ns: int, data: Union[bytes, memoryview]) -> None:
+        with self.lock:
+            if self.last_timestamp_ns is not None and timestamp_ns < self.last_timestamp_ns:
+                timestamp_ns = self.last_timestamp_ns
+            if self.file is None or self.records >= self.segment_records:
+                self._rotate(timestamp_ns)
+            assert self.file is not None
+            self.file.write(RECORD_STRUCT.pack(timestamp_ns, len(data), bytes(data)))
+            self.records += 1
+            self.appended += 1
+            self.last_timestamp_ns = timestamp_ns
+
+    def _rotate(self, timestamp_ns: int) -> None:
+        # Continue the last segment of an earlier run while it has room, otherwise start the next one
+        if self.file is not None:
+            self.file.close()
+        if self.file is not None or len(self.segments) == 0 or self.records >= self.segment_records:
+            self.segments.append(self.segments[-1] + 1 if len(self.segments) > 0 else 0)
+            self.first_timestamps.append(timestamp_ns)
+            self.records = 0
+        self.file = open(self._path(self.segments[-1]), "ab")
+        while self.retained_segments > 0 and len(self.segments) > self.retained_segments:
+            os.remove(self._path(self.segments.pop(0)))
+            self.first_timestamps.pop(0)
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def query(self, start_ns: int, end_ns: int) -> List[Tuple[int, bytes]]:
+        """The records received from start_ns up to and including end_ns.
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+            # Segments from the last one starting at or before start_ns to the last one starting at or before end_ns
+            first = max(bisect_right(self.first_timestamps, start_ns) - 1, 0)
+            last = bisect_right(self.first_timestamps, end_ns)
+            paths = [self._path(segment) for segment in self.segments[first:last]]
+        # Read without holding up the appends, the mapping ends at the records flushed so far
+        results: List[Tuple[int, bytes]] = list()
+        for path in paths:
+            self._query_segment(path, start_ns, end_ns, results)
+        return results
+
+    @staticmethod
+    def _query_segment(path: str, start_ns: int, end_ns: int, results: List[Tuple[int, bytes]]) -> None:
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            # Deleted by the rotation since
+            return
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            if size < RECORD_SIZE:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                timestamps = _Timestamps(view, size // RECORD_SIZE)
+                begin = bisect_left(timestamps, start_ns)
+                end = bisect_right(timestamps, end_ns, lo=begin)
+                for offset in range(begin * RECORD_SIZE, end * RECORD_SIZE, RECORD_SIZE):
+                    timestamp_ns, length, data = RECORD_STRUCT.unpack_from(view, offset)
+                    results.append((timestamp_ns, data[0:length]))
+
+
+class _Timestamps:
+    # The receive times of the records of a mapped segment as a sequence, for bisect
+    __slots__ = ("view", "count")
+
+    def __init__(self, view: mmap.mmap, count: int) -> None:
+        self.view = view
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> int:
+        timestamp_ns: int = TIMESTAMP_STRUCT.unpack_from(self.view, index * RECORD_SIZE)[0]
+        return timestamp_ns
+
+
+class ShareHistory:
+    """Share History
+    Append-only store of the received shares, indexed by device, share id and receive time. Each
+    share of each device has its own directory of segment files, records are written through a
+    file buffer and a range is found by binary search over the memory mapped segments, so every
+    received share can be kept at full rate. Times are wall clock readings in nanoseconds since
+    the epoch.
+    """
+
+    def __init__(self, directory: str, segment_records: int = SEGMENT_RECORDS, retained_segments: int = RETAINED_SEGMENTS) -> None:
+        """Constructor method
+
+        :param directory: Directory of the store, created if missing
+        :type directory: str
+        :param segment_records: Records per segment file
+        :type segment_records: int
+        :param retained_segments: Segments kept per share, 0 to keep all
+        :type retained_segments: int
+        :raises ValueError: If a segment has no room for a record
+        """
+        if segment_records <= 0:
+            raise ValueError(f"Expected a positive amount of records per segment got {segment_records}")
+        self.directory: str = directory
+        self.segment_records: int = segment_records
+        self.retained_segments: int = retained_segments
+        self.lock = threading.Lock()
+        self.streams: Dict[Tuple[str, int], ShareStream] = dict()
+        os.makedirs(directory, exist_ok=True)
+        # Shares recorded by an earlier run
+        for device_directory in os.listdir(directory):
+            if not os.path.isdir(os.path.join(directory, device_directory)):
+                continue
+            for share_directory in os.listdir(os.path.join(directory, device_directory)):
+                if share_directory.isdigit():
+                    self._stream(unquote(device_directory), int(share_directory))
+
+    def _stream(self, device_id: str, share_id: int) -> ShareStream:
+        stream = self.streams.get((device_id, share_id))
+        if stream is None:
+            with self.lock:
+                stream = self.streams.get((device_id, share_id))
+                if stream is None:
+                    stream = ShareStream(os.path.join(self.directory, quote(device_id, safe=""), str(share_id)),
+                                         self.segment_records, self.retained_segments)
+                    self.streams[(device_id, share_id)] = stream
+        return stream
+
+    def append(self, device_id: str, share_id: int, data: Union[bytes, memoryview], timestamp_ns: int) -> None:
+        """Records a received share.
+
+        :param device_id: A Comm's device id
+        :type device_id: str
+        :param share_id: A share id
+        :type share_id: int
+        :param data: The data of the share, at most RECORD_DATA_SIZE bytes
+        :type data: bytes or memoryview
+        :param timestamp_ns: Receive time in nanoseconds since the epoch
+        :type timestamp_ns: int
+        :raises ValueError: If the data is larger than RECORD_DATA_SIZE
+        """
+        if len(data) > RECORD_DATA_SIZE:
+            raise ValueError(f"Expected at most {RECORD_DATA_SIZE} bytes of share data got {len(data)}")
+        self._stream(device_id, share_id).append(timestamp_ns, data)
+
+    def query(self, device_id: str, share_id: int, start_ns: int, end_ns: int) -> List[Tuple[int, bytes]]:
+        """The recorded values of a share in a time range.
+
+        :param device_id: A Comm's device id
+        :type device_id: str
+        :param share_id: A share id
+        :type share_id: int
+        :param start_ns: Start of the range in nanoseconds since the epoch
+        :type start_ns: int
+        :param end_ns: End of the range in nanoseconds since the epoch, included
+        :type end_ns: int
+        :return: The receive time and data of each record, oldest first
+        :rtype: List[Tuple[int, bytes]]
+        """
+        stream = self.streams.get((device_id, share_id))
+        if stream is None or end_ns < start_ns:
+            return list()
+        return stream.query(start_ns, end_ns)
+
+    def flush(self) -> None:
+        """Writes the buffered records to the segment files.
+        """
+        for stream in list(self.streams.values()):
+            stream.flush()
+
+    def close(self) -> None:
+        """Writes the buffered records and closes the segment files, appending opens them again.
+        """
+        for stream in list(self.streams.values()):
+            stream.close()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Records and segments of each recorded share.
+
+        :return: Device id, share id, records appended since the start, segments and the time of the last record
+        :rtype: List[Dict[str, Any]]
+        """
+        return [{"deviceId": device_id, "shareId": share_id, "appended": stream.appended, "segments": len(stream.segments),
+                 "lastTimestampNs": stream.last_timestamp_ns}
+                for (device_id, share_id), stream in list(self.streams.items())]
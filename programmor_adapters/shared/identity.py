@@ -0,0 +1,106 @@
+import threading
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+
+class IdentityCache:
+    """Device Identity Cache
+    The Common1 of each device, its id, registry id, serial number, shares and firmware version
+    and name, which only change with the firmware. Kept with the instance of the device reported
+    by the CommsManager, such as the USB bus and address, so a device that was unplugged and
+    plugged in again is read again. Reconnecting a device or a new firmware version also replaces
+    its identity.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # Instance, firmware version and Common1 bytes by device id
+        self.identities: Dict[str, Tuple[Optional[Hashable], int, bytes]] = dict()
+        # Last firmware version by device id, kept when the identity is invalidated
+        self.firmware_versions: Dict[str, int] = dict()
+        # Counters
+        self.hits: int = 0
+        self.misses: int = 0
+        self.invalidations: int = 0
+        self.firmware_changes: int = 0
+
+    def get(self, device_id: str, instance: Optional[Hashable]) -> Optional[bytes]:
+        """The Common1 of a device, if it was read from the same instance of the device.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param instance: The instance of the device reported by the CommsManager
+        :type instance: Hashable or None
+        :return: The Common1 as bytes, None if the device has to be read
+        :rtype: bytes or None
+        """
+        with self.lock:
+            identity = self.identities.get(device_id)
+            if identity is not None and identity[0] != instance:
+                # Plugged in again
+                del self.identities[device_id]
+                self.invalidations += 1
+                identity = None
+            if identity is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return identity[2]
+
+    def update(self, device_id: str, instance: Optional[Hashable], firmware_version: int, common: bytes) -> bool:
+        """Keeps the Common1 read from a device.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param instance: The instance of the device reported by the CommsManager
+        :type instance: Hashable or None
+        :param firmware_version: The firmwareVersion of the Common1
+        :type firmware_version: int
+        :param common: The Common1 as bytes
+        :type common: bytes
+        :return: True if the device reported a different firmware version than before, also across reconnects
+        :rtype: bool
+        """
+        with self.lock:
+            self.identities[device_id] = (instance, firmware_version, common)
+            previous = self.firmware_versions.get(device_id)
+            self.firmware_versions[device_id] = firmware_version
+            changed = previous is not None and previous != firmware_version
+            if changed:
+                self.firmware_changes += 1
+            return changed
+
+    def invalidate(self, device_id: str) -> None:
+        """Forgets the identity of a device, it is read again when next listed.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        """
+        with self.lock:
+            if self.identities.pop(device_id, None) is not None:
+                self.invalidations += 1
+
+    def retain(self, device_ids: Iterable[str]) -> None:
+        """Forgets the identities of the devices that are no longer present.
+
+        :param device_ids: The device ids found by the CommsManager
+        :type device_ids: Iterable[str]
+        """
+        present = set(device_ids)
+        with self.lock:
+            for device_id in [device_id for device_id in self.identities if device_id not in present]:
+                del self.identities[device_id]
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Cache counters.
+
+        :return: Identities held, listings answered from the cache, devices read, identities invalidated and firmware changes seen
+        :rtype: Dict[str, int]
+        """
+        with self.lock:
+            return {"entries": len(self.identities), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                    "firmwareChanges": self.firmware_changes}
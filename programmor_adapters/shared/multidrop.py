@@ -0,0 +1,124 @@
+from typing import Any, Callable, Dict, Optional
+
+from shared.queues import DropPolicy, MessagePriority, PriorityMessageQueue
+from shared.reassembly import Reassembler
+from shared.request_template import OutgoingMessage
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Network addresses, see Frame
+ADDRESS_NEXT_DEVICE = 0x00
+ADDRESS_PC = 0x01
+ADDRESS_MIN = 0x02
+ADDRESS_MAX = 0x7F
+# Frames a device may write per turn of the link's round robin, a full transaction
+DROP_QUANTUM_FRAMES = 2
+
+
+class DropComm:
+    """Drop Comm
+    A device on a multi-drop link, such as an ECU behind a bus gateway, reached through the
+    Comm of the link by its network address. It stands in for a Comm of its own: messages sent
+    to it wait in its own queue until the link writes them, and the frames the link receives
+    from its address are joined by its own reassembler. The link's threads do all the work.
+    """
+
+    def __init__(self, address: int, wake: Callable[[], None], on_stop: Callable[["DropComm"], None],
+                 outgoing_capacity: int, outgoing_policy: DropPolicy = DropPolicy.DROP_OLDEST) -> None:
+        """Constructor method
+
+        :param address: Network address of the device, 0x02-0x7F
+        :type address: int
+        :param wake: Wakes the writer of the link
+        :type wake: Callable[[], None]
+        :param on_stop: Called when the device is stopped, detaching it from the link
+        :type on_stop: Callable[[DropComm], None]
+        :param outgoing_capacity: Maximum amount of queued outgoing messages, 0 for unbounded
+        :type outgoing_capacity: int
+        :param outgoing_policy: What to do with a message sent while the outgoing queue is full
+        :type outgoing_policy: DropPolicy
+        :raises ValueError: If the address is not a device address
+        """
+        if address < ADDRESS_MIN or address > ADDRESS_MAX:
+            raise ValueError(f"Expected a device address between {ADDRESS_MIN:#04x} and {ADDRESS_MAX:#04x} got {address:#04x}")
+        self.address: int = address
+        self.wake: Callable[[], None] = wake
+        self.on_stop: Callable[[DropComm], None] = on_stop
+        self.messages_outgoing: PriorityMessageQueue[OutgoingMessage] = PriorityMessageQueue(capacity=outgoing_capacity, policy=outgoing_policy)
+        self.reassembler: Reassembler = Reassembler(self.callback)
+        # Received message callback
+        self.fn: Optional[Callable[[memoryview], None]] = None
+        # Frames the device may still write in the current turn of the link's round robin
+        self.deficit: int = 0
+        # Counters
+        self.frames_written: int = 0
+        self.messages_read: int = 0
+
+    def __str__(self) -> str:
+        return f"DropComm(address: {self.address:#04x})"
+
+    def start(self) -> None:
+        """The link runs the device, nothing to start.
+        """
+
+    def stop(self) -> None:
+        """Detaches the device from the link.
+        """
+        self.on_stop(self)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """The link runs the device, nothing to join.
+        """
+
+    def connect(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        """Drops the queued messages and incomplete frame sets.
+        """
+        self.messages_outgoing.clear()
+        self.reassembler.clear()
+
+    def send_message(self, message_bytes: OutgoingMessage, priority: MessagePriority = MessagePriority.REQUEST) -> None:
+        """Send a message to the device.
+
+        :param message_bytes: Message to send as bytes, or already framed
+        :type message_bytes: bytes or FramedMessage
+        :param priority: Class of the message, higher priority messages are sent first
+        :type priority: MessagePriority
+        """
+        self.messages_outgoing.put(message_bytes, priority)
+        self.wake()
+
+    def set_received_message_callback(self, fn: Callable[[memoryview], None]) -> None:
+        """Set the callback function to be called when a new message
+        has been received.
+
+        :param fn: Callback function
+        :type fn: Callable()
+        """
+        self.fn = fn
+
+    def callback(self, message_bytes: memoryview) -> None:
+        """To be called on successful response from device.
+
+        :param message_bytes: Received message, only valid for the duration of the call
+        :type message_bytes: memoryview
+        """
+        self.messages_read += 1
+        if self.fn is not None:
+            self.fn(message_bytes)
+
+    def is_callback(self) -> bool:
+        return self.fn is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """Frame counters of the device on the link.
+
+        :return: Address, frames written, messages received and reassembly counters
+        :rtype: Dict[str, Any]
+        """
+        return {"address": self.address, "frames_written": self.frames_written, "messages_read": self.messages_read,
+                "reassembly": self.reassembler.stats()}
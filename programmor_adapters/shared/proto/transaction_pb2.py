@@ -24,17 +24,19 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n2programmor_adapters/shared/proto/transaction.proto\"\x8c\x02\n\x12TransactionMessage\x12\r\n\x05token\x18\x01 \x01(\x07\x12*\n\x06\x61\x63tion\x18\x02 \x01(\x0e\x32\x1a.TransactionMessage.Action\x12\x0f\n\x07shareId\x18\x03 \x01(\x07\x12\x12\n\ndataLength\x18\x04 \x01(\x07\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\"\x87\x01\n\x06\x41\x63tion\x12\x06\n\x02NA\x10\x00\x12\x12\n\x0e\x43OMMON_REQUEST\x10\x01\x12\x12\n\x0e\x43OMMON_PUBLISH\x10\x02\x12\x13\n\x0f\x43OMMON_RESPONSE\x10\x03\x12\x11\n\rSHARE_REQUEST\x10\x04\x12\x11\n\rSHARE_PUBLISH\x10\x05\x12\x12\n\x0eSHARE_RESPONSE\x10\x06\"\x83\x01\n\x07\x43ommon1\x12\n\n\x02id\x18\x01 \x01(\x07\x12\x12\n\nregistryId\x18\x02 \x01(\x07\x12\x14\n\x0cserialNumber\x18\x03 \x01(\x07\x12\x15\n\rsharesVersion\x18\x04 \x01(\x07\x12\x17\n\x0f\x66irmwareVersion\x18\x05 \x01(\x07\x12\x12\n\ndeviceName\x18\x06 \x01(\tb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n2programmor_adapters/shared/proto/transaction.proto\"\xaf\x03\n\x12TransactionMessage\x12\r\n\x05token\x18\x01 \x01(\x07\x12*\n\x06\x61\x63tion\x18\x02 \x01(\x0e\x32\x1a.TransactionMessage.Action\x12\x0f\n\x07shareId\x18\x03 \x01(\x07\x12\x12\n\ndataLength\x18\x04 \x01(\x07\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\"\xaa\x02\n\x06\x41\x63tion\x12\x06\n\x02NA\x10\x00\x12\x12\n\x0e\x43OMMON_REQUEST\x10\x01\x12\x12\n\x0e\x43OMMON_PUBLISH\x10\x02\x12\x13\n\x0f\x43OMMON_RESPONSE\x10\x03\x12\x11\n\rSHARE_REQUEST\x10\x04\x12\x11\n\rSHARE_PUBLISH\x10\x05\x12\x12\n\x0eSHARE_RESPONSE\x10\x06\x12\x17\n\x13SHARE_BATCH_REQUEST\x10\x07\x12\x13\n\x0fSHARE_SUBSCRIBE\x10\x08\x12\x15\n\x11SHARE_UNSUBSCRIBE\x10\t\x12\x10\n\x0cSHARE_NOTIFY\x10\n\x12\x17\n\x13SHARE_CHUNK_REQUEST\x10\x0b\x12\x17\n\x13SHARE_CHUNK_PUBLISH\x10\x0c\x12\x18\n\x14SHARE_CHUNK_RESPONSE\x10\r\"\x99\x01\n\x07\x43ommon1\x12\n\n\x02id\x18\x01 \x01(\x07\x12\x12\n\nregistryId\x18\x02 \x01(\x07\x12\x14\n\x0cserialNumber\x18\x03 \x01(\x07\x12\x15\n\rsharesVersion\x18\x04 \x01(\x07\x12\x17\n\x0f\x66irmwareVersion\x18\x05 \x01(\x07\x12\x12\n\ndeviceName\x18\x06 \x01(\t\x12\x14\n\x0c\x63\x61pabilities\x18\x07 \x01(\x07*m\n\nCapability\x12\x13\n\x0fNO_CAPABILITIES\x10\x00\x12\x14\n\x10\x43OMPACT_REQUESTS\x10\x01\x12\x12\n\x0e\x42\x41TCH_REQUESTS\x10\x02\x12\x11\n\rSUBSCRIPTIONS\x10\x04\x12\r\n\tSTREAMING\x10\x08\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'programmor_adapters.shared.proto.transaction_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_CAPABILITY']._serialized_start=644
+  _globals['_CAPABILITY']._serialized_end=753
   _globals['_TRANSACTIONMESSAGE']._serialized_start=55
-  _globals['_TRANSACTIONMESSAGE']._serialized_end=323
+  _globals['_TRANSACTIONMESSAGE']._serialized_end=486
   _globals['_TRANSACTIONMESSAGE_ACTION']._serialized_start=188
-  _globals['_TRANSACTIONMESSAGE_ACTION']._serialized_end=323
-  _globals['_COMMON1']._serialized_start=326
-  _globals['_COMMON1']._serialized_end=457
+  _globals['_TRANSACTIONMESSAGE_ACTION']._serialized_end=486
+  _globals['_COMMON1']._serialized_start=489
+  _globals['_COMMON1']._serialized_end=642
 # @@protoc_insertion_point(module_scope)
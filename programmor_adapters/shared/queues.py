@@ -0,0 +1,406 @@
+import threading
+from collections import deque
+from enum import Enum, IntEnum
+from queue import Empty
+from typing import Any, Callable, Deque, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from shared.clock import Clock, MONOTONIC_CLOCK, NS_PER_MS, s_to_ns
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Defaults
+QUEUE_STARVATION_S = 0.1
+QUEUE_STARVATION_INTERVAL = 4
+QUEUE_BLOCK_TIMEOUT_S = 1.0
+
+T = TypeVar("T")
+
+
+class MessagePriority(IntEnum):
+    """Outgoing message classes, lower values are sent first.
+    """
+    PUBLISH = 0
+    REQUEST = 1
+    POLL = 2
+
+
+class DropPolicy(Enum):
+    """What a bounded queue does with a message put while it is full.
+    """
+    # Wait up to block_timeout_s for room, then drop the new message
+    BLOCK = "block"
+    # Drop the oldest queued message
+    DROP_OLDEST = "drop_oldest"
+    # Drop the new message
+    DROP_NEWEST = "drop_newest"
+    # Replace the queued message with the same key, otherwise drop the oldest
+    COALESCE = "coalesce"
+
+
+class QueueItem(Generic[T]):
+    """A queued message with the clock time it was queued in nanoseconds.
+    """
+    __slots__ = ("message", "priority", "key", "queued_ns")
+
+    def __init__(self, message: T, priority: MessagePriority, key: Optional[Hashable], queued_ns: int) -> None:
+        self.message: T = message
+        self.priority: MessagePriority = priority
+        self.key: Optional[Hashable] = key
+        self.queued_ns: int = queued_ns
+
+
+class LatencyStats:
+    """Time messages of one class spent queued.
+    """
+    __slots__ = ("count", "total_ns", "max_ns")
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.total_ns: int = 0
+        self.max_ns: int = 0
+
+    def add(self, latency_ns: int) -> None:
+        self.count += 1
+        self.total_ns += latency_ns
+        if latency_ns > self.max_ns:
+            self.max_ns = latency_ns
+
+    def mean_ms(self) -> float:
+        if self.count == 0:
+            return 0
+        return self.total_ns / self.count / NS_PER_MS
+
+
+class PriorityMessageQueue(Generic[T]):
+    """Priority Message Queue
+    A thread safe queue with a FIFO per MessagePriority. The highest priority message is taken
+    first, unless the oldest message of a lower class has waited longer than starvation_s, then
+    the longest waiting message is taken, at most once every starvation_interval takes so higher
+    classes keep most of the link under sustained load. A message queued with a key replaces the
+    queued message of the same class and key in place, so superseded polls are dropped without
+    losing their turn.
+
+    With a capacity the queue applies its DropPolicy when full, dropping the oldest message drops
+    from the lowest priority class, never a message of a higher class than the new one.
+    """
+
+    def __init__(self, starvation_s: float = QUEUE_STARVATION_S, starvation_interval: int = QUEUE_STARVATION_INTERVAL,
+                 clock: Clock = MONOTONIC_CLOCK, capacity: int = 0, policy: DropPolicy = DropPolicy.DROP_OLDEST,
+                 block_timeout_s: Optional[float] = QUEUE_BLOCK_TIMEOUT_S) -> None:
+        """Constructor method
+
+        :param starvation_s: Time in seconds after which a lower priority message is taken first
+        :type starvation_s: float
+        :param starvation_interval: Minimum amount of takes between two starved messages
+        :type starvation_interval: int
+        :param clock: Time source
+        :type clock: Clock
+        :param capacity: Maximum amount of queued messages, 0 for unbounded
+        :type capacity: int
+        :param policy: What to do with a message put while the queue is full
+        :type policy: DropPolicy
+        :param block_timeout_s: Time in seconds the BLOCK policy waits for room, None to wait forever
+        :type block_timeout_s: float or None
+        """
+        self.starvation_s = starvation_s
+        self.starvation_ns = s_to_ns(starvation_s)
+        self.starvation_interval = starvation_interval
+        self.clock = clock
+        self.capacity = capacity
+        self.policy = policy
+        self.block_timeout_s = block_timeout_s
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        self.queues: List[Deque[QueueItem[T]]] = [deque() for _ in MessagePriority]
+        self.size: int = 0
+        # Queued items by class and key
+        self.keyed: Dict[Tuple[MessagePriority, Hashable], QueueItem[T]] = dict()
+        # Counters
+        self.latency: List[LatencyStats] = [LatencyStats() for _ in MessagePriority]
+        self.superseded: int = 0
+        self.starved: int = 0
+        self.dropped: int = 0
+        self.max_occupancy: int = 0
+        self.takes_since_starved: int = starvation_interval
+
+    def put(self, message: T, priority: MessagePriority = MessagePriority.REQUEST, key: Optional[Hashable] = None) -> Optional[T]:
+        """Queues a message.
+
+        :param message: The message
+        :type message: T
+        :param priority: Class of the message
+        :type priority: MessagePriority
+        :param key: Identifies messages that supersede each other, None to always queue
+        :type key: Hashable or None
+        :return: The message that was replaced or dropped, if any
+        :rtype: T or None
+        """
+        with self.lock:
+            if key is not None:
+                item = self.keyed.get((priority, key))
+                if item is not None:
+                    superseded = item.message
+                    item.message = message
+                    self.superseded += 1
+                    return superseded
+            dropped: Optional[T] = None
+            if self.capacity > 0 and self.size >= self.capacity:
+                if self.policy == DropPolicy.BLOCK:
+                    if not self.not_full.wait_for(lambda: self.size < self.capacity, self.block_timeout_s):
+                        self.dropped += 1
+                        return message
+                elif self.policy == DropPolicy.DROP_NEWEST:
+                    self.dropped += 1
+                    return message
+                else:
+                    # Drop the oldest message of the lowest class
+                    lowest = max(index for index, queue in enumerate(self.queues) if len(queue) > 0)
+                    self.dropped += 1
+                    if lowest < priority:
+                        return message
+                    dropped = self._pop(self.queues[lowest]).message
+            item = QueueItem(message, priority, key, self.clock.now_ns())
+            self.queues[priority].append(item)
+            self.size += 1
+            if self.size > self.max_occupancy:
+                self.max_occupancy = self.size
+            if key is not None:
+                self.keyed[(priority, key)] = item
+            return dropped
+
+    def get_nowait(self) -> T:
+        """Takes the next message.
+
+        :raises Empty: If no message is queued
+        :return: The message
+        :rtype: T
+        """
+        with self.lock:
+            now = self.clock.now_ns()
+            selected: Optional[Deque[QueueItem[T]]] = None
+            oldest: Optional[Deque[QueueItem[T]]] = None
+            for queue in self.queues:
+                if len(queue) == 0:
+                    continue
+                if selected is None:
+                    selected = queue
+                if oldest is None or queue[0].queued_ns < oldest[0].queued_ns:
+                    oldest = queue
+            if selected is None or oldest is None:
+                raise Empty
+            # Starvation protection
+            self.takes_since_starved += 1
+            if (oldest is not selected and now - oldest[0].queued_ns >= self.starvation_ns
+                    and self.takes_since_starved >= self.starvation_interval):
+                selected = oldest
+                self.starved += 1
+                self.takes_since_starved = 0
+            item = self._pop(selected)
+            self.latency[item.priority].add(now - item.queued_ns)
+            return item.message
+
+    def empty(self) -> bool:
+        return self.size == 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def clear(self) -> None:
+        """Drops all queued messages.
+        """
+        with self.lock:
+            for queue in self.queues:
+                queue.clear()
+            self.keyed.clear()
+            self.size = 0
+            self.not_full.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue counters, the latency of each class is the time its messages spent queued.
+
+        :return: Occupancy, capacity and drop counts, queued, taken, mean and max latency per class name
+        :rtype: Dict[str, Any]
+        """
+        with self.lock:
+            stats: Dict[str, Any] = {"occupancy": self.size, "max_occupancy": self.max_occupancy, "capacity": self.capacity,
+                                     "dropped": self.dropped, "superseded": self.superseded, "starved": self.starved}
+            for priority in MessagePriority:
+                latency = self.latency[priority]
+                stats[priority.name.lower()] = {"queued": len(self.queues[priority]), "taken": latency.count,
+                                                "mean_ms": latency.mean_ms(), "max_ms": latency.max_ns / NS_PER_MS}
+            return stats
+
+    def _pop(self, queue: Deque[QueueItem[T]]) -> QueueItem[T]:
+        item = queue.popleft()
+        if item.key is not None:
+            del self.keyed[(item.priority, item.key)]
+        self.size -= 1
+        self.not_full.notify()
+        return item
+
+
+class BoundedQueue(Generic[T]):
+    """Bounded Queue
+    A thread safe FIFO that applies its DropPolicy when full. While full, the COALESCE policy
+    replaces the newest queued message with the same key in place, so a slow consumer only
+    receives the newest message of each key. Below capacity every message is queued.
+    """
+
+    def __init__(self, capacity: int = 0, policy: DropPolicy = DropPolicy.BLOCK, key: Optional[Callable[[T], Hashable]] = None,
+                 block_timeout_s: Optional[float] = QUEUE_BLOCK_TIMEOUT_S) -> None:
+        """Constructor method
+
+        :param capacity: Maximum amount of queued messages, 0 for unbounded
+        :type capacity: int
+        :param policy: What to do with a message put while the queue is full
+        :type policy: DropPolicy
+        :param key: Coalescing key of a message, required by the COALESCE policy
+        :type key: Callable[[T], Hashable] or None
+        :param block_timeout_s: Time in seconds the BLOCK policy waits for room, None to wait forever
+        :type block_timeout_s: float or None
+        """
+        if policy == DropPolicy.COALESCE and key is None:
+            raise ValueError("The coalesce policy requires a key")
+        self.capacity = capacity
+        self.policy = policy
+        self.key = key
+        self.block_timeout_s = block_timeout_s
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        self.not_empty = threading.Condition(self.lock)
+        self.items: Deque[QueueItem[T]] = deque()
+        # The newest queued item of each key
+        self.keyed: Dict[Hashable, QueueItem[T]] = dict()
+        # Counters
+        self.dropped: int = 0
+        self.coalesced: int = 0
+        self.max_occupancy: int = 0
+
+    def put(self, message: T) -> Optional[T]:
+        """Queues a message.
+
+        :param message: The message
+        :type message: T
+        :return: The message that was replaced or dropped, if any
+        :rtype: T or None
+        """
+        with self.lock:
+            key: Optional[Hashable] = None
+            if self.policy == DropPolicy.COALESCE and self.key is not None:
+                key = self.key(message)
+                item = self.keyed.get(key)
+                if item is not None and self.capacity > 0 and len(self.items) >= self.capacity:
+                    coalesced = item.message
+                    item.message = message
+                    self.coalesced += 1
+                    return coalesced
+            dropped: Optional[T] = None
+            if self.capacity > 0 and len(self.items) >= self.capacity:
+                if self.policy == DropPolicy.BLOCK:
+                    if not self.not_full.wait_for(lambda: len(self.items) < self.capacity, self.block_timeout_s):
+                        self.dropped += 1
+                        return message
+                elif self.policy == DropPolicy.DROP_NEWEST:
+                    self.dropped += 1
+                    return message
+                else:
+                    self.dropped += 1
+                    dropped = self._pop().message
+            # Priority and queue time are unused in a FIFO
+            item = QueueItem(message, MessagePriority.REQUEST, key, 0)
+            self.items.append(item)
+            if len(self.items) > self.max_occupancy:
+                self.max_occupancy = len(self.items)
+            if key is not None:
+                self.keyed[key] = item
+            self.not_empty.notify()
+            return dropped
+
+    def get(self, timeout: Optional[float] = None) -> T:
+        """Takes the oldest message, waiting for one up to the timeout.
+
+        :param timeout: Time in seconds to wait, None to wait forever
+        :type timeout: float or None
+        :raises Empty: If no message was queued in time
+        :return: The message
+        :rtype: T
+        """
+        with self.lock:
+            if not self.not_empty.wait_for(lambda: len(self.items) > 0, timeout):
+                raise Empty
+            return self._pop().message
+
+    def get_nowait(self) -> T:
+        """Takes the oldest message.
+
+        :raises Empty: If no message is queued
+        :return: The message
+        :rtype: T
+        """
+        with self.lock:
+            if len(self.items) == 0:
+                raise Empty
+            return self._pop().message
+
+    def remove(self, message: T) -> bool:
+        """Removes a queued message.
+
+        :param message: The message, compared by identity
+        :type message: T
+        :return: True if the message was queued
+        :rtype: bool
+        """
+        with self.lock:
+            for item in self.items:
+                if item.message is message:
+                    self.items.remove(item)
+                    self._forget_key(item)
+                    self.not_full.notify()
+                    return True
+            return False
+
+    def snapshot(self) -> List[T]:
+        """The queued messages, oldest first.
+
+        :return: A copy of the queued messages
+        :rtype: List[T]
+        """
+        with self.lock:
+            return [item.message for item in self.items]
+
+    def empty(self) -> bool:
+        return len(self.items) == 0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def clear(self) -> None:
+        """Drops all queued messages.
+        """
+        with self.lock:
+            self.items.clear()
+            self.keyed.clear()
+            self.not_full.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """Queue counters.
+
+        :return: Occupancy, capacity, dropped and coalesced counts
+        :rtype: Dict[str, int]
+        """
+        with self.lock:
+            return {"occupancy": len(self.items), "max_occupancy": self.max_occupancy, "capacity": self.capacity,
+                    "dropped": self.dropped, "coalesced": self.coalesced}
+
+    def _pop(self) -> QueueItem[T]:
+        item = self.items.popleft()
+        self._forget_key(item)
+        self.not_full.notify()
+        return item
+
+    def _forget_key(self, item: QueueItem[T]) -> None:
+        # An older message of a key may leave the queue while a newer one is queued
+        if item.key is not None and self.keyed.get(item.key) is item:
+            del self.keyed[item.key]
@@ -0,0 +1,177 @@
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+from shared.clock import Clock, MONOTONIC_CLOCK, s_to_ns
+from shared.frame import FrameView, FRAME_PAYLOAD_SIZE
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Defaults
+REASSEMBLY_MAX_SETS = 16
+REASSEMBLY_MAX_AGE_S = 1.0
+
+
+class FrameSet:
+    """A partially received multi-frame message.
+    The message buffer holds a slot of FRAME_PAYLOAD_SIZE bytes for each frameOrder and
+    the received bitmap has bit (frameOrder - 1) set once that slot has been written.
+    """
+    __slots__ = ("frame_id", "frame_total", "received", "received_count", "buffer", "created_ns")
+
+    def __init__(self, frame_id: int, frame_total: int, buffer: bytearray, created_ns: int) -> None:
+        self.frame_id: int = frame_id
+        self.frame_total: int = frame_total
+        self.received: int = 0
+        self.received_count: int = 0
+        self.buffer: bytearray = buffer
+        self.created_ns: int = created_ns
+
+    def is_complete(self) -> bool:
+        return self.received_count == self.frame_total
+
+
+class Reassembler:
+    """Multi-frame Message Reassembly
+    Joins the payloads of received frames into complete messages. Each frame costs the same
+    regardless of how many sets are pending, and incomplete sets are evicted once they are
+    older than max_age_s or when more than max_sets are pending, keeping memory bounded.
+    """
+
+    def __init__(self, on_message: Callable[[memoryview], None], max_sets: int = REASSEMBLY_MAX_SETS,
+                 max_age_s: float = REASSEMBLY_MAX_AGE_S, clock: Clock = MONOTONIC_CLOCK) -> None:
+        """Constructor method
+
+        :param on_message: Called with each complete message, only valid for the duration of the call
+        :type on_message: Callable[[memoryview], None]
+        :param max_sets: Maximum amount of incomplete sets kept
+        :type max_sets: int
+        :param max_age_s: Age in seconds after which an incomplete set is evicted
+        :type max_age_s: float
+        :param clock: Time source
+        :type clock: Clock
+        """
+        self.on_message = on_message
+        self.max_sets = max_sets
+        self.max_age_s = max_age_s
+        self.max_age_ns = s_to_ns(max_age_s)
+        self.clock = clock
+        # Incomplete sets by FrameId, oldest first
+        self.sets: OrderedDict[int, FrameSet] = OrderedDict()
+        # Released message buffers by frame total
+        self.buffer_pool: Dict[int, List[bytearray]] = dict()
+        self.buffer_pool_size: int = 0
+        # Counters
+        self.completed: int = 0
+        self.evicted: int = 0
+        self.duplicates: int = 0
+
+    def push(self, frame: FrameView) -> bool:
+        """Adds a received frame, calling on_message when it completes a message.
+        The frame is expected to have been validated by the caller.
+
+        :param frame: A valid data frame
+        :type frame: FrameView
+        :return: False if the frame was rejected as malformed or a duplicate
+        :rtype: bool
+        """
+        frame_order = frame.frameOrder
+        frame_total = frame.frameTotal
+        if frame_order < 1 or frame_order > frame_total:
+            return False
+
+        # Single frame, pass the payload straight through
+        if frame_total == 1:
+            self.completed += 1
+            self.on_message(frame.payload)
+            return True
+
+        frame_id = frame.frameId
+        frame_set = self.sets.get(frame_id)
+        if frame_set is not None and frame_set.frame_total != frame_total:
+            # FrameId collision with a set of a different size, the old set can never complete
+            self._evict(frame_set)
+            frame_set = None
+        if frame_set is None:
+            frame_set = self._create_set(frame_id, frame_total)
+
+        # Duplicate frame
+        bit = 1 << (frame_order - 1)
+        if frame_set.received & bit:
+            self.duplicates += 1
+            return False
+
+        # Write the payload into its slot
+        offset = (frame_order - 1) * FRAME_PAYLOAD_SIZE
+        frame_set.buffer[offset:offset + FRAME_PAYLOAD_SIZE] = frame.payload
+        frame_set.received |= bit
+        frame_set.received_count += 1
+
+        if frame_set.is_complete():
+            del self.sets[frame_id]
+            self.completed += 1
+            try:
+                self.on_message(memoryview(frame_set.buffer))
+            finally:
+                self._release_buffer(frame_set)
+        return True
+
+    def evict_stale(self) -> int:
+        """Evicts incomplete sets older than max_age_s.
+
+        :return: The amount of sets evicted
+        :rtype: int
+        """
+        count = 0
+        deadline = self.clock.now_ns() - self.max_age_ns
+        # Sets are kept in creation order, so only the oldest need checking
+        while len(self.sets) > 0:
+            frame_set = next(iter(self.sets.values()))
+            if frame_set.created_ns > deadline:
+                break
+            self._evict(frame_set)
+            count += 1
+        return count
+
+    def clear(self) -> None:
+        """Drops all incomplete sets without counting them as evicted.
+        """
+        for frame_set in list(self.sets.values()):
+            del self.sets[frame_set.frame_id]
+            self._release_buffer(frame_set)
+
+    def stats(self) -> Dict[str, int]:
+        """Reassembly counters.
+
+        :return: Pending, completed, evicted and duplicate counts
+        :rtype: Dict[str, int]
+        """
+        return {"pending": len(self.sets), "completed": self.completed, "evicted": self.evicted, "duplicates": self.duplicates}
+
+    def _create_set(self, frame_id: int, frame_total: int) -> FrameSet:
+        self.evict_stale()
+        # Make room for the new set
+        while len(self.sets) >= self.max_sets:
+            self._evict(next(iter(self.sets.values())))
+        pool = self.buffer_pool.get(frame_total)
+        if pool:
+            buffer = pool.pop()
+            self.buffer_pool_size -= 1
+        else:
+            buffer = bytearray(frame_total * FRAME_PAYLOAD_SIZE)
+        frame_set = FrameSet(frame_id, frame_total, buffer, self.clock.now_ns())
+        self.sets[frame_id] = frame_set
+        return frame_set
+
+    def _evict(self, frame_set: FrameSet) -> None:
+        logger.debug(f"Evicting incomplete frame set {frame_set.frame_id} with {frame_set.received_count}/{frame_set.frame_total} frames")
+        del self.sets[frame_set.frame_id]
+        self.evicted += 1
+        self._release_buffer(frame_set)
+
+    def _release_buffer(self, frame_set: FrameSet) -> None:
+        # Keep at most max_sets buffers for reuse
+        if self.buffer_pool_size < self.max_sets:
+            self.buffer_pool.setdefault(frame_set.frame_total, list()).append(frame_set.buffer)
+            self.buffer_pool_size += 1
@@ -0,0 +1,90 @@
+import struct
+import zlib
+from math import ceil
+from typing import List, Union
+
+from shared.frame import FRAME_CRC_OFFSET, FRAME_CRC_STRUCT, FRAME_ID_OFFSET, FRAME_PAYLOAD_OFFSET, FRAME_PAYLOAD_SIZE, \
+    FRAME_SIZE, pack_frame_into
+from shared.transaction_codec import TAG_TOKEN, TOKEN_OFFSET
+
+# frameId, frameOrder, frameTotal and the token tag, followed by the token at the start of the first payload
+FIRST_FRAME_TOKEN_STRUCT = struct.Struct("<IBBBI")
+# crc of a frame, followed by the preamble, addresses and frameId of the next frame
+NEXT_FRAME_STRUCT = struct.Struct("<IHBBI")
+
+
+class FramedMessage:
+    """An outgoing message that has already been framed.
+    Comms that frame their messages write the frames as they are, others send the message.
+    """
+    __slots__ = ("frames", "length")
+
+    def __init__(self, frames: bytes, length: int) -> None:
+        self.frames: bytes = frames
+        self.length: int = length
+
+    @property
+    def message(self) -> bytes:
+        """The message joined from the frame payloads.
+        """
+        payloads = b"".join(self.frames[offset + FRAME_PAYLOAD_OFFSET:offset + FRAME_CRC_OFFSET]
+                            for offset in range(0, len(self.frames), FRAME_SIZE))
+        return payloads[0:self.length]
+
+    def __len__(self) -> int:
+        return self.length
+
+
+# Message accepted by Comm.send_message
+OutgoingMessage = Union[bytes, FramedMessage]
+
+
+class RequestTemplate:
+    """Request Template
+    A serialised request and its frames built once, for requests that differ only in their
+    token such as scheduled polls. Rendering patches the token, used as the frameId too, into
+    the template and recomputes the frame checksums, continuing from the cached checksum of
+    the bytes ahead of the frameId, which never change. Not thread safe, a template is
+    rendered by the thread that owns it.
+    """
+    __slots__ = ("frames", "length", "frame_count", "crc_views", "head_crcs")
+
+    def __init__(self, message_bytes: bytes) -> None:
+        """Constructor method
+
+        :param message_bytes: A serialised TransactionMessage with a token
+        :type message_bytes: bytes
+        :raises ValueError: If the message does not start with its token
+        """
+        if len(message_bytes) < TOKEN_OFFSET + 4 or message_bytes[0] != TAG_TOKEN:
+            raise ValueError("Expected a message starting with its token")
+        self.length: int = len(message_bytes)
+        self.frame_count: int = ceil(len(message_bytes) / FRAME_PAYLOAD_SIZE)
+        self.frames: bytearray = bytearray(self.frame_count * FRAME_SIZE)
+        for i in range(self.frame_count):
+            # Data frame from the PC to the next device, as framed by Comm.pack_message
+            pack_frame_into(self.frames, i * FRAME_SIZE, 0x01, 0x00, 0x01, 0, i + 1, self.frame_count,
+                            message_bytes[i * FRAME_PAYLOAD_SIZE:(i + 1) * FRAME_PAYLOAD_SIZE])
+        # Checksums of the bytes ahead of each frameId and views of the remaining checksummed bytes
+        view = memoryview(self.frames)
+        offsets = range(0, len(self.frames), FRAME_SIZE)
+        self.head_crcs: List[int] = [zlib.crc32(view[offset:offset + FRAME_ID_OFFSET]) for offset in offsets]
+        self.crc_views: List[memoryview] = [view[offset + FRAME_ID_OFFSET:offset + FRAME_CRC_OFFSET] for offset in offsets]
+
+    def render(self, token: int) -> FramedMessage:
+        """Patches a token into the template.
+
+        :param token: The transaction token, also used as the frameId
+        :type token: int
+        :return: A copy of the patched frames
+        :rtype: FramedMessage
+        """
+        frames = self.frames
+        FIRST_FRAME_TOKEN_STRUCT.pack_into(frames, FRAME_ID_OFFSET, token, 1, self.frame_count, TAG_TOKEN, token)
+        crc = zlib.crc32(self.crc_views[0], self.head_crcs[0])
+        for index in range(1, self.frame_count):
+            offset = index * FRAME_SIZE
+            NEXT_FRAME_STRUCT.pack_into(frames, offset - FRAME_SIZE + FRAME_CRC_OFFSET, crc, 0x01, 0x00, 0x01, token)
+            crc = zlib.crc32(self.crc_views[index], self.head_crcs[index])
+        FRAME_CRC_STRUCT.pack_into(frames, len(frames) - FRAME_SIZE + FRAME_CRC_OFFSET, crc)
+        return FramedMessage(bytes(frames), self.length)
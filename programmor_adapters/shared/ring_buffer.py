@@ -0,0 +1,258 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from math import nan
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from shared.history import RECORD_DATA_SIZE
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Defaults
+# Values kept per share, about 3MB, 10 minutes of a share received at 50Hz
+RING_CAPACITY = 1 << 15
+
+ShareValue = Callable[[bytes], float]
+
+
+class ShareRing:
+    """Share Ring
+    The latest values of one share of one device in preallocated arrays of receive times, data
+    lengths and data, the oldest value is overwritten once the ring is full. A value function
+    turns the data into a number for min-max downsampling, its result is kept with each value.
+    Receive times that go back are kept as the last time so the ring stays sorted.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        if capacity <= 0:
+            raise ValueError(f"Expected a positive capacity got {capacity}")
+        self.capacity: int = capacity
+        self.lock = threading.Lock()
+        self.timestamps: "array[int]" = array("q", bytes(8 * capacity))
+        self.lengths: bytearray = bytearray(capacity)
+        self.payloads: bytearray = bytearray(capacity * RECORD_DATA_SIZE)
+        self.values: "array[float]" = array("d", bytes(8 * capacity))
+        self.value: Optional[ShareValue] = None
+        # Next slot to write and values held
+        self.head: int = 0
+        self.count: int = 0
+        self.appended: int = 0
+
+    def _slot(self, index: int) -> int:
+        # Slot of the index-th oldest value
+        return (self.head - self.count + index) % self.capacity
+
+    def _data(self, slot: int) -> bytes:
+        offset = slot * RECORD_DATA_SIZE
+        return bytes(self.payloads[offset:offset + self.lengths[slot]])
+
+    def _value_of(self, data: bytes) -> float:
+        assert self.value is not None
+        try:
+            return self.value(data)
+        except Exception as e:
+            logger.debug(f"Share value function failed: {e}")
+            return nan
+
+    def append(self, timestamp_ns: int, data: Union[bytes, memoryview]) -> None:
+        if len(data) > RECORD_DATA_SIZE:
+            raise ValueError(f"Expected at most {RECORD_DATA_SIZE} bytes of share data got {len(data)}")
+        with self.lock:
+            slot = self.head
+            if self.count > 0:
+                timestamp_ns = max(timestamp_ns, self.timestamps[self._slot(self.count - 1)])
+            self.timestamps[slot] = timestamp_ns
+            self.lengths[slot] = len(data)
+            offset = slot * RECORD_DATA_SIZE
+            self.payloads[offset:offset + len(data)] = data
+            if self.value is not None:
+                self.values[slot] = self._value_of(bytes(data))
+            self.head = (slot + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.appended += 1
+
+    def set_value(self, value: Optional[ShareValue]) -> None:
+        with self.lock:
+            self.value = value
+            if value is not None:
+                for index in range(self.count):
+                    slot = self._slot(index)
+                    self.values[slot] = self._value_of(self._data(slot))
+
+    def _extreme_slot(self, first: int, last: int, pick: Callable[..., float]) -> int:
+        # Slot of the smallest or largest value from the first-th to before the last-th oldest value
+        best_slot = self._slot(first)
+        best = self.values[best_slot]
+        for low, high in self._slot_ranges(first, last):
+            values = self.values[low:high]
+            extreme = pick(values)
+            if extreme != extreme:
+                # A failed value function gives nan, which min and max only skip after the first value
+                numbers = [value for value in values if value == value]
+                if len(numbers) == 0:
+                    continue
+                extreme = pick(numbers)
+            if pick(extreme, best) != best:
+                best = extreme
+                best_slot = low + values.index(extreme)
+        return best_slot
+
+    def _slot_ranges(self, first: int, last: int) -> Iterator[Tuple[int, int]]:
+        # The values from the first-th to before the last-th oldest as at most two runs of slots
+        if first >= last:
+            return
+        low = self._slot(first)
+        high = low + last - first
+        if high <= self.capacity:
+            yield (low, high)
+        else:
+            yield (low, self.capacity)
+            yield (0, high - self.capacity)
+
+    def query(self, start_ns: int, end_ns: int, width: int = 0) -> List[Tuple[int, bytes]]:
+        """The values received from start_ns up to and including end_ns. With a width, the range
+        is split into width buckets of equal time and each bucket is reduced to its values with
+        the smallest and largest number, or to its first value without a value function.
+        """
+        with self.lock:
+            timestamps = _RingTimestamps(self)
+            first = bisect_left(timestamps, start_ns)
+            last = bisect_right(timestamps, end_ns, lo=first)
+            per_bucket = 1 if self.value is None else 2
+            if width <= 0 or last - first <= width * per_bucket:
+                slots = [self._slot(index) for index in range(first, last)]
+            else:
+                slots = list()
+                span_ns = end_ns - start_ns + 1
+                bucket_first = first
+                for bucket in range(1, width + 1):
+                    bucket_last = bisect_left(timestamps, start_ns + span_ns * bucket // width, lo=bucket_first, hi=last)
+                    if bucket == width:
+                        bucket_last = last
+                    if bucket_last > bucket_first:
+                        if self.value is None:
+                            slots.append(self._slot(bucket_first))
+                        else:
+                            low = self._extreme_slot(bucket_first, bucket_last, min)
+                            high = self._extreme_slot(bucket_first, bucket_last, max)
+                            # In the order they were received
+                            ordered = sorted({low, high}, key=lambda slot: (slot - self.head) % self.capacity)
+                            slots.extend(ordered)
+                    bucket_first = bucket_last
+            return [(self.timestamps[slot], self._data(slot)) for slot in slots]
+
+
+class _RingTimestamps:
+    # The receive times of a ring, oldest first, as a sequence for bisect
+    __slots__ = ("ring",)
+
+    def __init__(self, ring: ShareRing) -> None:
+        self.ring = ring
+
+    def __len__(self) -> int:
+        return self.ring.count
+
+    def __getitem__(self, index: int) -> int:
+        return self.ring.timestamps[self.ring._slot(index)]
+
+
+class RecentShares:
+    """Recent Shares
+    The latest received values of each share of each device, in a ShareRing of a fixed capacity
+    per share so memory stays bounded. Reads are downsampled to the width of a chart, without
+    touching the disk or the device. Times are wall clock readings in nanoseconds since the
+    epoch.
+    """
+
+    def __init__(self, capacity: int = RING_CAPACITY) -> None:
+        """Constructor method
+
+        :param capacity: Values kept per share
+        :type capacity: int
+        :raises ValueError: If the capacity is not positive
+        """
+        if capacity <= 0:
+            raise ValueError(f"Expected a positive capacity got {capacity}")
+        self.capacity: int = capacity
+        self.lock = threading.Lock()
+        self.rings: Dict[Tuple[str, int], ShareRing] = dict()
+        # Value functions of shares not received yet
+        self.values: Dict[Tuple[str, int], ShareValue] = dict()
+
+    def _ring(self, device_id: str, share_id: int) -> ShareRing:
+        ring = self.rings.get((device_id, share_id))
+        if ring is None:
+            with self.lock:
+                ring = self.rings.get((device_id, share_id))
+                if ring is None:
+                    ring = ShareRing(self.capacity)
+                    ring.set_value(self.values.get((device_id, share_id)))
+                    self.rings[(device_id, share_id)] = ring
+        return ring
+
+    def append(self, device_id: str, share_id: int, data: Union[bytes, memoryview], timestamp_ns: int) -> None:
+        """Keeps a received share, in place of the oldest value once the share's ring is full.
+
+        :param device_id: A Comm's device id
+        :type device_id: str
+        :param share_id: A share id
+        :type share_id: int
+        :param data: The data of the share, at most RECORD_DATA_SIZE bytes
+        :type data: bytes or memoryview
+        :param timestamp_ns: Receive time in nanoseconds since the epoch
+        :type timestamp_ns: int
+        :raises ValueError: If the data is larger than RECORD_DATA_SIZE
+        """
+        self._ring(device_id, share_id).append(timestamp_ns, data)
+
+    def set_value(self, device_id: str, share_id: int, value: Optional[ShareValue]) -> None:
+        """Sets the function turning a share into the number reads are downsampled by.
+
+        :param device_id: A Comm's device id
+        :type device_id: str
+        :param share_id: A share id
+        :type share_id: int
+        :param value: Called with the data of the share, None to downsample by taking every nth value
+        :type value: Callable[[bytes], float] or None
+        """
+        with self.lock:
+            if value is None:
+                self.values.pop((device_id, share_id), None)
+            else:
+                self.values[(device_id, share_id)] = value
+            ring = self.rings.get((device_id, share_id))
+        if ring is not None:
+            ring.set_value(value)
+
+    def query(self, device_id: str, share_id: int, start_ns: int, end_ns: int, width: int = 0) -> List[Tuple[int, bytes]]:
+        """The kept values of a share in a time range, downsampled to at most two values per
+        bucket of width buckets.
+
+        :param device_id: A Comm's device id
+        :type device_id: str
+        :param share_id: A share id
+        :type share_id: int
+        :param start_ns: Start of the range in nanoseconds since the epoch
+        :type start_ns: int
+        :param end_ns: End of the range in nanoseconds since the epoch, included
+        :type end_ns: int
+        :param width: Buckets of the range, such as the pixel width of a chart, 0 for every value
+        :type width: int
+        :return: The receive time and data of each value, oldest first
+        :rtype: List[Tuple[int, bytes]]
+        """
+        ring = self.rings.get((device_id, share_id))
+        if ring is None or end_ns < start_ns:
+            return list()
+        return ring.query(start_ns, end_ns, width)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Values kept of each share.
+
+        :return: Device id, share id, values appended since the start and values kept
+        :rtype: List[Dict[str, Any]]
+        """
+        return [{"deviceId": device_id, "shareId": share_id, "appended": ring.appended, "kept": ring.count}
+                for (device_id, share_id), ring in list(self.rings.items())]
@@ -0,0 +1,297 @@
+import heapq
+import random
+import threading
+from itertools import count
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from shared.clock import Clock, MONOTONIC_CLOCK, NS_PER_MS, NS_PER_S
+from shared.request_template import RequestTemplate
+from shared.types import MessageType
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+ScheduleKey = Tuple[str, MessageType, int]
+
+
+class ScheduledRequest:
+    """Scheduled Request Message Object
+    The schedule fires on the fixed deadlines anchor + cycle * interval, so a late wakeup
+    delays one request without shifting the ones after it. Jitter delays each request by up
+    to jitter_ms from its deadline. Times are monotonic clock readings in nanoseconds.
+    """
+    __slots__ = ("device_id", "message_type", "share_id", "interval_ms", "interval_ns", "jitter_ms", "anchor_ns", "cycle",
+                 "deadline_ns", "entry", "last_fired_ns", "fired", "missed", "rate_started_ns", "rate_fired", "updated_ns", "created_ns",
+                 "template", "template_compact")
+
+    def __init__(self, device_id: str, message_type: MessageType, share_id: int, interval_ms: int,
+                 anchor_ns: int, created_ns: int, cycle: int = 0, jitter_ms: int = 0) -> None:
+        self.device_id: str = device_id
+        self.message_type: MessageType = message_type
+        self.share_id: int = share_id
+        self.interval_ms: int = interval_ms
+        self.interval_ns: int = interval_ms * NS_PER_MS
+        self.jitter_ms: int = jitter_ms
+        # Clock time of cycle 0, the phase of the schedule
+        self.anchor_ns: int = anchor_ns
+        self.cycle: int = cycle
+        # Clock time the schedule is next due, including jitter
+        self.deadline_ns: int = self.nominal_ns
+        # Sequence of the schedule's current heap entry
+        self.entry: int = -1
+        # Counters
+        self.last_fired_ns: Optional[int] = None
+        self.fired: int = 0
+        self.missed: int = 0
+        # Rate since the interval was last set
+        self.rate_started_ns: Optional[int] = None
+        self.rate_fired: int = 0
+        self.updated_ns: int = created_ns
+        self.created_ns: int = created_ns
+        # Prebuilt request, set by the first poll, and whether it was built compact
+        self.template: Optional[RequestTemplate] = None
+        self.template_compact: bool = False
+
+    @property
+    def key(self) -> ScheduleKey:
+        return (self.device_id, self.message_type, self.share_id)
+
+    @property
+    def nominal_ns(self) -> int:
+        """The deadline of the current cycle without jitter.
+        """
+        return self.anchor_ns + self.cycle * self.interval_ns
+
+    def requested_rate_hz(self) -> float:
+        return 1000 / self.interval_ms
+
+    def achieved_rate_hz(self) -> float:
+        if self.rate_started_ns is None or self.last_fired_ns is None or self.rate_fired < 2 \
+                or self.last_fired_ns == self.rate_started_ns:
+            return 0
+        return (self.rate_fired - 1) * NS_PER_S / (self.last_fired_ns - self.rate_started_ns)
+
+    def update_interval(self, interval_ms: int, now_ns: int):
+        self.interval_ms = interval_ms
+        self.interval_ns = interval_ms * NS_PER_MS
+        self.rate_started_ns = None
+        self.rate_fired = 0
+        self.updated_ns = now_ns
+
+    def __str__(self) -> str:
+        return f"ScheduledRequest(device_id: {self.device_id} message_type: {self.message_type} share_id: {self.share_id} interval: {self.interval_ms})"
+
+
+class Scheduler:
+    """Scheduler
+    Keeps the schedules in a min-heap ordered by their monotonic deadline, with an index by
+    (device_id, message_type, share_id). Taking the due schedules costs O(log n) per schedule
+    fired, independent of how many schedules exist. Heap entries of changed or cleared schedules
+    are skipped when they reach the top and compacted once they outnumber the live entries.
+
+    Deadlines are phase-aligned and never drift. With stagger, a new schedule of a device takes
+    the phase in the middle of the largest gap between the device's other schedules, so polls
+    are spread over the interval instead of arriving in bursts.
+    """
+
+    def __init__(self, clock: Clock = MONOTONIC_CLOCK, stagger: bool = True) -> None:
+        """Constructor method
+
+        :param clock: Time source
+        :type clock: Clock
+        :param stagger: Spread the phases of a device's schedules, otherwise new schedules are due immediately
+        :type stagger: bool
+        """
+        self.clock = clock
+        self.stagger = stagger
+        self.lock = threading.Lock()
+        # (deadline, sequence, schedule), the sequence keeps equal deadlines in insertion order
+        self.heap: List[Tuple[int, int, ScheduledRequest]] = list()
+        self.sequence = count()
+        self.index: Dict[ScheduleKey, ScheduledRequest] = dict()
+
+    def set(self, device_id: str, message_type: MessageType, share_id: int, interval_ms: int, jitter_ms: int = 0) -> ScheduledRequest:
+        """Creates a schedule or changes the interval of an existing schedule.
+        The first schedule of a device is due immediately.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param message_type: The message type to request
+        :type message_type: MessageType
+        :param share_id: A share id
+        :type share_id: int
+        :param interval_ms: The scheduled interval time
+        :type interval_ms: int
+        :param jitter_ms: Upper bound of the random delay added to each deadline
+        :type jitter_ms: int
+        :raises ValueError: If the interval is not positive or the jitter is negative
+        :return: The schedule
+        :rtype: ScheduledRequest
+        """
+        if interval_ms <= 0:
+            raise ValueError(f"Expected a positive interval got {interval_ms}")
+        if jitter_ms < 0:
+            raise ValueError(f"Expected a positive jitter got {jitter_ms}")
+        with self.lock:
+            now = self.clock.now_ns()
+            key = (device_id, message_type, share_id)
+            schedule = self.index.get(key)
+            if schedule is None:
+                anchor = self._stagger_anchor(device_id, interval_ms * NS_PER_MS, now)
+                schedule = ScheduledRequest(device_id, message_type, share_id, interval_ms, anchor, now, jitter_ms=jitter_ms)
+                self.index[key] = schedule
+                logger.debug(f"Added schedule {share_id} {interval_ms}")
+            else:
+                if schedule.fired > 0:
+                    # Keep the phase of the last request, the new interval applies from there
+                    schedule.anchor_ns = schedule.nominal_ns - schedule.interval_ns
+                    schedule.cycle = 1
+                else:
+                    schedule.anchor_ns = schedule.nominal_ns
+                    schedule.cycle = 0
+                schedule.update_interval(interval_ms, now)
+                schedule.jitter_ms = jitter_ms
+                self._align(schedule, now)
+                logger.debug(f"Updated schedule {share_id} {interval_ms}")
+            self._arm(schedule)
+            return schedule
+
+    def get(self, device_id: str, message_type: MessageType, share_id: int) -> Optional[ScheduledRequest]:
+        """Gets a schedule.
+
+        :return: The schedule, None if it does not exist
+        :rtype: ScheduledRequest or None
+        """
+        return self.index.get((device_id, message_type, share_id))
+
+    def clear(self, device_id: str, message_type: MessageType, share_id: int) -> bool:
+        """Removes a schedule.
+
+        :return: True if the schedule existed
+        :rtype: bool
+        """
+        with self.lock:
+            schedule = self.index.pop((device_id, message_type, share_id), None)
+            if schedule is None:
+                return False
+            logger.debug(f"Removed schedule {share_id}")
+            self._compact()
+            return True
+
+    def clear_device(self, device_id: str) -> int:
+        """Removes all schedules of a device.
+
+        :return: The amount of schedules removed
+        :rtype: int
+        """
+        with self.lock:
+            keys = [key for key in self.index if key[0] == device_id]
+            for key in keys:
+                del self.index[key]
+            self._compact()
+            return len(keys)
+
+    def pop_due(self) -> List[ScheduledRequest]:
+        """Takes the schedules that are due and moves them to their next deadline. Deadlines
+        already passed by then are skipped and counted as missed.
+
+        :return: The due schedules, earliest first
+        :rtype: List[ScheduledRequest]
+        """
+        due: List[ScheduledRequest] = list()
+        with self.lock:
+            now = self.clock.now_ns()
+            while len(self.heap) > 0 and self.heap[0][0] <= now:
+                _, entry, schedule = heapq.heappop(self.heap)
+                if not self._is_live(entry, schedule):
+                    continue
+                schedule.last_fired_ns = now
+                schedule.fired += 1
+                if schedule.rate_started_ns is None:
+                    schedule.rate_started_ns = now
+                schedule.rate_fired += 1
+                schedule.cycle += 1
+                schedule.missed += self._align(schedule, now)
+                due.append(schedule)
+            # Re-arm after taking, so a schedule cannot fire twice in one call
+            for schedule in due:
+                self._arm(schedule)
+        return due
+
+    def next_deadline(self) -> Optional[int]:
+        """The deadline of the earliest schedule.
+
+        :return: Clock time of the deadline in nanoseconds, None without schedules
+        :rtype: int or None
+        """
+        with self.lock:
+            while len(self.heap) > 0:
+                deadline, entry, schedule = self.heap[0]
+                if self._is_live(entry, schedule):
+                    return deadline
+                heapq.heappop(self.heap)
+            return None
+
+    def stats(self, device_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Requested and achieved rates of the schedules.
+
+        :param device_id: Only the schedules of this device, None for all schedules
+        :type device_id: str or None
+        :return: Rates in Hz and fired and missed counts per schedule
+        :rtype: List[Dict[str, Any]]
+        """
+        with self.lock:
+            return [{"deviceId": schedule.device_id, "messageType": schedule.message_type.value, "shareId": schedule.share_id,
+                     "intervalMs": schedule.interval_ms, "requestedHz": schedule.requested_rate_hz(),
+                     "achievedHz": schedule.achieved_rate_hz(), "fired": schedule.fired, "missed": schedule.missed}
+                    for schedule in self.index.values() if device_id is None or schedule.device_id == device_id]
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[ScheduledRequest]:
+        return iter(list(self.index.values()))
+
+    def _stagger_anchor(self, device_id: str, interval_ns: int, now: int) -> int:
+        # Phases of the device's schedules as fractions of the new interval
+        phases = sorted(((schedule.nominal_ns - now) / interval_ns) % 1 for schedule in self.index.values()
+                        if schedule.device_id == device_id)
+        if not self.stagger or len(phases) == 0:
+            return now
+        # Middle of the largest gap on the circle
+        gap_start, gap = phases[-1], phases[0] + 1 - phases[-1]
+        for start, end in zip(phases, phases[1:]):
+            if end - start > gap:
+                gap_start, gap = start, end - start
+        return now + round(((gap_start + gap / 2) % 1) * interval_ns)
+
+    @staticmethod
+    def _align(schedule: ScheduledRequest, now: int) -> int:
+        # Skip the deadlines that have already passed, keeping the phase
+        if schedule.nominal_ns >= now:
+            return 0
+        skipped = (now - schedule.nominal_ns) // schedule.interval_ns + 1
+        schedule.cycle += skipped
+        return skipped
+
+    def _arm(self, schedule: ScheduledRequest) -> None:
+        schedule.deadline_ns = schedule.nominal_ns
+        if schedule.jitter_ms > 0:
+            schedule.deadline_ns += random.randint(0, schedule.jitter_ms * NS_PER_MS)
+        self._push(schedule)
+
+    def _is_live(self, entry: int, schedule: ScheduledRequest) -> bool:
+        # Entries left behind by an interval change or a cleared schedule
+        return entry == schedule.entry and self.index.get(schedule.key) is schedule
+
+    def _push(self, schedule: ScheduledRequest) -> None:
+        schedule.entry = next(self.sequence)
+        heapq.heappush(self.heap, (schedule.deadline_ns, schedule.entry, schedule))
+        self._compact()
+
+    def _compact(self) -> None:
+        # Rebuild once stale entries outnumber the live ones
+        if len(self.heap) > 2 * len(self.index) + 16:
+            self.heap = [entry for entry in self.heap if self._is_live(entry[1], entry[2])]
+            heapq.heapify(self.heap)
@@ -0,0 +1,111 @@
+import threading
+from typing import Dict, Optional, Tuple, Union
+
+from shared.clock import NS_PER_MS
+from shared.transaction_codec import token_precedes
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Device id, message type value and share id
+CacheKey = Tuple[str, int, int]
+
+
+class ShareCache:
+    """Latest Share Cache
+    The latest received value of each common message and share of each device with its receive
+    time, so a read can be answered without a round trip to the device when the value is recent
+    enough. A publish invalidates the value of the share it writes, responses to requests sent
+    before the publish are not cached as they may still be in flight. Times are monotonic clock
+    readings in nanoseconds.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.entries: Dict[CacheKey, Tuple[int, bytes]] = dict()
+        # Token of the latest publish of each written share
+        self.writes: Dict[CacheKey, int] = dict()
+        # Counters
+        self.hits: int = 0
+        self.misses: int = 0
+        self.invalidations: int = 0
+        self.stale: int = 0
+
+    def update(self, key: CacheKey, data: Union[bytes, memoryview], received_ns: int, token: Optional[int] = None) -> bool:
+        """Keeps a received value in place of the previous one.
+
+        :param key: Device id, message type value and share id
+        :type key: Tuple[str, int, int]
+        :param data: The data of the share
+        :type data: bytes or memoryview
+        :param received_ns: Clock time the value was received
+        :type received_ns: int
+        :param token: Token of the request answered, None for a value that was not requested
+        :type token: int or None
+        :return: False if the value answers a request sent before the share was last written
+        :rtype: bool
+        """
+        with self.lock:
+            written = self.writes.get(key)
+            if token is not None and written is not None and token_precedes(token, written):
+                self.stale += 1
+                return False
+            self.entries[key] = (received_ns, bytes(data))
+            return True
+
+    def get(self, key: CacheKey, max_age_ms: int, now_ns: int) -> Optional[bytes]:
+        """The latest value if it was received at most max_age_ms ago.
+
+        :param key: Device id, message type value and share id
+        :type key: Tuple[str, int, int]
+        :param max_age_ms: Age in milliseconds of the oldest value accepted
+        :type max_age_ms: int
+        :param now_ns: Clock time of the read
+        :type now_ns: int
+        :return: The value, None if there is no value recent enough
+        :rtype: bytes or None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or now_ns - entry[0] > max_age_ms * NS_PER_MS:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def invalidate(self, key: CacheKey, token: Optional[int] = None) -> None:
+        """Forgets the value of a share that was written.
+
+        :param key: Device id, message type value and share id
+        :type key: Tuple[str, int, int]
+        :param token: Token of the publish, responses to requests with earlier tokens are not kept
+        :type token: int or None
+        """
+        with self.lock:
+            if token is not None:
+                self.writes[key] = token
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def forget_device(self, device_id: str) -> None:
+        """Forgets the values of a device, such as after its firmware changed.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == device_id]:
+                del self.entries[key]
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Cache counters.
+
+        :return: Values held, reads answered from the cache, reads sent to the device, invalidated values and responses
+            not kept as they were requested before a write
+        :rtype: Dict[str, int]
+        """
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                    "stale": self.stale}
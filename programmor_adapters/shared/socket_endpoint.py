@@ -1,7 +1,12 @@
 import threading
-from typing import Any, List, Callable
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Dict, List, Callable, Optional, Tuple
 from shared.endpoint import Endpoint
 from shared.api import API
+from shared.clock import NS_PER_MS
+from shared.queues import BoundedQueue, DropPolicy
+from shared.transfers import Transfer
 from shared.types import MessageType, ResponseType
 
 import asyncio
@@ -22,6 +27,15 @@ import logging
 import uvicorn.config
 logger = logging.getLogger(__name__)
 
+# Defaults
+MESSAGE_QUEUE_CAPACITY = 1024
+
+
+def response_key(response: ResponseType) -> Tuple[str, int, int]:
+    """Coalescing key of a response, the newest response of a share replaces a queued one.
+    """
+    return (response["deviceId"], response["actionType"], response["shareId"])
+
 
 class SocketEndpoint(Endpoint):
 
@@ -45,7 +59,19 @@ class SocketEndpoint(Endpoint):
         async def get_devices_detailed(self, _):
             """Get Devices Detailed
             """
-            await self.emit('devices_detailed', self.api.get_devices_detailed())
+            # The devices are read in the API's threads, the event loop keeps serving meanwhile
+            devices = await asyncio.get_event_loop().run_in_executor(None, self.api.get_devices_detailed)
+            await self.emit('devices_detailed', devices)
+
+        async def get_devices_detailed_stream(self, _):
+            """Get Devices Detailed Stream
+            Emits device_detailed for each device as soon as it answered, then devices_detailed
+            with all devices that answered in time
+            """
+            def on_device(device: Dict[str, Any]) -> None:
+                self._emit_threadsafe('device_detailed', device)
+            devices = await asyncio.get_event_loop().run_in_executor(None, partial(self.api.get_devices_detailed, on_device=on_device))
+            await self.emit('devices_detailed', devices)
 
         async def check_status(self, device_id: str):
             """Check Status
@@ -169,6 +195,104 @@ class SocketEndpoint(Endpoint):
             """
             self.api.clear_scheduled_message(device_id, MessageType.SHARE, share_id)
 
+        def subscribe_share(self, device_id: str, share_id: int, interval: int):
+            """Subscribe Share
+            The device streams the share, or it is polled if the device does not support subscriptions
+
+            :param device_id: A Programmor compatible device id
+            :type device_id: str
+            :param share_id: Protobuf model share id
+            :type device_id: int
+            :param interval: Interval of the streamed share in milliseconds
+            :type interval: int
+            """
+            self.api.subscribe(device_id, share_id, interval)
+
+        def unsubscribe_share(self, device_id: str, share_id: int):
+            """Unsubscribe Share
+
+            :param device_id: A Programmor compatible device id
+            :type device_id: str
+            :param share_id: Protobuf model share id
+            :type device_id: str
+            """
+            self.api.unsubscribe(device_id, share_id)
+
+        async def get_recent_shares(self, device_id: str, share_id: int, seconds: float, width: int):
+            """Get Recent Shares
+            Emits recent_shares with the shares received in the last seconds, at most one share
+            per bucket of width buckets, and their receive times in milliseconds since the epoch
+
+            :param device_id: A Programmor compatible device id
+            :type device_id: str
+            :param share_id: Protobuf model share id
+            :type device_id: int
+            :param seconds: Length of the range up to now
+            :type seconds: float
+            :param width: Buckets of the range, such as the pixel width of the chart
+            :type width: int
+            """
+            shares = self.api.get_recent_shares(device_id, share_id, seconds, width)
+            await self.emit('recent_shares', {"deviceId": device_id, "shareId": share_id,
+                                              "timestamps": [timestamp_ns / NS_PER_MS for timestamp_ns, _ in shares],
+                                              "data": [base64.b64encode(data).decode("utf-8") for _, data in shares]})
+
+        def read_large_share(self, device_id: str, share_id: int):
+            """Read Large Share
+            Reads a share larger than a message in chunks. Emits transfer_progress as the share
+            arrives, then transfer_complete with the share encoded in base64 or transfer_failed
+
+            :param device_id: A Programmor compatible device id
+            :type device_id: str
+            :param share_id: Protobuf model share id
+            :type device_id: int
+            """
+            self._watch_transfer(self.api.read_share(device_id, share_id, self._transfer_progress()), device_id, share_id)
+
+        def write_large_share(self, device_id: str, share_id: int, data_urlfriendly: str):
+            """Write Large Share
+            Publishes a share larger than a message in chunks. Emits transfer_progress as the share
+            is written, then transfer_complete or transfer_failed
+
+            :param device_id: A Programmor compatible device id
+            :type device_id: str
+            :param share_id: Protobuf model share id
+            :type device_id: int
+            :param data_urlfriendly: Protobuf share data encoded in base64 urlfriendly
+            :type data_urlfriendly: str
+            """
+            data = base64.urlsafe_b64decode(data_urlfriendly)
+            self._watch_transfer(self.api.write_share(device_id, share_id, data, self._transfer_progress()), device_id, share_id)
+
+        def _emit_threadsafe(self, eventName: str, arg):
+            # Progress and completion are reported from the thread that received the chunk
+            asyncio.run_coroutine_threadsafe(self.emit(eventName, arg), self.event_loop)
+
+        def _transfer_progress(self) -> Callable[[Transfer], None]:
+            # Emit once per percent of the share
+            last_percent = [-1]
+
+            def on_progress(transfer: Transfer) -> None:
+                percent = transfer.bytes_done * 100 // transfer.total if transfer.total else 100
+                if percent != last_percent[0]:
+                    last_percent[0] = percent
+                    self._emit_threadsafe('transfer_progress', transfer.to_dict(self.api.clock.now_ns()))
+            return on_progress
+
+        def _watch_transfer(self, transfer: Optional[Transfer], device_id: str, share_id: int):
+            if transfer is None:
+                self._emit_threadsafe('transfer_failed', {"deviceId": device_id, "shareId": share_id})
+                return
+
+            def on_done(future: Future[bytes]) -> None:
+                stats = transfer.to_dict(self.api.clock.now_ns())
+                if future.cancelled() or future.exception() is not None:
+                    self._emit_threadsafe('transfer_failed', stats)
+                    return
+                stats["data"] = base64.b64encode(future.result()).decode("utf-8")
+                self._emit_threadsafe('transfer_complete', stats)
+            transfer.future.add_done_callback(on_done)
+
         async def on_connect(self, websocket):
             logger.info(f'Websocket: Connected {websocket.url}')
             self.event_loop = asyncio.get_event_loop()
@@ -203,7 +327,16 @@ class SocketEndpoint(Endpoint):
 
     """Socket Endpoint; This is a singleton
     """
-    def __init__(self, api: API, port: int) -> None:
+    def __init__(self, api: API, port: int, queue_capacity: int = MESSAGE_QUEUE_CAPACITY,
+                 queue_policy: DropPolicy = DropPolicy.COALESCE) -> None:
+        """Constructor method
+
+        :param queue_capacity: Maximum amount of responses waiting to be sent to the clients, 0 for unbounded
+        :type queue_capacity: int
+        :param queue_policy: What to do with a response while the queue is full, by default the newest queued
+            response of the same share is replaced
+        :type queue_policy: DropPolicy
+        """
         Endpoint.__init__(self, api, port)
         # WebSocketEndpoint.__init__(self)
         middleware = [
@@ -219,7 +352,7 @@ class SocketEndpoint(Endpoint):
         self.ApiNamespace.emit = self.emit
         api.register_callback(lambda data: self.emit_data(data))
         self.app = Starlette(routes=routes, middleware=middleware, on_startup=[self.start_thread])
-        self.message_queue = queue.Queue()
+        self.message_queue: BoundedQueue[ResponseType] = BoundedQueue(queue_capacity, queue_policy, key=response_key)
         self.stop_event = threading.Event()
         logger.debug('Websocket Endpoint Initialised')
 
@@ -0,0 +1,101 @@
+from typing import Any, Dict, Optional, Tuple
+
+from shared.clock import NS_PER_MS, NS_PER_S
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Defaults
+# Intervals without a notification after which a subscription is renewed
+STALE_INTERVALS = 4
+# Lower bound of the time without a notification after which a subscription is renewed
+STALE_MIN_S = 1
+
+SubscriptionKey = Tuple[str, int]
+
+
+class Subscription:
+    """Share Subscription
+    A share the device streams at an interval. Notifications carry a sequence number counting
+    from 1, gaps are counted as lost and older sequence numbers as duplicates. Devices without
+    the SUBSCRIPTIONS capability are polled at the interval instead. A subscription is kept
+    inactive while its device is disconnected and sent again once the device reconnects. Times
+    are monotonic clock readings in nanoseconds.
+    """
+    __slots__ = ("device_id", "share_id", "interval_ms", "pushed", "active", "subscribed_ns", "last_received_ns", "last_sequence",
+                 "received", "lost", "duplicates", "resubscribes")
+
+    def __init__(self, device_id: str, share_id: int, interval_ms: int, subscribed_ns: int) -> None:
+        self.device_id: str = device_id
+        self.share_id: int = share_id
+        self.interval_ms: int = interval_ms
+        # Streamed by the device, otherwise polled
+        self.pushed: bool = False
+        # Sent to the connected device, otherwise waiting for the device to reconnect
+        self.active: bool = False
+        self.subscribed_ns: int = subscribed_ns
+        self.last_received_ns: Optional[int] = None
+        self.last_sequence: int = 0
+        # Counters
+        self.received: int = 0
+        self.lost: int = 0
+        self.duplicates: int = 0
+        self.resubscribes: int = 0
+
+    @property
+    def key(self) -> SubscriptionKey:
+        return (self.device_id, self.share_id)
+
+    @property
+    def stale_ns(self) -> int:
+        """Time without a notification after which the subscription is renewed.
+        """
+        return max(STALE_INTERVALS * self.interval_ms * NS_PER_MS, STALE_MIN_S * NS_PER_S)
+
+    def subscribe(self, now_ns: int) -> None:
+        """Marks the subscription as sent to the device, which starts a new sequence.
+        """
+        self.subscribed_ns = now_ns
+        self.last_received_ns = None
+        self.last_sequence = 0
+
+    def deadline_ns(self) -> int:
+        """Clock time after which a streamed subscription without notifications is renewed.
+        """
+        if self.last_received_ns is None:
+            return self.subscribed_ns + self.stale_ns
+        return self.last_received_ns + self.stale_ns
+
+    def receive(self, sequence: int, now_ns: int) -> bool:
+        """Counts a notification.
+
+        :param sequence: The sequence number of the notification
+        :type sequence: int
+        :param now_ns: Clock time of the notification
+        :type now_ns: int
+        :return: False for a duplicate or out of order notification, which should be dropped
+        :rtype: bool
+        """
+        # A sequence restarting from 1 follows a renewed subscription, a repeated 1 is a duplicate
+        restarted = sequence == 1 and self.last_sequence > 1
+        if sequence <= self.last_sequence and not restarted:
+            self.duplicates += 1
+            return False
+        if sequence > self.last_sequence:
+            self.lost += sequence - self.last_sequence - 1
+        self.last_sequence = sequence
+        self.last_received_ns = now_ns
+        self.received += 1
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        expected = self.received + self.lost
+        return {"deviceId": self.device_id, "shareId": self.share_id, "intervalMs": self.interval_ms,
+                "mode": "push" if self.pushed else "poll", "active": self.active, "received": self.received, "lost": self.lost,
+                "lossRate": self.lost / expected if expected > 0 else 0, "duplicates": self.duplicates,
+                "resubscribes": self.resubscribes}
+
+    def __str__(self) -> str:
+        return f"Subscription(device_id: {self.device_id} share_id: {self.share_id} interval: {self.interval_ms} pushed: {self.pushed} " \
+            f"active: {self.active})"
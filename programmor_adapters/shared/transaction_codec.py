@@ -0,0 +1,251 @@
+import random
+import struct
+from enum import IntEnum, IntFlag
+from itertools import count
+from typing import Iterable, List, Optional, Tuple, Union
+
+# Bytes of data a TransactionMessage carries, a share of at most this size fits a single message
+DATA_MAX_SIZE = 80
+
+# Field tags of the TransactionMessage in shared/proto/transaction.proto
+TAG_TOKEN = 0x0D  # field 1, fixed32
+TAG_ACTION = 0x10  # field 2, varint
+TAG_SHARE_ID = 0x1D  # field 3, fixed32
+TAG_DATA_LENGTH = 0x25  # field 4, fixed32
+TAG_DATA = 0x2A  # field 5, length delimited
+
+# A message with every field set, an action below 128 and data shorter than 128 bytes,
+# which is how the firmware and the adapter serialise transactions
+FAST_HEADER_STRUCT = struct.Struct("<BIBBBIBIBB")
+FAST_HEADER_SIZE = FAST_HEADER_STRUCT.size
+FIXED32_STRUCT = struct.Struct("<I")
+# A request without data, it fits a single frame
+COMPACT_REQUEST_STRUCT = struct.Struct("<BIBBBI")
+COMPACT_REQUEST_SIZE = COMPACT_REQUEST_STRUCT.size
+# Offset of the token in a message with a token, it is always the first field
+TOKEN_OFFSET = 1
+TOKEN_MAX = 0xffffffff
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+
+class TransactionAction(IntEnum):
+    """TransactionMessage.Action
+    """
+    NA = 0
+    COMMON_REQUEST = 1
+    COMMON_PUBLISH = 2
+    COMMON_RESPONSE = 3
+    SHARE_REQUEST = 4
+    SHARE_PUBLISH = 5
+    SHARE_RESPONSE = 6
+    SHARE_BATCH_REQUEST = 7
+    SHARE_SUBSCRIBE = 8
+    SHARE_UNSUBSCRIBE = 9
+    SHARE_NOTIFY = 10
+    SHARE_CHUNK_REQUEST = 11
+    SHARE_CHUNK_PUBLISH = 12
+    SHARE_CHUNK_RESPONSE = 13
+
+
+class Capability(IntFlag):
+    """Capability flags of Common1.capabilities
+    """
+    NO_CAPABILITIES = 0
+    COMPACT_REQUESTS = 1
+    BATCH_REQUESTS = 2
+    SUBSCRIPTIONS = 4
+    STREAMING = 8
+
+
+class TransactionDecodeError(Exception):
+    """Exception raised for bytes that are not a valid TransactionMessage
+    """
+
+
+class TokenGenerator:
+    """Transaction token source.
+    Counts up from a random start, skipping 0 so the token is always serialised and
+    TOKEN_OFFSET holds. Safe to share between threads.
+    """
+
+    def __init__(self, start: Optional[int] = None) -> None:
+        self.counter = count(random.getrandbits(32) if start is None else start)
+
+    def next(self) -> int:
+        """The next token.
+
+        :return: A token between 1 and TOKEN_MAX
+        :rtype: int
+        """
+        return next(self.counter) % TOKEN_MAX + 1
+
+
+def token_precedes(token: int, other: int) -> bool:
+    """Whether a token was generated before another by the same TokenGenerator, allowing for the
+    counter wrapping around.
+
+    :param token: A token
+    :type token: int
+    :param other: A token
+    :type other: int
+    :return: True if token was generated first
+    :rtype: bool
+    """
+    return 0 < (other - token) % TOKEN_MAX < TOKEN_MAX // 2
+
+
+class Transaction:
+    """A decoded TransactionMessage.
+    Fields are named as in transaction.proto. The data is a memoryview into the decoded
+    buffer and is only valid as long as the buffer is.
+    """
+    __slots__ = ("token", "action", "shareId", "dataLength", "data")
+
+    def __init__(self, token: int = 0, action: int = 0, shareId: int = 0, dataLength: int = 0, data: memoryview = memoryview(b"")) -> None:
+        self.token: int = token
+        self.action: int = action
+        self.shareId: int = shareId
+        self.dataLength: int = dataLength
+        self.data: memoryview = data
+
+    def payload(self) -> memoryview:
+        """The data up to dataLength.
+        """
+        return self.data[0:self.dataLength]
+
+    def __str__(self) -> str:
+        return f"Transaction(token: {self.token} action: {self.action} shareId: {self.shareId} dataLength: {self.dataLength})"
+
+
+def encode_compact_request(token: int, action: int, share_id: int) -> bytes:
+    """Encodes a request without its data. Every field is written, so the token is at
+    TOKEN_OFFSET and the message is always COMPACT_REQUEST_SIZE bytes.
+
+    :param token: The transaction token
+    :type token: int
+    :param action: A request action below 128
+    :type action: int
+    :param share_id: The requested share id
+    :type share_id: int
+    :return: A serialised TransactionMessage
+    :rtype: bytes
+    """
+    return COMPACT_REQUEST_STRUCT.pack(TAG_TOKEN, token, TAG_ACTION, action, TAG_SHARE_ID, share_id)
+
+
+def encode_share_ids(share_ids: Iterable[int]) -> bytes:
+    """Encodes the data of a SHARE_BATCH_REQUEST.
+
+    :param share_ids: The requested share ids
+    :type share_ids: Iterable[int]
+    :return: The share ids as fixed32
+    :rtype: bytes
+    """
+    return b"".join(FIXED32_STRUCT.pack(share_id) for share_id in share_ids)
+
+
+def decode_share_ids(data: Union[bytes, memoryview]) -> List[int]:
+    """Decodes the data of a SHARE_BATCH_REQUEST.
+
+    :param data: The share ids as fixed32, a trailing partial id is ignored
+    :type data: bytes or memoryview
+    :return: The requested share ids
+    :rtype: List[int]
+    """
+    return [share_id for share_id, in FIXED32_STRUCT.iter_unpack(data[0:len(data) - len(data) % FIXED32_STRUCT.size])]
+
+
+def decode_transaction(buffer: Union[bytes, bytearray, memoryview], padded: bool = False) -> Transaction:
+    """Decodes a serialised TransactionMessage without protobuf.
+    Accepts and rejects the same input as TransactionMessage.ParseFromString: fields may be in
+    any order, repeat or be omitted when zero, and unknown fields are skipped.
+
+    :param buffer: A serialised TransactionMessage
+    :type buffer: bytes, bytearray or memoryview
+    :param padded: The message may be followed by zeros, which end it as they do for nanopb
+    :type padded: bool
+    :raises TransactionDecodeError: If the bytes are not a valid TransactionMessage
+    :return: The transaction, its data is a view into the buffer
+    :rtype: Transaction
+    """
+    view = buffer if type(buffer) is memoryview else memoryview(buffer)
+    size = len(view)
+    if size >= FAST_HEADER_SIZE:
+        (tag_token, token, tag_action, action, tag_share_id, share_id,
+         tag_data_length, data_length, tag_data, length) = FAST_HEADER_STRUCT.unpack_from(view)
+        if (tag_token == TAG_TOKEN and tag_action == TAG_ACTION and action < 0x80 and tag_share_id == TAG_SHARE_ID
+                and tag_data_length == TAG_DATA_LENGTH and tag_data == TAG_DATA and length < 0x80
+                and FAST_HEADER_SIZE + length == size):
+            return Transaction(token, action, share_id, data_length, view[FAST_HEADER_SIZE:size])
+    if size == COMPACT_REQUEST_SIZE or (padded and size > COMPACT_REQUEST_SIZE and view[COMPACT_REQUEST_SIZE] == 0):
+        tag_token, token, tag_action, action, tag_share_id, share_id = COMPACT_REQUEST_STRUCT.unpack_from(view)
+        if tag_token == TAG_TOKEN and tag_action == TAG_ACTION and action < 0x80 and tag_share_id == TAG_SHARE_ID:
+            return Transaction(token, action, share_id)
+    return _decode_fields(view, padded)
+
+
+def _decode_fields(view: memoryview, padded: bool = False) -> Transaction:
+    transaction = Transaction()
+    size = len(view)
+    position = 0
+    while position < size:
+        tag, position = _read_varint(view, position)
+        field = tag >> 3
+        wire_type = tag & 0x07
+        if tag == 0 and padded:
+            break
+        if field == 0:
+            raise TransactionDecodeError(f"Invalid field number 0 at byte {position}")
+        if wire_type == WIRE_VARINT:
+            value, position = _read_varint(view, position)
+            if field == 2:
+                # Enums are int32, negative values are sign extended to 64 bits
+                value &= 0xffffffff
+                transaction.action = value - 0x100000000 if value & 0x80000000 else value
+        elif wire_type == WIRE_FIXED32:
+            if position + 4 > size:
+                raise TransactionDecodeError("Truncated fixed32 field")
+            value = FIXED32_STRUCT.unpack_from(view, position)[0]
+            position += 4
+            if field == 1:
+                transaction.token = value
+            elif field == 3:
+                transaction.shareId = value
+            elif field == 4:
+                transaction.dataLength = value
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            length, position = _read_varint(view, position)
+            if position + length > size:
+                raise TransactionDecodeError("Truncated length delimited field")
+            if field == 5:
+                transaction.data = view[position:position + length]
+            position += length
+        elif wire_type == WIRE_FIXED64:
+            if position + 8 > size:
+                raise TransactionDecodeError("Truncated fixed64 field")
+            position += 8
+        else:
+            # Groups are not used by proto3 and the remaining wire types are invalid
+            raise TransactionDecodeError(f"Unsupported wire type {wire_type}")
+    return transaction
+
+
+def _read_varint(view: memoryview, position: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    size = len(view)
+    while True:
+        if position >= size:
+            raise TransactionDecodeError("Truncated varint")
+        byte = view[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value & 0xffffffffffffffff, position
+        shift += 7
+        if shift >= 70:
+            raise TransactionDecodeError("Varint longer than 10 bytes")
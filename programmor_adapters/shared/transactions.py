@@ -0,0 +1,245 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from shared.clock import Clock, MONOTONIC_CLOCK, NS_PER_MS, s_to_ns
+from shared.queues import DropPolicy
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Defaults
+TRANSACTIONS_CAPACITY = 1024
+TRANSACTION_TIMEOUT_S = 1.0
+# Amount of expired transactions remembered to recognise late responses
+EXPIRED_HISTORY = 1024
+
+TransactionKey = Tuple[str, int]
+
+
+class RequestRecord:
+    """API Transactions with the device
+    Times are monotonic clock readings in nanoseconds.
+    """
+    __slots__ = ("id", "device_id", "sent_ns", "received_ns", "deadline_ns", "timed_out")
+
+    def __init__(self, id: int, device_id: str, sent_ns: int) -> None:
+        self.id: int = id
+        self.device_id: str = device_id
+        self.sent_ns: int = sent_ns
+        self.received_ns: Optional[int] = None
+        # Clock time after which the transaction is counted as timed out
+        self.deadline_ns: int = 0
+        self.timed_out: bool = False
+
+    def get_processing_time_ms(self) -> int:
+        if self.received_ns is None:
+            return -1
+        else:
+            return (self.received_ns - self.sent_ns) // NS_PER_MS
+
+    def __str__(self) -> str:
+        if self.received_ns is not None:
+            return f"RequestRecord(id: {self.id} device_id: {self.device_id} duration: {self.get_processing_time_ms()}ms)"
+        else:
+            return f"RequestRecord(id: {self.id} device_id: {self.device_id} sent_ns: {self.sent_ns})"
+
+
+class TransactionStats:
+    """Transaction counters of a device.
+    """
+    __slots__ = ("outstanding", "completed", "timeouts", "late", "dropped")
+
+    def __init__(self) -> None:
+        self.outstanding: int = 0
+        self.completed: int = 0
+        self.timeouts: int = 0
+        self.late: int = 0
+        self.dropped: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return {"outstanding": self.outstanding, "completed": self.completed, "timeouts": self.timeouts,
+                "late": self.late, "dropped": self.dropped}
+
+
+class TransactionTable:
+    """Transaction Table
+    Transactions awaiting a response, keyed by (device_id, token) so a response is matched in
+    constant time. Transactions are kept in the order they were added, which is also deadline
+    order, so expiring only looks at the oldest. A response to a transaction that has already
+    expired is counted as late.
+    """
+
+    def __init__(self, capacity: int = TRANSACTIONS_CAPACITY, policy: DropPolicy = DropPolicy.DROP_OLDEST,
+                 timeout_s: float = TRANSACTION_TIMEOUT_S, block_timeout_s: Optional[float] = None,
+                 clock: Clock = MONOTONIC_CLOCK) -> None:
+        """Constructor method
+
+        :param capacity: Maximum amount of transactions awaiting a response, 0 for unbounded
+        :type capacity: int
+        :param policy: What to do with a new transaction while the table is full, BLOCK waits for an expiry or response
+        :type policy: DropPolicy
+        :param timeout_s: Time in seconds to wait on a response before the transaction is counted as timed out
+        :type timeout_s: float
+        :param block_timeout_s: Time in seconds the BLOCK policy waits for room, None for timeout_s
+        :type block_timeout_s: float or None
+        :param clock: Time source
+        :type clock: Clock
+        :raises ValueError: With the COALESCE policy, transactions have unique tokens
+        """
+        if policy == DropPolicy.COALESCE:
+            raise ValueError("Transactions can not be coalesced")
+        self.capacity = capacity
+        self.policy = policy
+        self.timeout_s = timeout_s
+        self.timeout_ns = s_to_ns(timeout_s)
+        self.block_timeout_s = timeout_s if block_timeout_s is None else block_timeout_s
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        self.records: OrderedDict[TransactionKey, RequestRecord] = OrderedDict()
+        self.expired: OrderedDict[TransactionKey, RequestRecord] = OrderedDict()
+        self.devices: Dict[str, TransactionStats] = dict()
+
+    def add(self, record: RequestRecord) -> bool:
+        """Adds a transaction, its deadline is set from the timeout.
+
+        :param record: The transaction
+        :type record: RequestRecord
+        :return: False if the transaction was dropped
+        :rtype: bool
+        """
+        with self.lock:
+            stats = self._device_stats(record.device_id)
+            if self.capacity > 0 and len(self.records) >= self.capacity:
+                if self.policy == DropPolicy.BLOCK:
+                    if not self.not_full.wait_for(lambda: len(self.records) < self.capacity, self.block_timeout_s):
+                        stats.dropped += 1
+                        return False
+                elif self.policy == DropPolicy.DROP_NEWEST:
+                    stats.dropped += 1
+                    return False
+                else:
+                    _, oldest = self.records.popitem(last=False)
+                    oldest_stats = self._device_stats(oldest.device_id)
+                    oldest_stats.outstanding -= 1
+                    oldest_stats.dropped += 1
+            record.deadline_ns = self.clock.now_ns() + self.timeout_ns
+            key = (record.device_id, record.id)
+            # A reused token replaces the old transaction
+            replaced = self.records.pop(key, None)
+            if replaced is not None:
+                stats.outstanding -= 1
+            self.records[key] = record
+            stats.outstanding += 1
+            return True
+
+    def match(self, device_id: str, token: int) -> Optional[RequestRecord]:
+        """Removes and returns the transaction a response belongs to. A late response returns
+        its expired transaction, marked as timed out.
+
+        :param device_id: A Comms device id
+        :type device_id: str
+        :param token: The transaction token of the response
+        :type token: int
+        :return: The transaction, None if it is unknown
+        :rtype: RequestRecord or None
+        """
+        with self.lock:
+            key = (device_id, token)
+            record = self.records.pop(key, None)
+            stats = self._device_stats(device_id)
+            if record is None:
+                record = self.expired.pop(key, None)
+                if record is not None:
+                    record.received_ns = self.clock.now_ns()
+                    stats.late += 1
+                return record
+            record.received_ns = self.clock.now_ns()
+            stats.outstanding -= 1
+            stats.completed += 1
+            self.not_full.notify()
+            return record
+
+    def discard(self, device_id: str, token: int) -> bool:
+        """Removes a transaction that will not be answered, without counting it.
+
+        :return: True if the transaction existed
+        :rtype: bool
+        """
+        with self.lock:
+            record = self.records.pop((device_id, token), None)
+            if record is None:
+                return False
+            self._device_stats(device_id).outstanding -= 1
+            self.not_full.notify()
+            return True
+
+    def clear_device(self, device_id: str) -> None:
+        """Removes the transactions of a device.
+        """
+        with self.lock:
+            for key in [key for key in self.records if key[0] == device_id]:
+                del self.records[key]
+            self._device_stats(device_id).outstanding = 0
+            self.not_full.notify_all()
+
+    def expire(self) -> int:
+        """Removes the transactions that passed their deadline, counting them as timed out.
+
+        :return: The amount of transactions expired
+        :rtype: int
+        """
+        with self.lock:
+            now = self.clock.now_ns()
+            count = 0
+            while len(self.records) > 0:
+                key, record = next(iter(self.records.items()))
+                if record.deadline_ns > now:
+                    break
+                del self.records[key]
+                stats = self._device_stats(record.device_id)
+                stats.outstanding -= 1
+                stats.timeouts += 1
+                # Remember the transaction to recognise a late response
+                record.timed_out = True
+                self.expired[key] = record
+                if len(self.expired) > EXPIRED_HISTORY:
+                    self.expired.popitem(last=False)
+                count += 1
+            if count > 0:
+                logger.debug(f"{count} transactions timed out")
+                self.not_full.notify_all()
+            return count
+
+    def next_deadline(self) -> Optional[int]:
+        """The deadline of the oldest transaction.
+
+        :return: Clock time of the deadline in nanoseconds, None without transactions
+        :rtype: int or None
+        """
+        with self.lock:
+            if len(self.records) == 0:
+                return None
+            return next(iter(self.records.values())).deadline_ns
+
+    def stats(self, device_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Transaction counters by device id.
+
+        :param device_id: Only the counters of this device, None for all devices
+        :type device_id: str or None
+        :return: Outstanding, completed, timeout, late and dropped counts by device id
+        :rtype: Dict[str, Dict[str, int]]
+        """
+        with self.lock:
+            return {key: stats.to_dict() for key, stats in self.devices.items() if device_id is None or key == device_id}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _device_stats(self, device_id: str) -> TransactionStats:
+        stats = self.devices.get(device_id)
+        if stats is None:
+            stats = self.devices.setdefault(device_id, TransactionStats())
+        return stats
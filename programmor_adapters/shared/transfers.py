@@ -0,0 +1,320 @@
+import struct
+import threading
+from collections import deque
+from concurrent.futures import Future
+from enum import Enum
+from math import ceil
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
+
+from shared.clock import NS_PER_S
+from shared.transaction_codec import DATA_MAX_SIZE
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# offset and total size of the share, at the start of the data of every chunk message
+CHUNK_HEADER_STRUCT = struct.Struct("<II")
+CHUNK_HEADER_SIZE = CHUNK_HEADER_STRUCT.size
+# Bytes of the share per chunk, the header and the chunk fill the DATA_MAX_SIZE bytes of a message
+CHUNK_SIZE = DATA_MAX_SIZE - CHUNK_HEADER_SIZE
+# Defaults
+# Chunks in flight per transfer
+TRANSFER_WINDOW = 8
+# Times a chunk is sent again before the transfer fails
+TRANSFER_RETRIES = 3
+# Largest share accepted from a device
+TRANSFER_MAX_SIZE = 1 << 20
+
+
+class TransferDirection(Enum):
+    READ = "read"
+    WRITE = "write"
+
+
+class TransferError(Exception):
+    """Exception set on the future of a transfer that failed, the transfer can be resumed
+    """
+
+
+class Transfer:
+    """Chunked Share Transfer
+    Reads or writes a share larger than a message in chunks of CHUNK_SIZE bytes, each addressed
+    by its offset and answered under its own token. Up to window chunks are in flight, a chunk
+    that is not answered in time is sent again. A failed transfer keeps the chunks already
+    transferred, resuming it sends only the missing ones. Reads learn the size of the share from
+    the first chunk, which the device answers from a snapshot of the share that the following
+    chunks are read from. Times are monotonic clock readings in nanoseconds.
+    """
+
+    def __init__(self, device_id: str, share_id: int, direction: TransferDirection, data: Optional[bytes] = None,
+                 progress: Optional[Callable[["Transfer"], None]] = None, window: int = TRANSFER_WINDOW,
+                 retries: int = TRANSFER_RETRIES, started_ns: int = 0) -> None:
+        """Constructor method
+
+        :param data: The share to write, None for a read
+        :type data: bytes or None
+        :param progress: Called with the transfer after each transferred chunk
+        :type progress: Callable[[Transfer], None] or None
+        :param window: Chunks in flight
+        :type window: int
+        :param retries: Times a chunk is sent again before the transfer fails
+        :type retries: int
+        :raises ValueError: If a write has no data, or the data is larger than TRANSFER_MAX_SIZE
+        """
+        if direction == TransferDirection.WRITE and data is None:
+            raise ValueError("Expected the data of the share to write")
+        if data is not None and len(data) > TRANSFER_MAX_SIZE:
+            raise ValueError(f"Expected a share of at most {TRANSFER_MAX_SIZE} bytes got {len(data)}")
+        if window <= 0:
+            raise ValueError(f"Expected a positive window got {window}")
+        self.device_id: str = device_id
+        self.share_id: int = share_id
+        self.direction: TransferDirection = direction
+        self.progress: Optional[Callable[[Transfer], None]] = progress
+        self.window: int = window
+        self.retries: int = retries
+        self.lock = threading.Lock()
+        self.future: Future[bytes] = Future()
+        # Share size, unknown until the first chunk of a read
+        self.total: Optional[int] = None if data is None else len(data)
+        self.buffer: bytearray = bytearray() if data is None else bytearray(data)
+        # Offsets of the transferred chunks, the next offset never sent and the offsets to send again
+        self.done: Set[int] = set()
+        self.cursor: int = 0
+        self.retry: Deque[int] = deque()
+        # Chunks in flight by token, with their offset and deadline
+        self.in_flight: Dict[int, Tuple[int, int]] = dict()
+        # Failed attempts by offset
+        self.attempts: Dict[int, int] = dict()
+        # Counters
+        self.bytes_done: int = 0
+        self.chunks: int = 0
+        self.resent: int = 0
+        self.resumes: int = 0
+        self.started_ns: int = started_ns
+        self.started_bytes: int = 0
+        self.finished_ns: Optional[int] = None
+
+    @property
+    def chunk_count(self) -> Optional[int]:
+        """Chunks of the share, an empty share is a single empty chunk.
+        """
+        if self.total is None:
+            return None
+        return max(1, ceil(self.total / CHUNK_SIZE))
+
+    def chunk_length(self, offset: int) -> int:
+        """Bytes of the chunk at an offset.
+        """
+        if self.total is None:
+            return CHUNK_SIZE
+        return max(0, min(CHUNK_SIZE, self.total - offset))
+
+    def chunk_data(self, offset: int) -> memoryview:
+        """The bytes of a written share at an offset.
+        """
+        return memoryview(self.buffer)[offset:offset + self.chunk_length(offset)]
+
+    def take(self, now_ns: int, timeout_ns: int, next_token: Callable[[], int]) -> List[Tuple[int, int]]:
+        """Takes the chunks to send while there is room in the window, chunks to send again
+        first.
+
+        :param now_ns: Clock time the chunks are sent
+        :type now_ns: int
+        :param timeout_ns: Time after which an unanswered chunk is sent again
+        :type timeout_ns: int
+        :param next_token: Source of unused tokens
+        :type next_token: Callable[[], int]
+        :return: The token and offset of each chunk, now in flight
+        :rtype: List[Tuple[int, int]]
+        """
+        taken: List[Tuple[int, int]] = list()
+        with self.lock:
+            if self.future.done():
+                return taken
+            while len(self.in_flight) < self.window:
+                if len(self.retry) > 0:
+                    offset = self.retry.popleft()
+                elif self.total is None:
+                    # The size of a read is known once its first chunk arrives
+                    if self.cursor > 0:
+                        break
+                    offset = 0
+                    self.cursor = CHUNK_SIZE
+                elif self.cursor < max(self.total, 1):
+                    offset = self.cursor
+                    self.cursor += CHUNK_SIZE
+                else:
+                    break
+                token = next_token()
+                self.in_flight[token] = (offset, now_ns + timeout_ns)
+                taken.append((token, offset))
+        return taken
+
+    def receive(self, token: int, data: Union[bytes, memoryview], now_ns: int) -> bool:
+        """Adds the answer to a chunk.
+
+        :param token: The token of the chunk
+        :type token: int
+        :param data: The data of the SHARE_CHUNK_RESPONSE
+        :type data: bytes or memoryview
+        :param now_ns: Clock time of the answer
+        :type now_ns: int
+        :return: True if the chunk was transferred
+        :rtype: bool
+        """
+        error: Optional[TransferError] = None
+        with self.lock:
+            sent = self.in_flight.pop(token, None)
+            if sent is None or self.future.done():
+                return False
+            offset = sent[0]
+            if len(data) < CHUNK_HEADER_SIZE:
+                self.retry.append(offset)
+                return False
+            answered_offset, total = CHUNK_HEADER_STRUCT.unpack_from(data)
+            chunk = data[CHUNK_HEADER_SIZE:]
+            if self.direction == TransferDirection.READ:
+                if total > TRANSFER_MAX_SIZE:
+                    error = TransferError(f"Share {self.share_id} of {total} bytes exceeds {TRANSFER_MAX_SIZE} bytes")
+                elif self.total is None:
+                    self.total = total
+                    self.buffer = bytearray(total)
+                elif total != self.total:
+                    # The share changed while it was read, a resume reads it again
+                    self._restart()
+                    error = TransferError(f"Share {self.share_id} changed size from {self.total} to {total} bytes")
+                chunk_length = self.chunk_length(offset)
+                if error is None and (answered_offset != offset or len(chunk) != chunk_length):
+                    self.retry.append(offset)
+                    return False
+                if error is None:
+                    self.buffer[offset:offset + chunk_length] = chunk
+            elif answered_offset != offset or total != self.total:
+                self.retry.append(offset)
+                return False
+            if error is None and offset not in self.done:
+                self.done.add(offset)
+                self.bytes_done += self.chunk_length(offset)
+                self.chunks += 1
+            complete = error is None and len(self.done) == self.chunk_count
+            if complete or error is not None:
+                self.finished_ns = now_ns
+        if error is not None:
+            self.fail(error)
+            return False
+        if complete and self.future.set_running_or_notify_cancel():
+            self.future.set_result(bytes(self.buffer))
+        return True
+
+    def expire(self, now_ns: int) -> List[int]:
+        """Takes the chunks that were not answered in time, to be sent again. A chunk that
+        failed more than retries times fails the transfer.
+
+        :param now_ns: Clock time
+        :type now_ns: int
+        :return: The tokens of the expired chunks
+        :rtype: List[int]
+        """
+        expired: List[int] = list()
+        failed: Optional[int] = None
+        with self.lock:
+            for token, (offset, deadline_ns) in list(self.in_flight.items()):
+                if deadline_ns > now_ns:
+                    continue
+                del self.in_flight[token]
+                expired.append(token)
+                self.retry.append(offset)
+                self.resent += 1
+                self.attempts[offset] = self.attempts.get(offset, 0) + 1
+                if self.attempts[offset] > self.retries:
+                    failed = offset
+        if failed is not None:
+            self.finished_ns = now_ns
+            self.fail(TransferError(f"Chunk at offset {failed} of share {self.share_id} was not answered"))
+        return expired
+
+    def fail(self, error: BaseException) -> List[int]:
+        """Stops the transfer, the chunks in flight are sent again on resume.
+
+        :param error: The exception set on the future
+        :type error: BaseException
+        :return: The tokens of the chunks that were in flight
+        :rtype: List[int]
+        """
+        with self.lock:
+            tokens = list(self.in_flight)
+            for offset, _ in self.in_flight.values():
+                self.retry.append(offset)
+            self.in_flight.clear()
+        if self.future.set_running_or_notify_cancel():
+            logger.debug(f"{self} failed: {error}")
+            self.future.set_exception(error)
+        return tokens
+
+    def resume(self, now_ns: int) -> bool:
+        """Prepares a failed or cancelled transfer to continue with the missing chunks, with a
+        new future.
+
+        :param now_ns: Clock time the transfer continues
+        :type now_ns: int
+        :return: False if the transfer is still running or has completed
+        :rtype: bool
+        """
+        with self.lock:
+            if not self.future.done() or (not self.future.cancelled() and self.future.exception() is None):
+                return False
+            for offset, _ in self.in_flight.values():
+                self.retry.append(offset)
+            self.in_flight.clear()
+            self.attempts.clear()
+            self.future = Future()
+            self.resumes += 1
+            self.started_ns = now_ns
+            self.started_bytes = self.bytes_done
+            self.finished_ns = None
+            return True
+
+    def next_deadline(self) -> Optional[int]:
+        """The deadline of the earliest chunk in flight.
+
+        :return: Clock time of the deadline in nanoseconds, None without chunks in flight
+        :rtype: int or None
+        """
+        with self.lock:
+            return min((deadline_ns for _, deadline_ns in self.in_flight.values()), default=None)
+
+    def throughput_bps(self, now_ns: int) -> float:
+        """Bytes per second transferred since the transfer started or was resumed.
+        """
+        elapsed_ns = (self.finished_ns if self.finished_ns is not None else now_ns) - self.started_ns
+        if elapsed_ns <= 0:
+            return 0
+        return (self.bytes_done - self.started_bytes) * NS_PER_S / elapsed_ns
+
+    def to_dict(self, now_ns: int) -> Dict[str, Any]:
+        state = "running"
+        if self.future.cancelled():
+            state = "cancelled"
+        elif self.future.done():
+            state = "failed" if self.future.exception() is not None else "complete"
+        elapsed_ns = (self.finished_ns if self.finished_ns is not None else now_ns) - self.started_ns
+        return {"deviceId": self.device_id, "shareId": self.share_id, "direction": self.direction.value, "state": state,
+                "total": self.total, "transferred": self.bytes_done,
+                "progress": self.bytes_done / self.total if self.total else float(state == "complete"),
+                "chunks": self.chunks, "resent": self.resent, "resumes": self.resumes, "elapsedS": elapsed_ns / NS_PER_S,
+                "throughputBps": self.throughput_bps(now_ns)}
+
+    def _restart(self) -> None:
+        # Forget the progress of a read
+        self.total = None
+        self.buffer = bytearray()
+        self.done.clear()
+        self.cursor = 0
+        self.retry.clear()
+        self.bytes_done = 0
+        self.started_bytes = 0
+
+    def __str__(self) -> str:
+        return f"Transfer(device_id: {self.device_id} share_id: {self.share_id} direction: {self.direction.value} total: {self.total})"
@@ -39,6 +39,14 @@ def main():
         default="~/.programmor/log-test-adapter.txt"
     )
 
+    parser.add_argument(
+        "-hd",
+        "--history-directory",
+        help="The directory to record all received shares in.",
+        required=False,
+        default="~/.programmor/history-test-adapter"
+    )
+
     parser.add_argument(
         "-l",
         "--log-level",
@@ -79,7 +87,7 @@ def main():
     comms_manager = TestManager(int(args.group))
 
     # Programmor Adapter API function
-    api = API(comms_manager)
+    api = API(comms_manager, history_directory=os.path.expanduser(args.history_directory))
     api.start()
 
     # Programmor Adapter Endpoints to the GUI
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n1programmor_adapters/test_adapter/proto/test.proto\"G\n\x06Share1\x12\x16\n\x0estartingNumber\x18\x01 \x01(\x0f\x12\x14\n\x0c\x65ndingNumber\x18\x02 \x01(\x0f\x12\x0f\n\x07\x63ounter\x18\x03 \x01(\x0f\"w\n\x06Share2\x12\x1b\n\x13\x66requencyInputPinId\x18\x01 \x01(\x0f\x12\x1a\n\x12\x64igitalOutputPinId\x18\x02 \x01(\x0f\x12\x19\n\x11\x61nalogInputAPinId\x18\x03 \x01(\x0f\x12\x19\n\x11\x61nalogInputBPinId\x18\x04 \x01(\x0f\" \n\x06Share3\x12\x16\n\x0eloopsPerSecond\x18\x01 \x01(\x0f\"\x1d\n\x06Share4\x12\x13\n\x0bwelcomeText\x18\x01 \x01(\t\"\x82\x01\n\x06Share5\x12\x13\n\x0b\x66loatNumber\x18\x01 \x01(\x02\x12\x14\n\x0c\x64oubleNumber\x18\x02 \x01(\x01\x12\x11\n\tipAddress\x18\x03 \x01(\t\x12\x12\n\nportNumber\x18\x04 \x01(\x0f\x12\x10\n\x08\x64\x61teTime\x18\x05 \x01(\t\x12\x14\n\x0c\x62ooleanValue\x18\x06 \x01(\x08\"\x1e\n\x06Share6\x12\x14\n\x0c\x64\x61yOfTheWeek\x18\x01 \x01(\x0f\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n1programmor_adapters/test_adapter/proto/test.proto\"G\n\x06Share1\x12\x16\n\x0estartingNumber\x18\x01 \x01(\x0f\x12\x14\n\x0c\x65ndingNumber\x18\x02 \x01(\x0f\x12\x0f\n\x07\x63ounter\x18\x03 \x01(\x0f\"w\n\x06Share2\x12\x1b\n\x13\x66requencyInputPinId\x18\x01 \x01(\x0f\x12\x1a\n\x12\x64igitalOutputPinId\x18\x02 \x01(\x0f\x12\x19\n\x11\x61nalogInputAPinId\x18\x03 \x01(\x0f\x12\x19\n\x11\x61nalogInputBPinId\x18\x04 \x01(\x0f\" \n\x06Share3\x12\x16\n\x0eloopsPerSecond\x18\x01 \x01(\x0f\"\x1d\n\x06Share4\x12\x13\n\x0bwelcomeText\x18\x01 \x01(\t\"\x82\x01\n\x06Share5\x12\x13\n\x0b\x66loatNumber\x18\x01 \x01(\x02\x12\x14\n\x0c\x64oubleNumber\x18\x02 \x01(\x01\x12\x11\n\tipAddress\x18\x03 \x01(\t\x12\x12\n\nportNumber\x18\x04 \x01(\x0f\x12\x10\n\x08\x64\x61teTime\x18\x05 \x01(\t\x12\x14\n\x0c\x62ooleanValue\x18\x06 \x01(\x08\"\x1e\n\x06Share6\x12\x14\n\x0c\x64\x61yOfTheWeek\x18\x01 \x01(\x0f\"\"\n\x06Share7\x12\x18\n\x10\x63\x61librationTable\x18\x01 \x01(\x0c\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -43,4 +43,6 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_SHARE5']._serialized_end=443
   _globals['_SHARE6']._serialized_start=445
   _globals['_SHARE6']._serialized_end=475
+  _globals['_SHARE7']._serialized_start=477
+  _globals['_SHARE7']._serialized_end=511
 # @@protoc_insertion_point(module_scope)
@@ -1,11 +1,12 @@
 import threading
 from typing import Callable, Optional
-from queue import Queue
-from time import sleep, perf_counter
 
 import logging
 
 from shared.frame import ProcessState
+from shared.comm import OUTGOING_CAPACITY
+from shared.queues import DropPolicy, MessagePriority, PriorityMessageQueue
+from shared.request_template import FramedMessage, OutgoingMessage
 from test_adapter.test_device import TestDevice
 logger = logging.getLogger(__name__)
 
@@ -17,16 +18,22 @@ class TestComm(threading.Thread):
     python threading. Supports packeting data into Frames to receive & send to the device.
     """
 
-    def __init__(self, device: TestDevice) -> None:
+    def __init__(self, device: TestDevice, outgoing_capacity: int = OUTGOING_CAPACITY,
+                 outgoing_policy: DropPolicy = DropPolicy.DROP_OLDEST) -> None:
         """Constructor method
+
+        :param outgoing_capacity: Maximum amount of queued outgoing messages, 0 for unbounded
+        :type outgoing_capacity: int
+        :param outgoing_policy: What to do with a message sent while the outgoing queue is full
+        :type outgoing_policy: DropPolicy
         """
         threading.Thread.__init__(self)
         self.stop_flag: bool = False
-        self.blocking: bool = False
-        # Message as bytes
-        self.messages_outgoing: Queue[bytes] = Queue()
+        # Messages by priority, the event is set when a message is queued
+        self.messages_outgoing: PriorityMessageQueue[OutgoingMessage] = PriorityMessageQueue(capacity=outgoing_capacity, policy=outgoing_policy)
+        self.wakeup_event: threading.Event = threading.Event()
         # Received message callback
-        self.fn: Optional[Callable[[bytes], None]] = None
+        self.fn: Optional[Callable[[memoryview], None]] = None
         self.lastMessage: bytes = bytes()
         # Test device
         self.device = device
@@ -43,11 +50,12 @@ class TestComm(threading.Thread):
         """
         logger.debug("Stopping Comms Thread")
         self.stop_flag = True
-        self.blocking = True
+        self.wakeup_event.set()
         # self.close()
 
     def run(self) -> None:
         """Run method used by python threading
+        Sleeps until a message is queued or the device is next due to tick.
         """
         while True:
             # Stop thread
@@ -55,21 +63,20 @@ class TestComm(threading.Thread):
                 logger.debug("Stopped Comms Thread")
                 break
 
-            # Skip if blocking
-            if self.blocking:
-                continue
-
             # Tick
             self.device.tick()
 
-            # Process incoming messages
-            self.process_incoming_data()
-
             # Process outgoing messages
-            self.process_outgoing_data()
+            while self.process_outgoing_data() == ProcessState.OK:
+                pass
 
-            # Sleep the thread
-            sleep(0.0001)  # 0.1ms
+            # Process incoming messages
+            while self.process_incoming_data() == ProcessState.OK:
+                pass
+
+            # Wait for work
+            self.wakeup_event.wait(self.device.time_to_next_tick())
+            self.wakeup_event.clear()
 
     def process_incoming_data(self) -> ProcessState:
         # Read data
@@ -78,7 +85,7 @@ class TestComm(threading.Thread):
             return ProcessState.ERROR
         self.lastMessage = data
         if self.fn is not None:
-            self.callback(data)
+            self.callback(memoryview(data))
         return ProcessState.OK
 
     def process_outgoing_data(self) -> ProcessState:
@@ -86,43 +93,25 @@ class TestComm(threading.Thread):
         if self.messages_outgoing.empty():
             return ProcessState.ERROR
         # The message to send
-        data = self.messages_outgoing.get()
+        data = self.messages_outgoing.get_nowait()
+        # The test device is not framed
+        if isinstance(data, FramedMessage):
+            data = data.message
         self.write(data)
         return ProcessState.OK
 
-    def send_then_receive_message(self, message_bytes: bytes, wait_s: float = 0.5) -> bytes:
-        """Send a message then wait for a response.
-
-        :param message_bytes: Data to send to the device
-        :type message_bytes: bytes
-        :param wait_s: Waiting timeout in seconds
-        :type wait_s: float
-        :return: Response from the device
-        :rtype: bytes
-        """
-        oldMessage = self.lastMessage
-        self.messages_outgoing.put(message_bytes)
-        startTime = perf_counter()
-        currentTime = perf_counter()
-        while ((currentTime - startTime) < wait_s):
-            # asyncio.sleep(0.001)
-            currentTime = perf_counter()
-            sleep(0.001)
-            if self.lastMessage != oldMessage:
-                logger.debug(f"Sent and received message in {currentTime-startTime}ms")
-                return self.lastMessage
-        return bytes(0)
-
-    def send_message(self, message_bytes: bytes) -> None:
+    def send_message(self, message_bytes: OutgoingMessage, priority: MessagePriority = MessagePriority.REQUEST) -> None:
         """Send a message to the device.
 
-        :param message_bytes: Message to send as bytes
-        :type message_bytes: bytes
+        :param message_bytes: Message to send as bytes, or already framed
+        :type message_bytes: bytes or FramedMessage
+        :param priority: Class of the message, higher priority messages are sent first
+        :type priority: MessagePriority
         """
-        self.messages_outgoing.put(message_bytes)
-        # instead of a list, simply create the frames and write
+        self.messages_outgoing.put(message_bytes, priority)
+        self.wakeup_event.set()
 
-    def set_received_message_callback(self, fn: Callable[[bytes], None]) -> None:
+    def set_received_message_callback(self, fn: Callable[[memoryview], None]) -> None:
         """Set the callback function to be called when a new message
         has been received.
 
@@ -131,11 +120,11 @@ class TestComm(threading.Thread):
         """
         self.fn = fn
 
-    def callback(self, message_bytes: bytes) -> None:
+    def callback(self, message_bytes: memoryview) -> None:
         """To be called on successful response from device.
 
-        :param message_bytes: Message to send as bytes
-        :type message_bytes: bytes
+        :param message_bytes: Received message, only valid for the duration of the call
+        :type message_bytes: memoryview
         """
         if self.fn is not None:
             self.fn(message_bytes)
@@ -1,15 +1,53 @@
 import time
 from datetime import datetime, timezone
-from typing import List, Optional
+from queue import Empty
+from typing import Dict, Optional, Set, Union
 import shared.proto.transaction_pb2 as transaction_pb2
 import test_adapter.proto.test_pb2 as test_pb2
 from shared.types import MessageType
 from shared.api import TRANSACTION_MESSAGE_SIZE, DATA_MAX_SIZE
+from shared.queues import BoundedQueue, DropPolicy
+from shared.transaction_codec import Capability, FIXED32_STRUCT, TransactionDecodeError, decode_share_ids, decode_transaction
+from shared.transfers import CHUNK_HEADER_SIZE, CHUNK_HEADER_STRUCT, CHUNK_SIZE
 
 # Logging
 import logging
 logger = logging.getLogger(__name__)
 
+# Defaults
+OUTBOUND_CAPACITY = 64
+
+
+class DeviceSubscription:
+    """A share streamed by the test device
+    """
+
+    def __init__(self, share_id: int, interval_s: float, due: float) -> None:
+        self.share_id = share_id
+        self.interval_s = interval_s
+        self.due = due
+        self.sequence = 0
+
+
+class IncomingShare:
+    """A share the test device receives in chunks
+    """
+
+    def __init__(self, total: int) -> None:
+        self.data = bytearray(total)
+        self.received: Set[int] = set()
+        self.received_bytes = 0
+
+    def add(self, offset: int, chunk: Union[bytes, memoryview]) -> None:
+        if offset in self.received or offset + len(chunk) > len(self.data):
+            return
+        self.data[offset:offset + len(chunk)] = chunk
+        self.received.add(offset)
+        self.received_bytes += len(chunk)
+
+    def complete(self) -> bool:
+        return len(self.received) > 0 and self.received_bytes == len(self.data)
+
 
 class TestDevice:
 
@@ -21,7 +59,11 @@ class TestDevice:
             registry_id: int = 0x3E9,  # 1001
             serial_number: int = 123456789,
             shares_version: int = 1,
-            firmware_version: int = 202308) -> None:
+            firmware_version: int = 202308,
+            capabilities: Capability = Capability.COMPACT_REQUESTS | Capability.BATCH_REQUESTS | Capability.SUBSCRIPTIONS
+            | Capability.STREAMING,
+            outbound_capacity: int = OUTBOUND_CAPACITY,
+            outbound_policy: DropPolicy = DropPolicy.DROP_OLDEST) -> None:
         self.name = name
         self.device_id = device_id
         # Common 1
@@ -30,6 +72,7 @@ class TestDevice:
         self.serial_number = serial_number
         self.shares_version = shares_version
         self.firmware_version = firmware_version
+        self.capabilities = capabilities
         # Share 1: Counter
         self.counter_start: int = 0
         self.counter_end: int = 20
@@ -50,9 +93,17 @@ class TestDevice:
         self.boolean_value = True
         # Share 6: Select/Combobox
         self.day_of_the_week = 1  # Monday
+        # Share 7: Calibration table, larger than a message
+        self.calibration_table = bytes(i % 256 for i in range(4096))
         # Device
         self.elapsed_time: float = 0
-        self.outbound_data: List[bytes] = list()
+        # Streamed shares by share id
+        self.subscriptions: Dict[int, DeviceSubscription] = dict()
+        # Snapshots of the shares being read and the shares being written in chunks, by share id
+        self.outgoing_chunks: Dict[int, bytes] = dict()
+        self.incoming_chunks: Dict[int, IncomingShare] = dict()
+        # Responses waiting to be read by the adapter
+        self.outbound_data: BoundedQueue[bytes] = BoundedQueue(outbound_capacity, outbound_policy)
 
     def tick(self) -> None:
         current_time = time.perf_counter()
@@ -64,14 +115,36 @@ class TestDevice:
                 self.counter = self.counter_start
             # Update time
             self.elapsed_time = current_time
+        # Stream subscribed shares
+        for subscription in list(self.subscriptions.values()):
+            if current_time < subscription.due:
+                continue
+            subscription.sequence += 1
+            notifyMessage = self.response_message(MessageType.SHARE, subscription.share_id, subscription.sequence,
+                                                  self.share_data(subscription.share_id))
+            notifyMessage.action = transaction_pb2.TransactionMessage.SHARE_NOTIFY  # type: ignore
+            self.outbound_data.put(bytes(notifyMessage.SerializeToString()))
+            # Keep the phase unless the notification is a full interval late
+            subscription.due += subscription.interval_s
+            if subscription.due <= current_time:
+                subscription.due = current_time + subscription.interval_s
+
+    def time_to_next_tick(self) -> float:
+        """Seconds until the device next has work to do in tick.
+        """
+        current_time = time.perf_counter()
+        wait = 1 - (current_time - self.elapsed_time)
+        for subscription in self.subscriptions.values():
+            wait = min(wait, subscription.due - current_time)
+        return max(0.0, wait)
 
     # Process Data
     # Adapter -> Test Device
     def process_data(self, data: bytes) -> None:
-        inMessage = transaction_pb2.TransactionMessage()  # type: ignore
         try:
-            inMessage.ParseFromString(bytes(data[0:TRANSACTION_MESSAGE_SIZE]))
-        except BaseException:
+            # Like the firmware, the frame padding after the message is ignored
+            inMessage = decode_transaction(data[0:TRANSACTION_MESSAGE_SIZE], padded=True)
+        except TransactionDecodeError:
             return
 
         # Request action
@@ -84,145 +157,231 @@ class TestDevice:
             commonMessage.sharesVersion = self.shares_version
             commonMessage.firmwareVersion = self.firmware_version
             commonMessage.deviceName = self.name
-            self.outbound_data.append(bytes(self.response_message(MessageType.COMMON, 1, inMessage.token,
-                                      commonMessage.SerializeToString()).SerializeToString()))
+            commonMessage.capabilities = self.capabilities
+            self.outbound_data.put(bytes(self.response_message(MessageType.COMMON, 1, inMessage.token,
+                                   commonMessage.SerializeToString()).SerializeToString()))
 
         elif inMessage.action == transaction_pb2.TransactionMessage.SHARE_REQUEST:  # type: ignore
+            shareData = self.share_data(inMessage.shareId)
+            if shareData is not None:
+                self.outbound_data.put(bytes(self.response_message(MessageType.SHARE, inMessage.shareId, inMessage.token,
+                                       shareData).SerializeToString()))
+
+        elif inMessage.action == transaction_pb2.TransactionMessage.SHARE_BATCH_REQUEST:  # type: ignore
+            if not self.capabilities & Capability.BATCH_REQUESTS:
+                return
+            # Answer each share in order, unknown shares with empty data
+            for shareId in decode_share_ids(inMessage.payload()):
+                self.outbound_data.put(bytes(self.response_message(MessageType.SHARE, shareId, inMessage.token,
+                                       self.share_data(shareId)).SerializeToString()))
+
+        elif inMessage.action == transaction_pb2.TransactionMessage.SHARE_SUBSCRIBE:  # type: ignore
+            if not self.capabilities & Capability.SUBSCRIPTIONS:
+                return
+            # Answer with the share, then stream it from the next interval with a new sequence
+            shareData = self.share_data(inMessage.shareId)
+            self.outbound_data.put(bytes(self.response_message(MessageType.SHARE, inMessage.shareId, inMessage.token,
+                                   shareData).SerializeToString()))
+            interval_ms = FIXED32_STRUCT.unpack_from(inMessage.payload())[0] if inMessage.dataLength >= FIXED32_STRUCT.size else 0
+            if shareData is not None and interval_ms > 0:
+                self.subscriptions[inMessage.shareId] = DeviceSubscription(inMessage.shareId, interval_ms / 1000,
+                                                                           time.perf_counter() + interval_ms / 1000)
 
-            if inMessage.shareId == 1:
-                # Share1 request
-                testMessage: test_pb2.TestMessage = test_pb2.Share1()  # type: ignore
-                print(type(self.counter_start))
-                print(self.counter_start)
-                testMessage.startingNumber = self.counter_start
-                testMessage.endingNumber = self.counter_end
-                testMessage.counter = self.counter
-                self.outbound_data.append(bytes(self.response_message(MessageType.SHARE, 1, inMessage.token,
-                                          testMessage.SerializeToString()).SerializeToString()))
-
-            elif inMessage.shareId == 2:
-                # Share2 request
-                testMessage: test_pb2.TestMessage = test_pb2.Share2()  # type: ignore
-                testMessage.frequencyInputPinId = self.frequency_input_pin_id
-                testMessage.digitalOutputPinId = self.digital_output_pin_id
-                testMessage.analogInputAPinId = self.analog_input_a_pin_id
-                testMessage.analogInputBPinId = self.analog_input_b_pin_id
-                self.outbound_data.append(bytes(self.response_message(MessageType.SHARE, 2, inMessage.token,
-                                          testMessage.SerializeToString()).SerializeToString()))
-
-            elif inMessage.shareId == 3:
-                # Share3 request
-                testMessage: test_pb2.TestMessage = test_pb2.Share3()  # type: ignore
-                testMessage.loopsPerSecond = int(time.perf_counter())
-                self.outbound_data.append(bytes(self.response_message(MessageType.SHARE, 3, inMessage.token,
-                                          testMessage.SerializeToString()).SerializeToString()))
-
-            elif inMessage.shareId == 4:
-                # Share4 request
-                testMessage: test_pb2.TestMessage = test_pb2.Share4()  # type: ignore
-                testMessage.welcomeText = self.welcome_text
-                self.outbound_data.append(bytes(self.response_message(MessageType.SHARE, 4, inMessage.token,
-                                          testMessage.SerializeToString()).SerializeToString()))
-
-            elif inMessage.shareId == 5:
-                # Share5 request
-                testMessage: test_pb2.TestMessage = test_pb2.Share5()  # type: ignore
-                testMessage.floatNumber = self.float_number
-                testMessage.doubleNumber = self.double_number
-                testMessage.ipAddress = self.ip_address
-                testMessage.portNumber = self.port_number
-                testMessage.dateTime = self.datetime_utc
-                testMessage.booleanValue = self.boolean_value
-                self.outbound_data.append(bytes(self.response_message(MessageType.SHARE, 5, inMessage.token,
-                                          testMessage.SerializeToString()).SerializeToString()))
-
-            elif inMessage.shareId == 6:
-                # Share6 request
-                testMessage: test_pb2.TestMessage = test_pb2.Share6()  # type: ignore
-                testMessage.dayOfTheWeek = self.day_of_the_week
-                self.outbound_data.append(bytes(self.response_message(MessageType.SHARE, 6, inMessage.token,
-                                          testMessage.SerializeToString()).SerializeToString()))
+        elif inMessage.action == transaction_pb2.TransactionMessage.SHARE_UNSUBSCRIBE:  # type: ignore
+            self.subscriptions.pop(inMessage.shareId, None)
 
         elif inMessage.action == transaction_pb2.TransactionMessage.SHARE_PUBLISH:  # type: ignore
-            if inMessage.shareId == 1:
-                # Share1 publish
-                inData: bytes = inMessage.data[0:inMessage.dataLength]
-                testMessage: test_pb2.TestMessage = test_pb2.Share1()  # type: ignore
-                try:
-                    testMessage.ParseFromString(bytes(inData[0:DATA_MAX_SIZE]))
-                except BaseException as e:
-                    logger.error("Failed to parse message", e)
-                    return
-                # Process message
-                self.counter_start = testMessage.startingNumber
-                self.counter_end = testMessage.endingNumber
-
-            elif inMessage.shareId == 2:
-                # Share2 publish
-                inData: bytes = inMessage.data[0:inMessage.dataLength]
-                testMessage: test_pb2.TestMessage = test_pb2.Share2()  # type: ignore
-                try:
-                    testMessage.ParseFromString(bytes(inData[0:DATA_MAX_SIZE]))
-                except BaseException as e:
-                    logger.error("Failed to parse message", e)
-                    return
-                # Process message
-                # Possible improvements: Check pin ids and prevent setting pin id more then once.
-                self.frequency_input_pin_id = testMessage.frequencyInputPinId
-                self.digital_output_pin_id = testMessage.digitalOutputPinId
-                self.analog_input_a_pin_id = testMessage.analogInputAPinId
-                self.analog_input_b_pin_id = testMessage.analogInputBPinId
-
-            elif inMessage.shareId == 4:
-                # Share4 publish
-                inData: bytes = inMessage.data[0:inMessage.dataLength]
-                testMessage: test_pb2.TestMessage = test_pb2.Share4()  # type: ignore
-                try:
-                    testMessage.ParseFromString(bytes(inData[0:DATA_MAX_SIZE]))
-                except BaseException as e:
-                    logger.error("Failed to parse message", e)
-                    return
-                # Process message
-                self.welcome_text = testMessage.welcomeText
-
-            elif inMessage.shareId == 5:
-                # Share5 publish
-                inData: bytes = inMessage.data[0:inMessage.dataLength]
-                testMessage: test_pb2.TestMessage = test_pb2.Share5()  # type: ignore
-                try:
-                    testMessage.ParseFromString(bytes(inData[0:DATA_MAX_SIZE]))
-                except BaseException as e:
-                    logger.error("Failed to parse message", e)
-                    return
-                # Process message
-                self.float_number = testMessage.floatNumber
-                self.double_number = testMessage.doubleNumber
-                self.ip_address = testMessage.ipAddress
-                self.port_number = testMessage.portNumber
-                self.datetime_utc = testMessage.dateTime
-                self.boolean_value = testMessage.booleanValue
-
-            elif inMessage.shareId == 6:
-                # Share6 publish
-                inData: bytes = inMessage.data[0:inMessage.dataLength]
-                testMessage: test_pb2.TestMessage = test_pb2.Share6()  # type: ignore
-                try:
-                    testMessage.ParseFromString(bytes(inData[0:DATA_MAX_SIZE]))
-                except BaseException as e:
-                    logger.error("Failed to parse message", e)
-                    return
-                # Process message
-                self.day_of_the_week = testMessage.dayOfTheWeek
+            self.publish_share(inMessage.shareId, bytes(inMessage.payload()[0:DATA_MAX_SIZE]))
+
+        elif inMessage.action == transaction_pb2.TransactionMessage.SHARE_CHUNK_REQUEST:  # type: ignore
+            if not self.capabilities & Capability.STREAMING or inMessage.dataLength < CHUNK_HEADER_SIZE:
+                return
+            offset, length = CHUNK_HEADER_STRUCT.unpack_from(inMessage.payload())
+            # The first chunk takes a snapshot of the share, the following chunks are read from it
+            if offset == 0 or inMessage.shareId not in self.outgoing_chunks:
+                self.outgoing_chunks[inMessage.shareId] = self.share_data(inMessage.shareId) or bytes(0)
+            shareData = self.outgoing_chunks[inMessage.shareId]
+            self.outbound_data.put(self.chunk_response(inMessage.shareId, inMessage.token, offset, len(shareData),
+                                                       shareData[offset:offset + min(length, CHUNK_SIZE)]))
+
+        elif inMessage.action == transaction_pb2.TransactionMessage.SHARE_CHUNK_PUBLISH:  # type: ignore
+            if not self.capabilities & Capability.STREAMING or inMessage.dataLength < CHUNK_HEADER_SIZE:
+                return
+            offset, total = CHUNK_HEADER_STRUCT.unpack_from(inMessage.payload())
+            # A share of another size starts over
+            incoming = self.incoming_chunks.get(inMessage.shareId)
+            if incoming is None or len(incoming.data) != total:
+                incoming = self.incoming_chunks[inMessage.shareId] = IncomingShare(total)
+            incoming.add(offset, inMessage.payload()[CHUNK_HEADER_SIZE:])
+            self.outbound_data.put(self.chunk_response(inMessage.shareId, inMessage.token, offset, total, bytes(0)))
+            # Apply the share once every chunk has arrived
+            if incoming.complete():
+                self.incoming_chunks.pop(inMessage.shareId, None)
+                self.publish_share(inMessage.shareId, bytes(incoming.data))
+
+    def publish_share(self, shareId: int, data: bytes) -> None:
+        """Applies a published share.
+
+        :param shareId: A share id
+        :type shareId: int
+        :param data: The serialised share
+        :type data: bytes
+        """
+        if shareId == 1:
+            # Share1 publish
+            testMessage: test_pb2.TestMessage = test_pb2.Share1()  # type: ignore
+            try:
+                testMessage.ParseFromString(data)
+            except BaseException as e:
+                logger.error("Failed to parse message", e)
+                return
+            # Process message
+            self.counter_start = testMessage.startingNumber
+            self.counter_end = testMessage.endingNumber
+
+        elif shareId == 2:
+            # Share2 publish
+            testMessage: test_pb2.TestMessage = test_pb2.Share2()  # type: ignore
+            try:
+                testMessage.ParseFromString(data)
+            except BaseException as e:
+                logger.error("Failed to parse message", e)
+                return
+            # Process message
+            # Possible improvements: Check pin ids and prevent setting pin id more then once.
+            self.frequency_input_pin_id = testMessage.frequencyInputPinId
+            self.digital_output_pin_id = testMessage.digitalOutputPinId
+            self.analog_input_a_pin_id = testMessage.analogInputAPinId
+            self.analog_input_b_pin_id = testMessage.analogInputBPinId
+
+        elif shareId == 4:
+            # Share4 publish
+            testMessage: test_pb2.TestMessage = test_pb2.Share4()  # type: ignore
+            try:
+                testMessage.ParseFromString(data)
+            except BaseException as e:
+                logger.error("Failed to parse message", e)
+                return
+            # Process message
+            self.welcome_text = testMessage.welcomeText
+
+        elif shareId == 5:
+            # Share5 publish
+            testMessage: test_pb2.TestMessage = test_pb2.Share5()  # type: ignore
+            try:
+                testMessage.ParseFromString(data)
+            except BaseException as e:
+                logger.error("Failed to parse message", e)
+                return
+            # Process message
+            self.float_number = testMessage.floatNumber
+            self.double_number = testMessage.doubleNumber
+            self.ip_address = testMessage.ipAddress
+            self.port_number = testMessage.portNumber
+            self.datetime_utc = testMessage.dateTime
+            self.boolean_value = testMessage.booleanValue
+
+        elif shareId == 6:
+            # Share6 publish
+            testMessage: test_pb2.TestMessage = test_pb2.Share6()  # type: ignore
+            try:
+                testMessage.ParseFromString(data)
+            except BaseException as e:
+                logger.error("Failed to parse message", e)
+                return
+            # Process message
+            self.day_of_the_week = testMessage.dayOfTheWeek
+
+        elif shareId == 7:
+            # Share7 publish
+            testMessage: test_pb2.TestMessage = test_pb2.Share7()  # type: ignore
+            try:
+                testMessage.ParseFromString(data)
+            except BaseException as e:
+                logger.error("Failed to parse message", e)
+                return
+            # Process message
+            self.calibration_table = testMessage.calibrationTable
+
+    def share_data(self, shareId: int) -> Optional[bytes]:
+        """The serialised share to answer a request with.
+
+        :param shareId: A share id
+        :type shareId: int
+        :return: The share, None if the share does not exist
+        :rtype: bytes or None
+        """
+        if shareId == 1:
+            # Share1 request
+            testMessage: test_pb2.TestMessage = test_pb2.Share1()  # type: ignore
+            testMessage.startingNumber = self.counter_start
+            testMessage.endingNumber = self.counter_end
+            testMessage.counter = self.counter
+            return bytes(testMessage.SerializeToString())
+
+        elif shareId == 2:
+            # Share2 request
+            testMessage: test_pb2.TestMessage = test_pb2.Share2()  # type: ignore
+            testMessage.frequencyInputPinId = self.frequency_input_pin_id
+            testMessage.digitalOutputPinId = self.digital_output_pin_id
+            testMessage.analogInputAPinId = self.analog_input_a_pin_id
+            testMessage.analogInputBPinId = self.analog_input_b_pin_id
+            return bytes(testMessage.SerializeToString())
+
+        elif shareId == 3:
+            # Share3 request
+            testMessage: test_pb2.TestMessage = test_pb2.Share3()  # type: ignore
+            testMessage.loopsPerSecond = int(time.perf_counter())
+            return bytes(testMessage.SerializeToString())
+
+        elif shareId == 4:
+            # Share4 request
+            testMessage: test_pb2.TestMessage = test_pb2.Share4()  # type: ignore
+            testMessage.welcomeText = self.welcome_text
+            return bytes(testMessage.SerializeToString())
+
+        elif shareId == 5:
+            # Share5 request
+            testMessage: test_pb2.TestMessage = test_pb2.Share5()  # type: ignore
+            testMessage.floatNumber = self.float_number
+            testMessage.doubleNumber = self.double_number
+            testMessage.ipAddress = self.ip_address
+            testMessage.portNumber = self.port_number
+            testMessage.dateTime = self.datetime_utc
+            testMessage.booleanValue = self.boolean_value
+            return bytes(testMessage.SerializeToString())
+
+        elif shareId == 6:
+            # Share6 request
+            testMessage: test_pb2.TestMessage = test_pb2.Share6()  # type: ignore
+            testMessage.dayOfTheWeek = self.day_of_the_week
+            return bytes(testMessage.SerializeToString())
+
+        elif shareId == 7:
+            # Share7 request
+            testMessage: test_pb2.TestMessage = test_pb2.Share7()  # type: ignore
+            testMessage.calibrationTable = self.calibration_table
+            return bytes(testMessage.SerializeToString())
+
+        return None
 
     # Get Data
     # Test Device -> Adapter
 
     def get_data(self) -> bytes:
-        if len(self.outbound_data) > 0:
-            return self.outbound_data.pop()
-        else:
+        try:
+            return self.outbound_data.get_nowait()
+        except Empty:
             return bytes(0)
 
+    @classmethod
+    def chunk_response(cls, shareId: int, token: int, offset: int, total: int, chunk: bytes) -> bytes:
+        """A serialised Chunk Response, the offset and total size of the share followed by the chunk.
+        """
+        responseMessage = cls.response_message(MessageType.SHARE, shareId, token, CHUNK_HEADER_STRUCT.pack(offset, total) + chunk)
+        responseMessage.action = transaction_pb2.TransactionMessage.SHARE_CHUNK_RESPONSE  # type: ignore
+        return bytes(responseMessage.SerializeToString())
+
     @staticmethod
     def response_message(message_type: MessageType, shareId: int, token: int, data: Optional[bytes]) -> transaction_pb2.TransactionMessage:  # type: ignore
         responseMessage = transaction_pb2.TransactionMessage()  # type: ignore
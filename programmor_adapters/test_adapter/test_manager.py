@@ -38,7 +38,7 @@ class TestManager(CommsManager):
         print(compatible_devices)
         return compatible_devices
 
-    def connect_device(self, device_id: str, callback: Callable[[str, bytes], None]) -> bool:
+    def connect_device(self, device_id: str, callback: Callable[[str, memoryview], None]) -> bool:
         if self.check_device(device_id):
             logger.debug(f"Device already connected {device_id}")
             return False
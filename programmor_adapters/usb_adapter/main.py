@@ -32,6 +32,14 @@ def main():
         default="~/.programmor/log-usb-adapter.txt"
     )
 
+    parser.add_argument(
+        "-hd",
+        "--history-directory",
+        help="The directory to record all received shares in.",
+        required=False,
+        default="~/.programmor/history-usb-adapter"
+    )
+
     parser.add_argument(
         "-l",
         "--log-level",
@@ -72,7 +80,7 @@ def main():
     comms_manager = USBManager()
 
     # Programmor Adapter API function
-    api = API(comms_manager)
+    api = API(comms_manager, history_directory=os.path.expanduser(args.history_directory))
     api.start()
 
     # Programmor Adapter Endpoints to the GUI
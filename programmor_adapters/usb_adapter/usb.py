@@ -1,9 +1,11 @@
-from typing import Optional
+from array import array
+from typing import Optional, Union
 import usb.core
 import usb.util
 import libusb_package
 
 from shared.comm import Comm
+from shared.frame import FRAME_SIZE
 from usb_adapter.helper import get_device_endpoints
 
 import logging
@@ -11,9 +13,13 @@ logger = logging.getLogger(__name__)
 
 
 class USB(Comm):
+    blocking_read = True
+    # Frames written together are sent as one transfer
+    batch_write = True
 
     def __init__(self, device_id_vender: int, device_id_product: int) -> None:
-        super().__init__()
+        # The endpoints transfer a single 64 byte frame per read
+        super().__init__(receive_buffer_frames=1)
         # Connected device
         self.device: Optional[usb.core.Device] = None
         self.device_endpoint_in: Optional[usb.core.Endpoint] = None
@@ -34,17 +40,33 @@ class USB(Comm):
             return bytes(0)
         try:
             if self.device_endpoint_in is not None:
-                return bytes(self.device_endpoint_in.read(64, 1))
+                return bytes(self.device_endpoint_in.read(64, self.read_timeout_ms))
             else:
                 return bytes(0)
         except Exception:
             return bytes(0)
 
-    def write(self, buffer: bytes) -> None:
+    def read_into(self, buffer: "array[int]") -> int:
+        # Read straight into the receive buffer, avoiding a copy per frame
+        if self.device is None or self.device_endpoint_in is None:
+            # Wait as a read would while not connected
+            self.stop_event.wait(self.read_timeout_ms / 1000)
+            return 0
+        try:
+            return int(self.device_endpoint_in.read(buffer, self.read_timeout_ms))
+        except usb.core.USBTimeoutError:
+            return 0
+        except Exception:
+            # Avoid spinning on a failing device
+            self.stop_event.wait(self.read_timeout_ms / 1000)
+            return 0
+
+    def write(self, buffer: Union[bytes, memoryview]) -> None:
         if len(buffer) > 0 and self.device is None:
             return  # Not connected to device
         if self.device_endpoint_out is not None:
-            self.device_endpoint_out.write(bytes(buffer), 1)
+            # One bulk transfer for all frames, allowing 1ms per frame
+            self.device_endpoint_out.write(buffer, max(1, len(buffer) // FRAME_SIZE))
 
     def connect(self) -> bool:
         self.device: Optional[usb.core.Device] = libusb_package.find(idVendor=self.device_id_vender, idProduct=self.device_id_product)  # type: ignore
@@ -1,5 +1,5 @@
 import hashlib
-from typing import List, Dict, Callable, Tuple
+from typing import List, Dict, Callable, Hashable, Optional, Tuple
 from shared.comms_manager import CommsManager
 from shared.frame import Frame, BytesLengthError
 from usb_adapter.helper import get_device_endpoints
@@ -23,6 +23,8 @@ class USBManager(CommsManager):
 
         # Device Id to path lookup
         self.device_vender_product_lookup: Dict[str, Tuple[int, int]] = dict()
+        # Device Id to USB bus and address, a device plugged in again gets a new address
+        self.device_bus_address_lookup: Dict[str, Tuple[int, int]] = dict()
 
     def get_device_id_from_vender_product(self, vender_id: int, product_id: int) -> str | None:
         for device_id, (device_vender_id, device_product_id) in self.device_vender_product_lookup.items():
@@ -53,6 +55,7 @@ class USBManager(CommsManager):
             if device_id:
                 if self.check_device(device_id):
                     # Found!, don't disrupt the connected device
+                    self.device_bus_address_lookup[device_id] = (dev.bus, dev.address)
                     compatible_devices.append(device_id)
                     continue
             # Get device configuration
@@ -96,13 +99,17 @@ class USBManager(CommsManager):
             logger.debug(f"Found device vender {dev.idVendor} product {dev.idProduct}")
             device_id = hashlib.md5(f"{dev.idVendor}{dev.idProduct}".encode(ENCODE)).hexdigest()
             self.device_vender_product_lookup[device_id] = (dev.idVendor, dev.idProduct)
+            self.device_bus_address_lookup[device_id] = (dev.bus, dev.address)
             compatible_devices.append(device_id)
             # dev.reset()
             usb.util.dispose_resources(dev)
 
         return compatible_devices
 
-    def connect_device(self, device_id: str, callback: Callable[[str, bytes], None]) -> bool:
+    def get_device_instance(self, device_id: str) -> Optional[Hashable]:
+        return self.device_bus_address_lookup.get(device_id)
+
+    def connect_device(self, device_id: str, callback: Callable[[str, memoryview], None]) -> bool:
         if self.check_device(device_id):
             logger.debug(f"Device already connected {device_id}")
             return False
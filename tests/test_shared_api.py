@@ -0,0 +1,509 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+from programmor_adapters.shared.api import API
+from programmor_adapters.shared.clock import VirtualClock
+from programmor_adapters.shared.transaction_codec import Capability
+from programmor_adapters.shared.types import MessageType
+import programmor_adapters.test_adapter.test_manager as test_manager
+import programmor_adapters.test_adapter.proto.test_pb2 as test_pb2
+
+DEVICE_ID = "fakeusb-janmoo1"
+
+
+@pytest.fixture
+def api(tmp_path):
+    api = API(test_manager.TestManager(1), history_directory=str(tmp_path / "history"))
+    api.start()
+    assert api.connect_device(DEVICE_ID) is True
+    yield api
+    api.disconnect_all_devices()
+    api.stop()
+    api.join()
+
+
+def wait_for_capabilities(api, device_id: str) -> None:
+    for _ in range(100):
+        if device_id in api.capabilities:
+            return
+        time.sleep(0.01)
+
+
+def test_request_message_sync(api):
+    share = test_pb2.Share2()
+    share.ParseFromString(api.request_message_sync(DEVICE_ID, MessageType.SHARE, 2))
+    assert share.frequencyInputPinId == 101
+
+
+def test_request_message_sync_concurrent(api):
+    def request(share_id: int) -> bytes:
+        return api.request_message_sync(DEVICE_ID, MessageType.SHARE, share_id)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(request, [2, 6] * 8))
+    expected_share2 = test_pb2.Share2(frequencyInputPinId=101, digitalOutputPinId=102, analogInputAPinId=103, analogInputBPinId=104)
+    expected_share6 = test_pb2.Share6(dayOfTheWeek=1)
+    assert responses == [expected_share2.SerializeToString(), expected_share6.SerializeToString()] * 8
+    assert len(api.pending_requests) == 0
+
+
+def test_request_message_future_ignores_unrelated_messages(api):
+    received = threading.Event()
+    api.register_callback(lambda _: received.set())
+    # A scheduled share arriving is not the response
+    future = api.request_message_future(DEVICE_ID, MessageType.SHARE, 6)
+    api.request_message(DEVICE_ID, MessageType.SHARE, 2)
+    assert received.wait(1)
+    assert test_pb2.Share6.FromString(future.result(1)).dayOfTheWeek == 1
+
+
+def test_requests_dropped_while_device_does_not_answer(tmp_path):
+    manager = test_manager.TestManager(1)
+    manager.devices[0].process_data = lambda data: None
+    api = API(manager, history_directory=str(tmp_path / "history"), window_depth=1, window_queue_capacity=2)
+    try:
+        assert api.connect_device(DEVICE_ID) is True
+        futures = [api.request_message_future(DEVICE_ID, MessageType.SHARE, 2) for _ in range(4)]
+        # The oldest waiting requests are dropped instead of piling up
+        assert [future.cancelled() for future in futures] == [True, True, False, False]
+        assert api.get_window(DEVICE_ID).stats()["dropped"] == 2
+        assert len(api.pending_requests) == 3
+    finally:
+        api.disconnect_all_devices()
+
+
+def test_request_message_future_cancel(api):
+    future = api.request_message_future(DEVICE_ID, MessageType.SHARE, 2)
+    future.cancel()
+    # The Common1 read by the connect may still be pending
+    assert future not in api.pending_requests.values()
+    assert api.request_message_sync("unknown-device", MessageType.SHARE, 2) == bytes(0)
+
+
+def test_scheduled_message(api):
+    received = list()
+    done = threading.Event()
+
+    def on_response(response):
+        received.append(response["shareId"])
+        if len(received) == 3:
+            done.set()
+
+    api.register_callback(on_response)
+    api.set_scheduled_message(DEVICE_ID, MessageType.SHARE, 2, 20)
+    assert done.wait(1) is True
+    api.clear_all_schedules(DEVICE_ID)
+    assert len(api.scheduler) == 0
+    assert received[0:3] == [2, 2, 2]
+
+
+def test_request_message_transaction_stats(api):
+    done = threading.Event()
+    api.register_callback(lambda _: done.set())
+    api.request_message(DEVICE_ID, MessageType.SHARE, 2)
+    assert done.wait(1) is True
+    stats = api.get_transaction_stats(DEVICE_ID)[DEVICE_ID]
+    assert stats["completed"] == 1
+    assert stats["outstanding"] == 0
+
+
+def test_compact_requests_negotiated(api):
+    wait_for_capabilities(api, DEVICE_ID)
+    assert api.has_capability(DEVICE_ID, Capability.COMPACT_REQUESTS)
+    share = test_pb2.Share6.FromString(api.request_message_sync(DEVICE_ID, MessageType.SHARE, 6))
+    assert share.dayOfTheWeek == 1
+    # A compact request is a single frame
+    assert len(api._request_bytes(DEVICE_ID, MessageType.SHARE, 6, 1)) <= 50
+
+
+@pytest.fixture
+def api_without_capabilities(tmp_path):
+    manager = test_manager.TestManager(1)
+    manager.get_test_device(DEVICE_ID).capabilities = Capability.NO_CAPABILITIES
+    api = API(manager, history_directory=str(tmp_path / "history"))
+    api.start()
+    assert api.connect_device(DEVICE_ID) is True
+    wait_for_capabilities(api, DEVICE_ID)
+    yield api
+    api.disconnect_all_devices()
+    api.stop()
+    api.join()
+
+
+def test_full_requests_without_capability(api_without_capabilities):
+    api = api_without_capabilities
+    assert api.get_capabilities(DEVICE_ID) == Capability.NO_CAPABILITIES
+    assert len(api._request_bytes(DEVICE_ID, MessageType.SHARE, 6, 1)) == 99
+    assert test_pb2.Share6.FromString(api.request_message_sync(DEVICE_ID, MessageType.SHARE, 6)).dayOfTheWeek == 1
+    # Disconnecting forgets the capabilities
+    api.disconnect_device(DEVICE_ID)
+    assert DEVICE_ID not in api.capabilities
+
+
+def expected_shares():
+    return {2: test_pb2.Share2(frequencyInputPinId=101, digitalOutputPinId=102, analogInputAPinId=103, analogInputBPinId=104).SerializeToString(),
+            4: test_pb2.Share4(welcomeText="Hello there!").SerializeToString(),
+            6: test_pb2.Share6(dayOfTheWeek=1).SerializeToString()}
+
+
+def test_request_many(api):
+    wait_for_capabilities(api, DEVICE_ID)
+    assert api.has_capability(DEVICE_ID, Capability.BATCH_REQUESTS)
+    received = list()
+    api.register_callback(received.append)
+    # Unknown shares are answered with empty data
+    assert api.request_many(DEVICE_ID, [6, 2, 4, 99]).result(1) == {**expected_shares(), 99: b""}
+    assert list(api.request_many(DEVICE_ID, [4, 2, 6]).result(1).keys()) == [4, 2, 6]
+    assert len(api.pending_batches) == 0
+    assert api.get_window(DEVICE_ID).stats()["in_flight"] == 0
+    # Batch responses are not passed to the callbacks
+    assert received == []
+
+
+def test_request_many_without_capability(api_without_capabilities):
+    api = api_without_capabilities
+    assert api.request_many(DEVICE_ID, [6, 2, 4]).result(1) == expected_shares()
+    assert len(api.pending_requests) == 0
+    # An unknown share is never answered
+    future = api.request_many(DEVICE_ID, [2, 99])
+    future.cancel()
+    assert len(api.pending_requests) == 0
+    assert api.request_many("unknown-device", [2]) is None
+
+
+def wait_for_notifications(api, count: int) -> None:
+    for _ in range(200):
+        stats = api.get_subscription_stats(DEVICE_ID)
+        if len(stats) > 0 and stats[0]["received"] >= count:
+            return
+        time.sleep(0.01)
+
+
+def test_subscribe(api):
+    wait_for_capabilities(api, DEVICE_ID)
+    received = list()
+    api.register_callback(received.append)
+    assert api.subscribe(DEVICE_ID, 6, 10) is True
+    wait_for_notifications(api, 3)
+    # Lose two notifications
+    api.comms_manager.get_test_device(DEVICE_ID).subscriptions[6].sequence += 2
+    wait_for_notifications(api, 5)
+    stats = api.get_subscription_stats(DEVICE_ID)[0]
+    assert (stats["mode"], stats["lost"], stats["duplicates"]) == ("push", 2, 0)
+    assert len(api.scheduler) == 0
+    # Notifications are passed on as share responses
+    assert {(response["actionType"], response["shareId"]) for response in received} == {(6, 6)}
+    assert api.unsubscribe(DEVICE_ID, 6) is True
+    assert api.unsubscribe(DEVICE_ID, 6) is False
+    time.sleep(0.05)
+    assert api.comms_manager.get_test_device(DEVICE_ID).subscriptions == dict()
+
+
+def test_subscription_resent_after_reconnect(api):
+    wait_for_capabilities(api, DEVICE_ID)
+    device = api.comms_manager.get_test_device(DEVICE_ID)
+    assert api.subscribe(DEVICE_ID, 6, 10) is True
+    wait_for_notifications(api, 3)
+    assert api.disconnect_device(DEVICE_ID) is True
+    assert api.get_subscription_stats(DEVICE_ID)[0]["active"] is False
+    # The device forgets its subscriptions with the connection
+    device.subscriptions.clear()
+    received = api.get_subscription_stats(DEVICE_ID)[0]["received"]
+    assert api.connect_device(DEVICE_ID) is True
+    wait_for_notifications(api, received + 3)
+    stats = api.get_subscription_stats(DEVICE_ID)[0]
+    assert stats["active"] is True and stats["received"] >= received + 3
+    assert 6 in device.subscriptions
+    # Only an unsubscribe drops the subscription
+    assert api.unsubscribe(DEVICE_ID, 6) is True
+    assert api.get_subscription_stats(DEVICE_ID) == []
+
+
+def test_subscribe_polls_without_capability(api_without_capabilities):
+    api = api_without_capabilities
+    received = threading.Event()
+    api.register_callback(lambda response: received.set())
+    assert api.subscribe(DEVICE_ID, 6, 10) is True
+    assert received.wait(1)
+    assert api.get_subscription_stats(DEVICE_ID)[0]["mode"] == "poll"
+    assert len(api.scheduler) == 1
+    assert api.unsubscribe(DEVICE_ID, 6) is True
+    assert len(api.scheduler) == 0
+    assert api.subscribe("unknown-device", 6, 10) is False
+
+
+def test_subscription_renewed_after_device_restart(tmp_path):
+    clock = VirtualClock()
+    manager = test_manager.TestManager(1)
+    api = API(manager, history_directory=str(tmp_path / "history"), clock=clock)
+    try:
+        assert api.connect_device(DEVICE_ID) is True
+        wait_for_capabilities(api, DEVICE_ID)
+        device = manager.get_test_device(DEVICE_ID)
+        api.subscribe(DEVICE_ID, 6, 10)
+        for _ in range(100):
+            if 6 in device.subscriptions:
+                break
+            time.sleep(0.01)
+        # The device restarts and forgets the subscription
+        device.subscriptions.clear()
+        clock.advance(0.5)
+        assert api._process_subscriptions() == 0.5
+        clock.advance(0.5)
+        api._process_subscriptions()
+        assert api.get_subscription_stats(DEVICE_ID)[0]["resubscribes"] == 1
+        for _ in range(100):
+            if 6 in device.subscriptions:
+                break
+            time.sleep(0.01)
+        assert 6 in device.subscriptions
+    finally:
+        api.disconnect_all_devices()
+
+
+def test_read_share(api):
+    wait_for_capabilities(api, DEVICE_ID)
+    progress = list()
+    transfer = api.read_share(DEVICE_ID, 7, lambda transfer: progress.append(transfer.bytes_done))
+    share = test_pb2.Share7.FromString(transfer.future.result(2))
+    assert share.calibrationTable == api.comms_manager.get_test_device(DEVICE_ID).calibration_table
+    # Progress is reported for every chunk
+    assert len(progress) == transfer.chunk_count == transfer.chunks
+    assert progress[-1] == transfer.total
+    stats = transfer.to_dict(api.clock.now_ns())
+    assert (stats["state"], stats["progress"], stats["resent"]) == ("complete", 1, 0)
+    assert stats["throughputBps"] > 0
+    assert len(api.pending_chunks) == 0 and len(api.transfers) == 0
+    assert api.read_share("unknown-device", 7) is None
+
+
+def test_write_share(api):
+    wait_for_capabilities(api, DEVICE_ID)
+    device = api.comms_manager.get_test_device(DEVICE_ID)
+    table = bytes(range(255, -1, -1)) * 8
+    transfer = api.write_share(DEVICE_ID, 7, test_pb2.Share7(calibrationTable=table).SerializeToString())
+    transfer.future.result(2)
+    assert device.calibration_table == table
+    # Publishing a share larger than a message writes it in chunks
+    api.publish_message(DEVICE_ID, MessageType.SHARE, 7, test_pb2.Share7(calibrationTable=table[0:1000]).SerializeToString())
+    for _ in range(100):
+        if device.calibration_table == table[0:1000]:
+            break
+        time.sleep(0.01)
+    assert device.calibration_table == table[0:1000]
+
+
+def test_read_share_without_capability(api_without_capabilities):
+    api = api_without_capabilities
+    assert api.read_share(DEVICE_ID, 7) is None
+    # Shares larger than a message are not published instead of being sent empty
+    device = api.comms_manager.get_test_device(DEVICE_ID)
+    api.publish_message(DEVICE_ID, MessageType.SHARE, 7, test_pb2.Share7(calibrationTable=bytes(100)).SerializeToString())
+    assert len(device.calibration_table) == 4096
+
+
+def test_resume_transfer(tmp_path):
+    api = API(test_manager.TestManager(1), history_directory=str(tmp_path / "history"), transaction_timeout_s=0.05)
+    api.start()
+    try:
+        assert api.connect_device(DEVICE_ID) is True
+        wait_for_capabilities(api, DEVICE_ID)
+        device = api.comms_manager.get_test_device(DEVICE_ID)
+
+        # The device stops answering part way through the read
+        def on_progress(transfer):
+            if transfer.chunks == 10:
+                device.capabilities &= ~Capability.STREAMING
+
+        transfer = api.read_share(DEVICE_ID, 7, on_progress)
+        assert transfer.future.exception(2) is not None
+        assert transfer.to_dict(api.clock.now_ns())["state"] == "failed"
+        assert 10 <= transfer.chunks < transfer.chunk_count
+        device.capabilities |= Capability.STREAMING
+        # Resume once the unanswered chunks have left the request window
+        for _ in range(100):
+            if api.get_window(DEVICE_ID).stats()["in_flight"] == 0:
+                break
+            time.sleep(0.01)
+        # Only the missing chunks are read again
+        assert api.resume_transfer(transfer) is True
+        assert test_pb2.Share7.FromString(transfer.future.result(2)).calibrationTable == device.calibration_table
+        assert transfer.chunks == transfer.chunk_count
+        assert transfer.resumes == 1
+        assert api.resume_transfer(transfer) is False
+    finally:
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+
+
+def test_received_shares_recorded(api):
+    start = datetime.now()
+    api.request_message_sync(DEVICE_ID, MessageType.SHARE, 2)
+    api.request_message_sync(DEVICE_ID, MessageType.SHARE, 6)
+    shares = api.get_shares(DEVICE_ID, start, datetime.now(), 2)
+    assert [test_pb2.Share2.FromString(share).frequencyInputPinId for share in shares] == [101]
+    assert api.get_shares(DEVICE_ID, start - timedelta(hours=1), start, 2) == []
+
+
+def test_no_history_without_a_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    api = API(test_manager.TestManager(1))
+    api.start()
+    try:
+        assert api.connect_device(DEVICE_ID) is True
+        start = datetime.now()
+        api.request_message_sync(DEVICE_ID, MessageType.SHARE, 2)
+        assert api.get_shares(DEVICE_ID, start, datetime.now(), 2) == []
+        # Recent shares are kept in memory regardless
+        assert len(api.get_recent_shares(DEVICE_ID, 2, 60)) == 1
+    finally:
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_recent_shares(api):
+    api.request_message_sync(DEVICE_ID, MessageType.SHARE, 2)
+    api.request_message_sync(DEVICE_ID, MessageType.SHARE, 2)
+    shares = api.get_recent_shares(DEVICE_ID, 2, 60)
+    assert [test_pb2.Share2.FromString(data).frequencyInputPinId for _, data in shares] == [101, 101]
+    assert len(api.get_recent_shares(DEVICE_ID, 2, 60, width=1)) == 1
+
+
+def test_reads_answered_from_cache(api):
+    share = api.request_message_sync(DEVICE_ID, MessageType.SHARE, 2)
+    assert api.request_message_sync(DEVICE_ID, MessageType.SHARE, 2, max_age_ms=60000) == share
+    assert api.get_cache_stats()["hits"] == 1
+    # A write invalidates the cached share
+    api.publish_message(DEVICE_ID, MessageType.SHARE, 2, share)
+    assert api.request_message_sync(DEVICE_ID, MessageType.SHARE, 2, max_age_ms=60000) == share
+    assert api.get_cache_stats()["misses"] == 1 and api.get_cache_stats()["invalidations"] == 1
+    # The Common1 read on connect answers the device listing
+    wait_for_capabilities(api, DEVICE_ID)
+    transactions = api.get_transaction_stats(DEVICE_ID)
+    assert DEVICE_ID in [device["deviceId"] for device in api.get_devices_detailed(max_age_ms=60000)]
+    assert api.get_transaction_stats(DEVICE_ID) == transactions
+
+
+def test_response_requested_before_a_publish_not_cached(api):
+    wait_for_capabilities(api, DEVICE_ID)
+    device = api.comms_manager.get_test_device(DEVICE_ID)
+    process_data = device.process_data
+    held = list()
+    device.process_data = held.append
+    future = api.request_message_future(DEVICE_ID, MessageType.SHARE, 2)
+    for _ in range(100):
+        if len(held) > 0:
+            break
+        time.sleep(0.01)
+    # The response to the earlier request arrives after the publish
+    api.publish_message(DEVICE_ID, MessageType.SHARE, 2, test_pb2.Share2(frequencyInputPinId=5).SerializeToString())
+    device.process_data = process_data
+    for data in held:
+        process_data(data)
+    future.result(1)
+    assert api.get_cache_stats()["stale"] == 1
+    assert api._cached(DEVICE_ID, MessageType.SHARE, 2, 60000) is None
+
+
+def test_devices_detailed_with_unresponsive_device(tmp_path):
+    manager = test_manager.TestManager(1)
+    # The second device never answers
+    manager.devices[1].process_data = lambda data: None
+    api = API(manager, history_directory=str(tmp_path / "history"))
+    api.start()
+    try:
+        reported = list()
+        start = time.perf_counter()
+        devices = api.get_devices_detailed(timeout_s=0.3, on_device=lambda device: reported.append((device, time.perf_counter() - start)))
+        duration = time.perf_counter() - start
+        assert [device["deviceId"] for device in devices] == [DEVICE_ID]
+        # The answering device is reported without waiting for the deadline
+        [(device, reported_s)] = reported
+        assert device == devices[0] and device["connected"] is False
+        assert reported_s < 0.2 and 0.3 <= duration < 0.6
+        assert not api.check_device(DEVICE_ID)
+    finally:
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+
+
+def test_devices_detailed_leaves_devices_connected_after_the_listing(tmp_path):
+    manager = test_manager.TestManager(1)
+    manager.devices[1].process_data = lambda data: None
+    silent_id = manager.get_devices()[1]
+    api = API(manager, history_directory=str(tmp_path / "history"))
+    api.start()
+    try:
+        api.get_devices_detailed(timeout_s=0.2)
+        assert not api.check_device(silent_id)
+        # Connected by a caller as soon as the listing returned, the late probe leaves it alone
+        assert api.connect_device(silent_id) is True
+        api.set_scheduled_message(silent_id, MessageType.SHARE, 2, 100)
+        time.sleep(0.3)
+        assert api.check_device(silent_id)
+        assert len(api.get_schedule_stats(silent_id)) == 1
+    finally:
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+
+
+def test_devices_listed_from_identities(tmp_path):
+    manager = test_manager.TestManager(1)
+    connects = list()
+    connect_device = manager.connect_device
+    manager.connect_device = lambda device_id, callback: connects.append(device_id) or connect_device(device_id, callback)
+    api = API(manager, history_directory=str(tmp_path / "history"))
+    api.start()
+    try:
+        first = api.get_devices_detailed()
+        assert len(first) == 2 and len(connects) == 2
+        # Listed without connecting
+        assert api.get_devices_detailed() == first
+        assert len(connects) == 2 and api.get_identity_stats()["hits"] == 2
+        # A reconnect reads the identity again, a new firmware version is noticed
+        manager.devices[0].firmware_version += 1
+        assert api.connect_device(DEVICE_ID) is True
+        for _ in range(100):
+            if api.get_identity_stats()["firmwareChanges"] == 1:
+                break
+            time.sleep(0.01)
+        assert api.get_identity_stats()["firmwareChanges"] == 1
+        # An unplugged device is forgotten
+        unplugged = manager.devices.pop(1)
+        assert [device["deviceId"] for device in api.get_devices_detailed()] == [DEVICE_ID]
+        assert unplugged.device_id not in api.identities.identities
+    finally:
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+
+
+def test_devices_detailed_refresh_reads_cached_devices(tmp_path):
+    manager = test_manager.TestManager(1)
+    connects = list()
+    connect_device = manager.connect_device
+    manager.connect_device = lambda device_id, callback: connects.append(device_id) or connect_device(device_id, callback)
+    api = API(manager, history_directory=str(tmp_path / "history"))
+    api.start()
+    try:
+        first = api.get_devices_detailed()
+        assert len(connects) == 2
+        # Changed while its identity is cached
+        manager.devices[0].firmware_version += 1
+        assert api.get_devices_detailed() == first
+        refreshed = api.get_devices_detailed(refresh=True)
+        assert len(connects) == 4 and refreshed != first
+        assert api.get_identity_stats()["firmwareChanges"] == 1
+    finally:
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
@@ -0,0 +1,35 @@
+from concurrent.futures import Future
+
+from programmor_adapters.shared.batch import BATCH_MAX_SHARES, BatchRequest
+
+
+def test_batch_resolves_in_requested_order():
+    batch = BatchRequest([6, 2, 6, 4])
+    assert batch.share_ids == [6, 2, 4]
+    assert batch.add(2, b"2") is False
+    # Unknown and repeated shares are ignored
+    assert batch.add(5, b"5") is False
+    assert batch.add(2, b"x") is False
+    assert batch.add(4, b"4") is False
+    assert batch.future.done() is False
+    assert batch.add(6, b"6") is True
+    assert list(batch.future.result(0).items()) == [(6, b"6"), (2, b"2"), (4, b"4")]
+
+
+def test_batch_chunks():
+    batch = BatchRequest(range(BATCH_MAX_SHARES * 2 + 1))
+    assert [len(chunk) for chunk in batch.chunks()] == [BATCH_MAX_SHARES, BATCH_MAX_SHARES, 1]
+    assert BatchRequest([]).future.result(0) == dict()
+
+
+def test_batch_cancel():
+    batch = BatchRequest([1, 2])
+    batch.future.cancel()
+    assert batch.add(1, b"1") is False
+    assert batch.add(2, b"2") is False
+    # A share requested on its own that is not answered cancels the batch
+    batch = BatchRequest([1, 2])
+    share = Future()
+    share.cancel()
+    batch.add_future(1, share)
+    assert batch.future.cancelled()
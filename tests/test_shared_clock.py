@@ -0,0 +1,23 @@
+import pytest
+
+from programmor_adapters.shared.clock import Clock, VirtualClock, ms_to_ns, ns_to_s, s_to_ns
+
+
+def test_clock_is_monotonic():
+    clock = Clock()
+    first = clock.now_ns()
+    assert isinstance(first, int)
+    assert clock.now_ns() >= first
+
+
+def test_virtual_clock_moves_only_when_told():
+    clock = VirtualClock(start_s=1)
+    assert clock.now_ns() == s_to_ns(1)
+    assert clock.now_ns() == clock.now_ns()
+    clock.advance(0.25)
+    assert clock.now_s() == 1.25
+    clock.set_ns(clock.now_ns() + ms_to_ns(750))
+    assert ns_to_s(clock.now_ns()) == 2
+
+    with pytest.raises(ValueError):
+        clock.set(1)
@@ -0,0 +1,75 @@
+from programmor_adapters.shared.flow_control import RequestWindow
+from programmor_adapters.shared.queues import MessagePriority
+from programmor_adapters.shared.clock import VirtualClock, ms_to_ns
+
+
+def test_window_limits_requests_in_flight():
+    sent = list()
+    window = RequestWindow(lambda message_bytes, _: sent.append(message_bytes), depth=2, max_depth=2)
+    for token in range(4):
+        window.submit(token, bytes([token]))
+    assert sent == [bytes([0]), bytes([1])]
+    assert window.stats()["queued"] == 2
+    # A response releases the next request
+    assert window.complete(0) is True
+    assert sent == [bytes([0]), bytes([1]), bytes([2])]
+    # Unknown tokens do not release requests
+    assert window.complete(10) is False
+    assert len(sent) == 3
+
+
+def test_window_grows_after_full_window_of_responses():
+    window = RequestWindow(lambda *_: None, depth=2, max_depth=3)
+    for token in range(2):
+        window.submit(token, bytes(0))
+    window.complete(0)
+    window.complete(1)
+    assert window.depth == 3
+
+
+def test_window_times_out_requests_and_shrinks():
+    clock = VirtualClock()
+    sent = list()
+    window = RequestWindow(lambda message_bytes, _: sent.append(message_bytes), depth=4, timeout_s=0.5, clock=clock)
+    for token in range(6):
+        window.submit(token, bytes([token]))
+    assert len(sent) == 4
+    assert window.next_deadline() == ms_to_ns(500)
+    clock.set(0.6)
+    assert window.expire() == 4
+    assert window.depth == 2
+    assert window.timeouts == 4
+    # The queued requests are released into the smaller window
+    assert sent[4:] == [bytes([4]), bytes([5])]
+    assert window.stats()["in_flight"] == 2
+
+
+def test_window_releases_by_priority_and_drops_superseded_polls():
+    sent = list()
+    window = RequestWindow(lambda message_bytes, priority: sent.append((message_bytes, priority)), depth=1, max_depth=1)
+    window.submit(1, b"a")
+    window.submit(2, b"poll", MessagePriority.POLL, key=7)
+    window.submit(3, b"b")
+    # Superseded while waiting for room in the window
+    assert window.submit(4, b"poll again", MessagePriority.POLL, key=7) == 2
+
+    for token in (1, 3, 4):
+        window.complete(token)
+    assert sent == [(b"a", MessagePriority.REQUEST), (b"b", MessagePriority.REQUEST), (b"poll again", MessagePriority.POLL)]
+    assert window.stats()["in_flight"] == 0
+
+
+def test_window_queue_drops_beyond_capacity():
+    sent = list()
+    window = RequestWindow(lambda message_bytes, _: sent.append(message_bytes), depth=1, max_depth=1, queue_capacity=2)
+    assert window.submit(0, b"a") is None
+    window.submit(1, b"poll", MessagePriority.POLL)
+    window.submit(2, b"b")
+    # Full, the oldest of the lowest class is dropped
+    assert window.submit(3, b"c") == 1
+    # A poll is not queued ahead of requests
+    assert window.submit(4, b"poll again", MessagePriority.POLL) == 4
+    assert window.stats()["dropped"] == 2 and window.stats()["queued"] == 2
+    for token in (0, 2, 3):
+        window.complete(token)
+    assert sent == [b"a", b"b", b"c"]
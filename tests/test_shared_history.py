@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from programmor_adapters.shared.history import RECORD_DATA_SIZE, RECORD_SIZE, ShareHistory
+
+
+def test_range_query(tmp_path):
+    history = ShareHistory(str(tmp_path))
+    for i in range(100):
+        history.append("device", 2, bytes([i]), 1000 + i * 10)
+        history.append("device", 3, bytes([i, i]), 1000 + i * 10)
+    history.append("other/device", 2, b"other", 1000)
+    # Both ends of the range are included
+    assert history.query("device", 2, 1100, 1130) == [(1100, bytes([10])), (1110, bytes([11])), (1120, bytes([12])), (1130, bytes([13]))]
+    assert [data for _, data in history.query("device", 3, 1985, 5000)] == [bytes([99, 99])]
+    assert history.query("other/device", 2, 0, 5000) == [(1000, b"other")]
+    assert history.query("device", 2, 5000, 6000) == []
+    assert history.query("device", 4, 0, 6000) == []
+    with pytest.raises(ValueError):
+        history.append("device", 2, bytes(RECORD_DATA_SIZE + 1), 3000)
+
+
+def test_segments_rotate(tmp_path):
+    history = ShareHistory(str(tmp_path), segment_records=10, retained_segments=3)
+    for i in range(45):
+        history.append("device", 2, bytes([i]), i)
+    [stats] = history.stats()
+    assert stats["segments"] == 3 and stats["appended"] == 45
+    # The oldest segments were deleted, ranges across segments are joined
+    assert [data[0] for _, data in history.query("device", 2, 0, 100)] == list(range(20, 45))
+    assert [data[0] for _, data in history.query("device", 2, 28, 31)] == [28, 29, 30, 31]
+
+
+def test_time_going_back_keeps_order(tmp_path):
+    history = ShareHistory(str(tmp_path))
+    history.append("device", 2, b"a", 100)
+    history.append("device", 2, b"b", 50)
+    history.append("device", 2, b"c", 150)
+    assert history.query("device", 2, 0, 200) == [(100, b"a"), (100, b"b"), (150, b"c")]
+
+
+def test_reopened_history(tmp_path):
+    history = ShareHistory(str(tmp_path), segment_records=4)
+    for i in range(6):
+        history.append("device", 2, bytes([i]), i)
+    history.close()
+    # A partly written record at the end of the last segment is dropped
+    [stream] = history.streams.values()
+    with open(stream._path(stream.segments[-1]), "ab") as file:
+        file.write(bytes(RECORD_SIZE // 2))
+    reopened = ShareHistory(str(tmp_path), segment_records=4)
+    assert [data[0] for _, data in reopened.query("device", 2, 0, 10)] == list(range(6))
+    # Appends continue the last segment
+    reopened.append("device", 2, bytes([6]), 6)
+    reopened.close()
+    [stream] = reopened.streams.values()
+    assert os.path.getsize(stream._path(stream.segments[-1])) == 3 * RECORD_SIZE
+    assert [data[0] for _, data in reopened.query("device", 2, 0, 10)] == list(range(7))
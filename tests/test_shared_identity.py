@@ -0,0 +1,31 @@
+from programmor_adapters.shared.identity import IdentityCache
+
+
+def test_identity_kept_per_instance():
+    identities = IdentityCache()
+    assert identities.get("device", (1, 4)) is None
+    assert identities.update("device", (1, 4), 1, b"common") is False
+    assert identities.get("device", (1, 4)) == b"common"
+    # Plugged in again at another address
+    assert identities.get("device", (1, 5)) is None
+    assert identities.get("device", (1, 4)) is None
+    assert identities.stats() == {"entries": 0, "hits": 1, "misses": 3, "invalidations": 1, "firmwareChanges": 0}
+
+
+def test_firmware_change_seen_across_reconnects():
+    identities = IdentityCache()
+    identities.update("device", None, 1, b"common")
+    identities.invalidate("device")
+    assert identities.update("device", None, 1, b"common") is False
+    identities.invalidate("device")
+    assert identities.update("device", None, 2, b"new common") is True
+    assert identities.get("device", None) == b"new common"
+
+
+def test_unplugged_devices_forgotten():
+    identities = IdentityCache()
+    identities.update("first", None, 1, b"first")
+    identities.update("second", None, 1, b"second")
+    identities.retain(["second"])
+    assert identities.get("first", None) is None
+    assert identities.get("second", None) == b"second"
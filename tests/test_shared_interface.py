@@ -1,6 +1,9 @@
+import pytest
 from time import sleep
 
-from programmor_adapters.shared.comm import Comm, Frame, FRAME_PAYLOAD_SIZE, ProcessState
+from programmor_adapters.shared.comm import Comm, Frame, FramedMessage, FRAME_PAYLOAD_SIZE, ProcessState
+from programmor_adapters.shared.frame import FRAME_SIZE, FrameView, encode_many, decode_many
+from programmor_adapters.shared.request_template import RequestTemplate
 
 
 # Fake comms interface
@@ -119,6 +122,25 @@ def test_comms_read_multiple_frames():
     assert com.lastMessage == bytes([x for x in range(0, FRAME_PAYLOAD_SIZE*3)])
 
 
+def test_comms_read_more_frames_than_the_receive_buffer():
+    received = list()
+    com = Connection()
+    com.set_received_message_callback(lambda message: received.append(bytes(message)))
+    # Twelve single frame messages in one read, the receive buffer holds eight
+    for index in range(12):
+        in_data = generate_frame(index, index + 1)
+        in_data.frameId = index
+        com.incoming_buffer.extend(in_data.to_bytes())
+    assert len(com.incoming_buffer) > len(com.receive_buffer)
+    assert com.process_incoming_frames() == ProcessState.OK
+    assert len(received) == 8
+    # The rest is processed on the next pass before reading again
+    com.incoming_buffer = bytearray()
+    assert com.process_incoming_frames() == ProcessState.OK
+    assert [message[0] for message in received] == list(range(12))
+    assert com.process_incoming_frames() == ProcessState.ERROR
+
+
 def test_comms_read_multiple_frames_out_of_order():
     # Call back on successful message
     def on_received_message(message: bytes):
@@ -197,3 +219,141 @@ def test_comms_threading():
 
     # Stop thread
     com.stop()
+
+
+def test_frame_encode_many_then_decode_many():
+    frames = list()
+    for i in range(3):
+        frame = generate_frame(i, FRAME_PAYLOAD_SIZE - i)
+        frame.frameId = 7
+        frame.frameOrder = i+1
+        frame.frameTotal = 3
+        frames.append(frame)
+    # Encode into one contiguous buffer
+    buffer = encode_many(frames)
+    assert len(buffer) == FRAME_SIZE*3
+    assert buffer[FRAME_SIZE:FRAME_SIZE*2] == frames[1].to_bytes()
+    # Decode back into frames
+    decoded = decode_many(buffer)
+    assert len(decoded) == 3
+    for frame, from_frame in zip(frames, decoded):
+        assert from_frame.is_valid() is True
+        assert from_frame.frameOrder == frame.frameOrder
+        assert from_frame.payload == bytes(frame.payload) + bytes(FRAME_PAYLOAD_SIZE-len(frame.payload))
+
+
+def test_frame_payload_too_large():
+    frame = Frame()
+    frame.payload = bytes(FRAME_PAYLOAD_SIZE+1)
+    with pytest.raises(Exception, match="Expected a payload size"):
+        frame.to_bytes()
+    with pytest.raises(Exception, match="Expected a bytes size"):
+        decode_many(bytes(FRAME_SIZE+1))
+
+
+def test_comms_read_batched_frames():
+    received = list()
+
+    com = Connection()
+    com.set_received_message_callback(lambda message: received.append(bytes(message)))
+    # Two single frame messages in one read
+    first = generate_frame(0, FRAME_PAYLOAD_SIZE)
+    first.frameId = 1
+    second = generate_frame(1, FRAME_PAYLOAD_SIZE+1)
+    second.frameId = 2
+    com.incoming_buffer = encode_many([first, second])
+    status = com.process_incoming_frames()
+    assert status == ProcessState.OK
+    assert received == [bytes(first.payload), bytes(second.payload)]
+
+
+def test_frame_view_reads_fields_from_buffer():
+    frame = generate_frame()
+    frame.sourceAddress = 0x02
+    frame.frameId = 0x12345678
+    frame.frameOrder = 2
+    frame.frameTotal = 3
+    buffer = frame.to_bytes()
+    view = FrameView(memoryview(buffer))
+    assert view.is_valid() is True
+    assert view.preamble == frame.preamble
+    assert view.destinationAddress == frame.destinationAddress
+    assert view.sourceAddress == frame.sourceAddress
+    assert view.frameId == frame.frameId
+    assert view.frameOrder == frame.frameOrder
+    assert view.frameTotal == frame.frameTotal
+    assert view.crc == frame.crc
+    assert view.payload == frame.payload
+    # The view follows the buffer it was created over
+    buffer[10] = 0xFF
+    assert view.payload[0] == 0xFF
+    assert view.is_valid() is False
+
+
+def test_comms_read_single_frame_without_copy():
+    received = list()
+
+    com = Connection()
+    com.set_received_message_callback(lambda message: received.append(message))
+    com.incoming_buffer = generate_frame().to_bytes()
+    status = com.process_incoming_frames()
+    assert status == ProcessState.OK
+    # The payload is passed as a view over the receive buffer
+    assert isinstance(received[0], memoryview)
+    assert received[0].obj is com.receive_buffer
+
+
+def test_comms_write_batches_queued_messages():
+
+    writes = list()
+    com = Connection()
+    com.batch_write = True
+    com.write = lambda buffer: writes.append(bytes(buffer))  # type: ignore
+    com.send_message(bytes([x for x in range(0, FRAME_PAYLOAD_SIZE*2)]))
+    com.send_message(bytes([x for x in range(0, 99)]))
+
+    status = com.process_outgoing_frames()
+    assert status == ProcessState.OK
+    assert com.messages_outgoing.empty() is True
+
+    # Both messages are written in one transfer
+    assert len(writes) == 1
+    frames = decode_many(writes[0])
+    assert len(frames) == 4
+    assert all(frame.is_valid() for frame in frames)
+    assert [(frame.frameOrder, frame.frameTotal) for frame in frames] == [(1, 2), (2, 2), (1, 2), (2, 2)]
+    assert frames[0].frameId != frames[2].frameId
+    assert frames[3].payload == bytes(range(50, 99)) + bytes(1)
+
+
+def test_comms_write_batch_limit():
+
+    writes = list()
+    com = Connection()
+    com.batch_write = True
+    com.write_batch_frames = 2
+    com.write = lambda buffer: writes.append(bytes(buffer))  # type: ignore
+    for _ in range(3):
+        com.send_message(bytes(FRAME_PAYLOAD_SIZE))
+
+    assert com.process_outgoing_frames() == ProcessState.OK
+    assert com.process_outgoing_frames() == ProcessState.OK
+    assert com.process_outgoing_frames() == ProcessState.ERROR
+    assert [len(write) for write in writes] == [FRAME_SIZE*2, FRAME_SIZE]
+
+
+def test_comms_write_framed_message_as_is():
+
+    writes = list()
+    com = Connection()
+    com.batch_write = True
+    com.write = lambda buffer: writes.append(bytes(buffer))  # type: ignore
+    rendered = RequestTemplate(bytes([0x0D, 1, 2, 3, 4]) + bytes(94)).render(7)
+    # FramedMessage as imported by the comm module
+    framed = FramedMessage(rendered.frames, rendered.length)
+    com.send_message(bytes(FRAME_PAYLOAD_SIZE))
+    com.send_message(framed)
+
+    assert com.process_outgoing_frames() == ProcessState.OK
+    assert len(writes) == 1
+    assert writes[0][FRAME_SIZE:] == framed.frames
@@ -0,0 +1,152 @@
+from collections import deque
+from typing import Deque, Dict
+
+import pytest
+
+from programmor_adapters.shared.api import API
+from programmor_adapters.shared.comm import Comm, Frame, FRAME_PAYLOAD_SIZE, ProcessState
+from programmor_adapters.shared.comms_manager import MultidropManager
+from programmor_adapters.shared.frame import FRAME_SIZE, FrameView, encode_many
+from programmor_adapters.shared.multidrop import DROP_QUANTUM_FRAMES
+from programmor_adapters.shared.reassembly import Reassembler
+from programmor_adapters.shared.types import MessageType
+import programmor_adapters.test_adapter.proto.test_pb2 as test_pb2
+import programmor_adapters.test_adapter.test_device as test_device
+
+
+# Fake bus gateway, frames are routed to the devices by their destination address
+class Bus(Comm):
+    def __init__(self, devices: Dict[int, test_device.TestDevice]) -> None:
+        super().__init__(receive_buffer_frames=1)
+        self.devices = devices
+        self.reassemblers = {address: Reassembler(lambda message, address=address: self.on_device_message(address, message))
+                             for address in devices}
+        self.incoming: Deque[bytes] = deque()
+        self.written: list = list()
+
+    def read(self) -> bytes:
+        try:
+            return self.incoming.popleft()
+        except IndexError:
+            return bytes(0)
+
+    def write(self, buffer: bytes) -> None:
+        for offset in range(0, len(buffer), FRAME_SIZE):
+            frame = FrameView(memoryview(buffer)[offset:offset + FRAME_SIZE])
+            self.written.append(frame.destinationAddress)
+            reassembler = self.reassemblers.get(frame.destinationAddress)
+            if reassembler is not None and frame.is_valid():
+                reassembler.push(frame)
+
+    def on_device_message(self, address: int, message: memoryview) -> None:
+        device = self.devices[address]
+        device.process_data(message.tobytes())
+        while True:
+            response = device.get_data()
+            if len(response) == 0:
+                break
+            self.incoming.extend(frame_message(response, address, frame_id=1))
+
+    def connect(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+def frame_message(data: bytes, source_address: int, frame_id: int) -> list:
+    frames = list()
+    total = -(-len(data) // FRAME_PAYLOAD_SIZE)
+    for i in range(total):
+        frame = Frame()
+        frame.destinationAddress = 0x01
+        frame.sourceAddress = source_address
+        frame.frameId = frame_id
+        frame.frameOrder = i + 1
+        frame.frameTotal = total
+        frame.payload = data[i * FRAME_PAYLOAD_SIZE:(i + 1) * FRAME_PAYLOAD_SIZE]
+        frames.append(frame)
+    buffer = bytes(encode_many(frames))
+    return [buffer[offset:offset + FRAME_SIZE] for offset in range(0, len(buffer), FRAME_SIZE)]
+
+
+def test_received_frames_routed_by_source_address():
+    bus = Bus(dict())
+    received = {0x02: list(), 0x03: list()}
+    for address in received:
+        bus.attach(address).set_received_message_callback(lambda message, address=address: received[address].append(message.tobytes()))
+    # Interleaved frames of two messages with the same frameId are joined per device
+    first = frame_message(bytes([2]) * 99, 0x02, frame_id=7)
+    second = frame_message(bytes([3]) * 99, 0x03, frame_id=7)
+    bus.incoming.extend([first[0], second[0], second[1], first[1]])
+    # Frames of addresses without a device are dropped
+    bus.incoming.extend(frame_message(bytes(10), 0x04, frame_id=8))
+    states = [bus.process_incoming_frames() for _ in range(5)]
+    assert states == [ProcessState.OK] * 4 + [ProcessState.ERROR]
+    assert [message[0:99] for message in received[0x02]] == [bytes([2]) * 99]
+    assert [message[0:99] for message in received[0x03]] == [bytes([3]) * 99]
+
+
+def test_devices_share_the_link_in_turns():
+    bus = Bus(dict())
+    bus.write_batch_frames = 12
+    busy = bus.attach(0x02)
+    quiet = bus.attach(0x03)
+    for _ in range(10):
+        busy.send_message(bytes(99))
+    quiet.send_message(bytes(99))
+    quiet.send_message(bytes(10))
+    assert bus.process_outgoing_frames() == ProcessState.OK
+    # Each turn a device writes a full transaction, the quiet device is not held up by the busy one
+    assert bus.written == [0x02, 0x02, 0x03, 0x03, 0x02, 0x02, 0x03] + [0x02] * (3 * DROP_QUANTUM_FRAMES)
+    assert busy.stats()["frames_written"] == 10
+    assert bus.process_outgoing_frames() == ProcessState.OK
+    assert bus.process_outgoing_frames() == ProcessState.ERROR
+    assert busy.stats()["frames_written"] == 20
+
+
+def test_attach_and_detach():
+    bus = Bus(dict())
+    drop = bus.attach(0x02)
+    with pytest.raises(ValueError):
+        bus.attach(0x02)
+    with pytest.raises(ValueError):
+        bus.attach(0x01)
+    drop.send_message(bytes(10))
+    drop.stop()
+    assert bus.drops == dict()
+    assert bus.detach(0x02) is False
+
+
+@pytest.fixture
+def bus_manager():
+    devices = {0x02: test_device.TestDevice("Engine", "bus-02"), 0x03: test_device.TestDevice("Gearbox", "bus-03")}
+    devices[0x03].welcome_text = "Gearbox"
+    manager = MultidropManager(lambda: Bus(devices), {"bus-02": 0x02, "bus-03": 0x03})
+    return manager
+
+
+def test_api_over_multidrop_link(bus_manager, tmp_path):
+    api = API(bus_manager, history_directory=str(tmp_path / "history"))
+    api.start()
+    try:
+        assert api.get_devices() == ["bus-02", "bus-03"]
+        assert api.connect_device("bus-02") is True
+        link = bus_manager.link
+        assert api.connect_device("bus-03") is True
+        # Both devices share one link
+        assert bus_manager.link is link
+        assert sorted(link.drops) == [0x02, 0x03]
+        assert test_pb2.Share4.FromString(api.request_message_sync("bus-02", MessageType.SHARE, 4)).welcomeText == "Hello there!"
+        assert test_pb2.Share4.FromString(api.request_message_sync("bus-03", MessageType.SHARE, 4)).welcomeText == "Gearbox"
+        # The link is stopped with its last device
+        assert api.disconnect_device("bus-02") is True
+        assert bus_manager.link is link
+        assert api.disconnect_device("bus-03") is True
+        assert bus_manager.link is None
+        link.join(1)
+        assert not link.is_alive()
+    finally:
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
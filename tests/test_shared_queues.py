@@ -0,0 +1,148 @@
+import pytest
+from queue import Empty
+from typing import Tuple
+
+from programmor_adapters.shared.queues import BoundedQueue, DropPolicy, MessagePriority, PriorityMessageQueue
+from programmor_adapters.shared.clock import VirtualClock
+
+
+def test_queue_takes_highest_priority_first():
+    queue: PriorityMessageQueue[str] = PriorityMessageQueue()
+    queue.put("poll", MessagePriority.POLL)
+    queue.put("request", MessagePriority.REQUEST)
+    queue.put("publish", MessagePriority.PUBLISH)
+    queue.put("request 2", MessagePriority.REQUEST)
+
+    assert len(queue) == 4
+    assert [queue.get_nowait() for _ in range(4)] == ["publish", "request", "request 2", "poll"]
+    assert queue.empty() is True
+    with pytest.raises(Empty):
+        queue.get_nowait()
+
+
+def test_queue_starvation_protection():
+    clock = VirtualClock()
+    queue: PriorityMessageQueue[str] = PriorityMessageQueue(starvation_s=0.1, starvation_interval=2, clock=clock)
+    queue.put("poll 1", MessagePriority.POLL)
+    queue.put("poll 2", MessagePriority.POLL)
+    clock.set(0.05)
+    for i in range(4):
+        queue.put(f"publish {i}", MessagePriority.PUBLISH)
+
+    assert queue.get_nowait() == "publish 0"
+    # The polls have now waited longer than the starvation time
+    clock.set(0.1)
+    assert queue.get_nowait() == "poll 1"
+    # Starved messages are taken at most once every starvation_interval takes
+    assert queue.get_nowait() == "publish 1"
+    assert queue.get_nowait() == "poll 2"
+    assert [queue.get_nowait() for _ in range(2)] == ["publish 2", "publish 3"]
+    assert queue.stats()["starved"] == 2
+
+
+def test_queue_supersedes_keyed_messages_in_place():
+    queue: PriorityMessageQueue[str] = PriorityMessageQueue()
+    assert queue.put("poll 1 a", MessagePriority.POLL, key=1) is None
+    assert queue.put("poll 2 a", MessagePriority.POLL, key=2) is None
+    assert queue.put("poll 1 b", MessagePriority.POLL, key=1) == "poll 1 a"
+
+    assert len(queue) == 2
+    assert queue.get_nowait() == "poll 1 b"
+    # Taken messages are no longer superseded
+    assert queue.put("poll 1 c", MessagePriority.POLL, key=1) is None
+    assert [queue.get_nowait() for _ in range(2)] == ["poll 2 a", "poll 1 c"]
+    assert queue.stats()["superseded"] == 1
+
+
+def test_queue_latency_per_class():
+    clock = VirtualClock()
+    queue: PriorityMessageQueue[str] = PriorityMessageQueue(clock=clock)
+    queue.put("poll", MessagePriority.POLL)
+    queue.put("publish", MessagePriority.PUBLISH)
+    clock.set(0.002)
+    queue.get_nowait()
+    clock.set(0.010)
+    queue.get_nowait()
+
+    stats = queue.stats()
+    assert stats["publish"]["taken"] == 1
+    assert stats["publish"]["max_ms"] == pytest.approx(2)
+    assert stats["poll"]["mean_ms"] == pytest.approx(10)
+    assert stats["request"] == {"queued": 0, "taken": 0, "mean_ms": 0, "max_ms": 0}
+
+
+def test_priority_queue_full_drops_lowest_class_first():
+    queue: PriorityMessageQueue[str] = PriorityMessageQueue(capacity=2, policy=DropPolicy.DROP_OLDEST)
+    queue.put("poll 1", MessagePriority.POLL)
+    queue.put("poll 2", MessagePriority.POLL)
+    assert queue.put("publish", MessagePriority.PUBLISH) == "poll 1"
+    assert queue.put("request", MessagePriority.REQUEST) == "poll 2"
+    # Never drops a message of a higher class than the new one
+    assert queue.put("poll 3", MessagePriority.POLL) == "poll 3"
+
+    assert [queue.get_nowait() for _ in range(2)] == ["publish", "request"]
+    stats = queue.stats()
+    assert stats["dropped"] == 3
+    assert stats["max_occupancy"] == 2
+    assert stats["occupancy"] == 0
+
+
+def test_bounded_queue_drop_policies():
+    oldest: BoundedQueue[int] = BoundedQueue(2, DropPolicy.DROP_OLDEST)
+    newest: BoundedQueue[int] = BoundedQueue(2, DropPolicy.DROP_NEWEST)
+    for i in range(3):
+        oldest.put(i)
+        newest.put(i)
+
+    assert oldest.snapshot() == [1, 2]
+    assert newest.snapshot() == [0, 1]
+    assert oldest.stats() == {"occupancy": 2, "max_occupancy": 2, "capacity": 2, "dropped": 1, "coalesced": 0}
+    assert newest.stats()["dropped"] == 1
+
+
+def test_bounded_queue_block_times_out():
+    queue: BoundedQueue[int] = BoundedQueue(1, DropPolicy.BLOCK, block_timeout_s=0.01)
+    assert queue.put(1) is None
+    assert queue.put(2) == 2
+    assert queue.get_nowait() == 1
+    assert queue.put(3) is None
+    assert queue.stats()["dropped"] == 1
+    assert queue.get(timeout=0) == 3
+    with pytest.raises(Empty):
+        queue.get(timeout=0)
+
+
+def test_bounded_queue_coalesces_by_key():
+    with pytest.raises(ValueError):
+        BoundedQueue(2, DropPolicy.COALESCE)
+
+    queue: BoundedQueue[Tuple[str, int, int]] = BoundedQueue(2, DropPolicy.COALESCE, key=lambda message: (message[0], message[1]))
+    queue.put(("device", 1, 10))
+    queue.put(("device", 2, 20))
+    assert queue.put(("device", 1, 11)) == ("device", 1, 10)
+    # Coalesced messages keep their place in the queue
+    assert queue.snapshot() == [("device", 1, 11), ("device", 2, 20)]
+    # Full without a matching key drops the oldest
+    assert queue.put(("other", 1, 30)) == ("device", 1, 11)
+    assert queue.stats()["coalesced"] == 1
+    assert queue.stats()["dropped"] == 1
+
+
+def test_bounded_queue_coalesces_only_while_full():
+    queue: BoundedQueue[Tuple[str, int, int]] = BoundedQueue(10, DropPolicy.COALESCE, key=lambda message: (message[0], message[1]))
+    messages = [("device", 1, value) for value in range(5)] + [("device", 2, 20), ("device", 1, 5)]
+    for message in messages:
+        assert queue.put(message) is None
+    assert [queue.get_nowait() for _ in messages] == messages
+    assert queue.stats()["coalesced"] == 0
+
+    # Once full the newest queued message of the key is replaced, older ones leave the queue as usual
+    queue = BoundedQueue(3, DropPolicy.COALESCE, key=lambda message: (message[0], message[1]))
+    queue.put(("device", 1, 10))
+    queue.put(("device", 1, 11))
+    queue.put(("device", 2, 20))
+    assert queue.put(("device", 1, 12)) == ("device", 1, 11)
+    assert queue.get_nowait() == ("device", 1, 10)
+    assert queue.put(("device", 1, 13)) is None
+    assert queue.snapshot() == [("device", 1, 12), ("device", 2, 20), ("device", 1, 13)]
+    assert queue.stats()["coalesced"] == 1
@@ -0,0 +1,64 @@
+from programmor_adapters.shared.frame import Frame, FrameView, FRAME_PAYLOAD_SIZE
+from programmor_adapters.shared.reassembly import Reassembler
+from programmor_adapters.shared.clock import VirtualClock
+
+
+def generate_view(frameId: int, frameOrder: int, frameTotal: int) -> FrameView:
+    frame = Frame()
+    frame.destinationAddress = 0x01
+    frame.frameId = frameId
+    frame.frameOrder = frameOrder
+    frame.frameTotal = frameTotal
+    frame.payload = bytes([frameOrder]) * FRAME_PAYLOAD_SIZE
+    return FrameView(memoryview(frame.to_bytes()))
+
+
+def test_reassembly_interleaved_sets():
+    received = list()
+    reassembler = Reassembler(lambda message: received.append(bytes(message)))
+    assert reassembler.push(generate_view(1, 2, 2)) is True
+    assert reassembler.push(generate_view(2, 1, 2)) is True
+    assert reassembler.push(generate_view(1, 1, 2)) is True
+    assert received == [bytes([1]) * FRAME_PAYLOAD_SIZE + bytes([2]) * FRAME_PAYLOAD_SIZE]
+    assert reassembler.push(generate_view(2, 2, 2)) is True
+    assert len(received) == 2
+    assert reassembler.stats() == {"pending": 0, "completed": 2, "evicted": 0, "duplicates": 0}
+
+
+def test_reassembly_duplicate_frame():
+    received = list()
+    reassembler = Reassembler(lambda message: received.append(bytes(message)))
+    assert reassembler.push(generate_view(1, 1, 3)) is True
+    assert reassembler.push(generate_view(1, 1, 3)) is False
+    assert reassembler.duplicates == 1
+    assert reassembler.push(generate_view(1, 2, 3)) is True
+    assert reassembler.push(generate_view(1, 3, 3)) is True
+    assert len(received) == 1
+
+
+def test_reassembly_rejects_invalid_order():
+    reassembler = Reassembler(lambda _: None)
+    assert reassembler.push(generate_view(1, 0, 2)) is False
+    assert reassembler.push(generate_view(1, 3, 2)) is False
+    assert reassembler.stats()["pending"] == 0
+
+
+def test_reassembly_evicts_stale_sets():
+    clock = VirtualClock()
+    reassembler = Reassembler(lambda _: None, max_age_s=1.0, clock=clock)
+    reassembler.push(generate_view(1, 1, 2))
+    clock.set(0.5)
+    reassembler.push(generate_view(2, 1, 2))
+    clock.set(1.2)
+    assert reassembler.evict_stale() == 1
+    assert list(reassembler.sets.keys()) == [2]
+    assert reassembler.evicted == 1
+
+
+def test_reassembly_evicts_oldest_set_over_limit():
+    reassembler = Reassembler(lambda _: None, max_sets=2)
+    reassembler.push(generate_view(1, 1, 2))
+    reassembler.push(generate_view(2, 1, 2))
+    reassembler.push(generate_view(3, 1, 2))
+    assert list(reassembler.sets.keys()) == [2, 3]
+    assert reassembler.evicted == 1
@@ -0,0 +1,39 @@
+from programmor_adapters.shared.api import API
+from programmor_adapters.shared.frame import Frame, FrameView, FRAME_SIZE, FRAME_PAYLOAD_SIZE, encode_many
+from programmor_adapters.shared.request_template import FramedMessage, RequestTemplate
+from programmor_adapters.shared.transaction_codec import decode_transaction
+from programmor_adapters.shared.types import MessageType
+
+
+def frame_message(message_bytes: bytes, frame_id: int) -> bytes:
+    frames = list()
+    frame_total = -(-len(message_bytes) // FRAME_PAYLOAD_SIZE)
+    for i in range(frame_total):
+        frame = Frame()
+        frame.frameId = frame_id
+        frame.frameOrder = i + 1
+        frame.frameTotal = frame_total
+        frame.payload = message_bytes[i * FRAME_PAYLOAD_SIZE:(i + 1) * FRAME_PAYLOAD_SIZE]
+        frames.append(frame)
+    return bytes(encode_many(frames))
+
+
+def test_template_renders_the_framed_request():
+    template = RequestTemplate(API._request_message(MessageType.SHARE, 2, 1).SerializeToString())
+    for token in (1, 0x12345678, 0xffffffff):
+        framed = template.render(token)
+        expected = API._request_message(MessageType.SHARE, 2, token).SerializeToString()
+        assert framed.message == expected
+        assert framed.frames == frame_message(expected, token)
+        for offset in range(0, len(framed.frames), FRAME_SIZE):
+            assert FrameView(memoryview(framed.frames)[offset:offset + FRAME_SIZE]).is_valid()
+        assert decode_transaction(framed.message).token == token
+
+
+def test_rendered_messages_are_copies():
+    template = RequestTemplate(API._request_message(MessageType.COMMON, 1, 1).SerializeToString())
+    first = template.render(10)
+    template.render(11)
+    assert isinstance(first, FramedMessage)
+    assert decode_transaction(first.message).token == 10
+    assert FrameView(memoryview(first.frames)[0:FRAME_SIZE]).frameId == 10
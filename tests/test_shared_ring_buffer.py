@@ -0,0 +1,70 @@
+import struct
+
+import pytest
+
+from programmor_adapters.shared.ring_buffer import RecentShares
+
+
+def value(data: bytes) -> float:
+    return struct.unpack("<f", data)[0]
+
+
+def share(number: float) -> bytes:
+    return struct.pack("<f", number)
+
+
+def test_ring_keeps_latest_values():
+    recent = RecentShares(capacity=10)
+    for i in range(25):
+        recent.append("device", 2, bytes([i]), i * 10)
+    # The oldest values were overwritten
+    assert [data[0] for _, data in recent.query("device", 2, 0, 1000)] == list(range(15, 25))
+    assert recent.query("device", 2, 170, 190) == [(170, bytes([17])), (180, bytes([18])), (190, bytes([19]))]
+    assert recent.query("device", 3, 0, 1000) == []
+    assert recent.stats() == [{"deviceId": "device", "shareId": 2, "appended": 25, "kept": 10}]
+    with pytest.raises(ValueError):
+        recent.append("device", 2, bytes(81), 300)
+
+
+def test_decimated_without_value():
+    recent = RecentShares(capacity=100)
+    for i in range(100):
+        recent.append("device", 2, bytes([i]), i)
+    # The first value of each of 4 buckets of 25ns
+    assert [data[0] for _, data in recent.query("device", 2, 0, 99, width=4)] == [0, 25, 50, 75]
+    # Fewer values than buckets are returned as they are
+    assert len(recent.query("device", 2, 0, 9, width=20)) == 10
+
+
+def test_min_max_with_value():
+    recent = RecentShares(capacity=64)
+    # Wraps around the ring, the values of each bucket of 10 are 0..9 reversed for odd buckets
+    for i in range(100):
+        number = i % 10 if (i // 10) % 2 == 0 else 9 - i % 10
+        recent.append("device", 2, share(number), i)
+    recent.set_value("device", 2, value)
+    shares = recent.query("device", 2, 40, 99, width=6)
+    assert [(timestamp, value(data)) for timestamp, data in shares] == [
+        (40, 0), (49, 9), (50, 9), (59, 0), (60, 0), (69, 9), (70, 9), (79, 0), (80, 0), (89, 9), (90, 9), (99, 0)]
+    # Values of shares received after the value function is set
+    recent.set_value("device", 3, value)
+    recent.append("device", 3, share(1), 0)
+    recent.append("device", 3, b"", 1)
+    recent.append("device", 3, share(5), 2)
+    assert [timestamp for timestamp, _ in recent.query("device", 3, 0, 2, width=1)] == [0, 2]
+
+
+def test_min_max_skips_failed_values():
+    recent = RecentShares(capacity=16)
+    recent.set_value("device", 2, value)
+    # The value function fails on the first share of the bucket
+    recent.append("device", 2, b"bad", 0)
+    for i in range(1, 8):
+        recent.append("device", 2, share(i if i != 5 else -1), i * 10)
+    shares = recent.query("device", 2, 0, 100, width=2)
+    assert [(timestamp, value(data)) for timestamp, data in shares] == [(10, 1), (40, 4), (50, -1), (70, 7)]
+    # Every value failed
+    recent.set_value("device", 3, value)
+    for i in range(8):
+        recent.append("device", 3, b"bad", i)
+    assert [timestamp for timestamp, _ in recent.query("device", 3, 0, 7, width=2)] == [0, 4]
@@ -0,0 +1,141 @@
+import pytest
+
+from programmor_adapters.shared.scheduler import Scheduler
+from programmor_adapters.shared.types import MessageType
+from programmor_adapters.shared.clock import VirtualClock, ms_to_ns
+
+
+def due_shares(scheduler: Scheduler):
+    return [schedule.share_id for schedule in scheduler.pop_due()]
+
+
+def test_scheduler_fires_due_schedules_in_deadline_order():
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock, stagger=False)
+    assert scheduler.next_deadline() is None
+    scheduler.set("device", MessageType.SHARE, 1, 100)
+    scheduler.set("device", MessageType.SHARE, 2, 30)
+
+    # New schedules are due immediately
+    assert due_shares(scheduler) == [1, 2]
+    assert scheduler.next_deadline() == ms_to_ns(30)
+    clock.set(0.03)
+    assert due_shares(scheduler) == [2]
+    clock.set(0.099)
+    assert due_shares(scheduler) == [2]
+    clock.set(0.1)
+    assert due_shares(scheduler) == [1]
+
+
+def test_scheduler_index_updates_and_clears():
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock)
+    scheduler.set("device", MessageType.SHARE, 1, 100)
+    scheduler.set("other", MessageType.SHARE, 1, 100)
+    scheduler.set("other", MessageType.COMMON, 1, 100)
+    assert len(scheduler) == 3
+    due_shares(scheduler)
+
+    # A new interval applies from when the schedule last fired
+    schedule = scheduler.set("device", MessageType.SHARE, 1, 50)
+    assert scheduler.get("device", MessageType.SHARE, 1) is schedule
+    assert len(scheduler) == 3
+    assert scheduler.next_deadline() == ms_to_ns(50)
+
+    assert scheduler.clear("device", MessageType.SHARE, 1) is True
+    assert scheduler.clear("device", MessageType.SHARE, 1) is False
+    assert scheduler.clear_device("other") == 2
+    assert len(scheduler) == 0
+    # Entries of removed schedules never fire
+    clock.set(1)
+    assert due_shares(scheduler) == []
+    assert scheduler.next_deadline() is None
+
+
+def test_scheduler_compacts_stale_entries():
+    scheduler = Scheduler(clock=VirtualClock())
+    for interval_ms in range(1000):
+        scheduler.set("device", MessageType.SHARE, 1, interval_ms + 1)
+    assert len(scheduler.heap) <= 2 * len(scheduler) + 16
+    assert due_shares(scheduler) == [1]
+
+
+def test_scheduler_deadlines_do_not_drift():
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock)
+    schedule = scheduler.set("device", MessageType.SHARE, 1, 100)
+    fired_at = list()
+    for cycle in range(10):
+        # Wake up late every time
+        clock.set(cycle * 0.1 + 0.007)
+        if due_shares(scheduler) == [1]:
+            fired_at.append(clock.now_ns())
+    assert len(fired_at) == 10
+    assert schedule.nominal_ns == ms_to_ns(1000)
+    assert schedule.missed == 0
+    assert schedule.achieved_rate_hz() == pytest.approx(10)
+
+
+def test_scheduler_skips_missed_deadlines():
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock)
+    schedule = scheduler.set("device", MessageType.SHARE, 1, 100)
+    due_shares(scheduler)
+    clock.set(0.35)
+    assert due_shares(scheduler) == [1]
+    # Deadlines at 0.2 and 0.3 were missed, the phase is kept
+    assert schedule.missed == 2
+    assert scheduler.next_deadline() == ms_to_ns(400)
+
+
+def test_scheduler_staggers_schedules_of_a_device():
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock)
+    for share_id in range(4):
+        scheduler.set("device", MessageType.SHARE, share_id, 100)
+    # Another device does not affect the phases
+    scheduler.set("other", MessageType.SHARE, 0, 100)
+
+    deadlines = sorted(schedule.deadline_ns for schedule in scheduler if schedule.device_id == "device")
+    assert deadlines == [0, ms_to_ns(25), ms_to_ns(50), ms_to_ns(75)]
+    assert scheduler.get("other", MessageType.SHARE, 0).deadline_ns == 0
+
+
+def test_scheduler_jitter_is_bounded():
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock)
+    schedule = scheduler.set("device", MessageType.SHARE, 1, 100, jitter_ms=10)
+    for cycle in range(1, 50):
+        clock.set_ns(schedule.deadline_ns)
+        assert due_shares(scheduler) == [1]
+        assert ms_to_ns(cycle * 100) <= schedule.deadline_ns <= ms_to_ns(cycle * 100 + 10)
+
+    with pytest.raises(ValueError):
+        scheduler.set("device", MessageType.SHARE, 1, 0)
+
+
+def test_scheduler_stats():
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock)
+    scheduler.set("device", MessageType.SHARE, 1, 50)
+    for cycle in range(5):
+        clock.set(cycle * 0.05)
+        due_shares(scheduler)
+    assert scheduler.stats("device") == [{"deviceId": "device", "messageType": MessageType.SHARE.value, "shareId": 1, "intervalMs": 50,
+                                          "requestedHz": 20, "achievedHz": pytest.approx(20), "fired": 5, "missed": 0}]
+    assert scheduler.stats("other") == []
+
+
+def test_scheduler_simulated_hour():
+    clock = VirtualClock()
+    scheduler = Scheduler(clock=clock)
+    fast = scheduler.set("device", MessageType.SHARE, 1, 100)
+    slow = scheduler.set("device", MessageType.SHARE, 2, 1000)
+    # Wake up on every deadline for an hour of virtual time
+    while clock.now_ns() < ms_to_ns(3600 * 1000):
+        scheduler.pop_due()
+        clock.set_ns(scheduler.next_deadline())
+    assert fast.fired == 36000
+    assert slow.fired == 3600
+    assert fast.missed == slow.missed == 0
+    assert fast.achieved_rate_hz() == pytest.approx(10)
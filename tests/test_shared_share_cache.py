@@ -0,0 +1,43 @@
+from programmor_adapters.shared.clock import NS_PER_MS
+from programmor_adapters.shared.share_cache import ShareCache
+from programmor_adapters.shared.transaction_codec import TOKEN_MAX
+
+KEY = ("device", 2, 4)
+
+
+def test_fresh_values_answered():
+    cache = ShareCache()
+    assert cache.get(KEY, 100, 0) is None
+    cache.update(KEY, memoryview(b"share"), 10 * NS_PER_MS)
+    assert cache.get(KEY, 100, 110 * NS_PER_MS) == b"share"
+    # Too old for this read
+    assert cache.get(KEY, 50, 110 * NS_PER_MS) is None
+    assert cache.get(("device", 1, 4), 100, 110 * NS_PER_MS) is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 3, "invalidations": 0, "stale": 0}
+
+
+def test_invalidate():
+    cache = ShareCache()
+    cache.update(KEY, b"share", 0)
+    cache.invalidate(KEY)
+    cache.invalidate(KEY)
+    assert cache.get(KEY, 100, 0) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_responses_requested_before_a_write_ignored():
+    cache = ShareCache()
+    cache.update(KEY, b"old", 0, token=10)
+    cache.invalidate(KEY, token=12)
+    # Requested before the write, still in flight when it was sent
+    assert cache.update(KEY, b"old", 10, token=11) is False
+    assert cache.get(KEY, 100, 10) is None
+    assert cache.update(KEY, b"new", 20, token=13) is True
+    assert cache.get(KEY, 100, 20) == b"new"
+    # Notifications carry no request token
+    assert cache.update(KEY, b"notified", 30) is True
+    assert cache.stats()["stale"] == 1
+    # Tokens wrap around
+    cache.invalidate(KEY, token=1)
+    assert cache.update(KEY, b"old", 40, token=TOKEN_MAX) is False
+    assert cache.update(KEY, b"new", 50, token=2) is True
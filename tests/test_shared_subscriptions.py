@@ -0,0 +1,30 @@
+from programmor_adapters.shared.clock import NS_PER_MS, NS_PER_S
+from programmor_adapters.shared.subscriptions import STALE_MIN_S, Subscription
+
+
+def test_subscription_counts_lost_and_duplicates():
+    subscription = Subscription("device", 2, 10, 0)
+    assert [subscription.receive(sequence, sequence * 10 * NS_PER_MS) for sequence in (1, 2, 5, 4, 5, 6)] == \
+        [True, True, True, False, False, True]
+    assert (subscription.received, subscription.lost, subscription.duplicates) == (4, 2, 2)
+    assert subscription.to_dict()["lossRate"] == 2 / 6
+    # A renewed subscription restarts the sequence without counting a loss
+    subscription.subscribe(100 * NS_PER_MS)
+    assert subscription.receive(1, 110 * NS_PER_MS)
+    assert (subscription.received, subscription.lost) == (5, 2)
+    assert subscription.receive(1, 120 * NS_PER_MS) is False
+    assert subscription.duplicates == 3
+    # Restarted by the device without a renewal
+    assert subscription.receive(2, 130 * NS_PER_MS)
+    assert subscription.receive(1, 140 * NS_PER_MS)
+    assert (subscription.received, subscription.lost, subscription.duplicates) == (7, 2, 3)
+
+
+def test_subscription_deadline():
+    subscription = Subscription("device", 2, 1000, 0)
+    assert subscription.deadline_ns() == 4 * NS_PER_S
+    subscription.receive(1, 3 * NS_PER_S)
+    assert subscription.deadline_ns() == 7 * NS_PER_S
+    # Short intervals wait at least STALE_MIN_S
+    subscription = Subscription("device", 2, 10, 0)
+    assert subscription.deadline_ns() == STALE_MIN_S * NS_PER_S
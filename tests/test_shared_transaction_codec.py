@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from programmor_adapters.shared.transaction_codec import COMPACT_REQUEST_SIZE, TokenGenerator, Transaction, TransactionAction, \
+    TransactionDecodeError, decode_share_ids, decode_transaction, encode_compact_request, encode_share_ids
+import programmor_adapters.shared.proto.transaction_pb2 as transaction_pb2
+
+
+def parse(buffer: bytes):
+    message = transaction_pb2.TransactionMessage()  # type: ignore
+    message.ParseFromString(buffer)
+    return message
+
+
+def assert_same(transaction: Transaction, message) -> None:
+    assert transaction.token == message.token
+    assert transaction.action == message.action
+    assert transaction.shareId == message.shareId
+    assert transaction.dataLength == message.dataLength
+    assert bytes(transaction.data) == message.data
+
+
+def generate_messages():
+    random.seed(14)
+    for _ in range(500):
+        message = transaction_pb2.TransactionMessage()  # type: ignore
+        # Zero fields are omitted from the serialised message
+        message.token = random.choice([0, 1, random.getrandbits(32)])
+        message.action = random.choice([0, 6, 127, 128, 1000, -1])
+        message.shareId = random.choice([0, random.getrandbits(32)])
+        message.dataLength = random.choice([0, random.randint(1, 80)])
+        message.data = random.randbytes(random.choice([0, 1, 80, 127, 128, 300]))
+        yield message.SerializeToString()
+
+
+def test_decode_matches_protobuf():
+    for buffer in generate_messages():
+        transaction = decode_transaction(buffer)
+        assert_same(transaction, parse(buffer))
+        # The data is a view, not a copy
+        assert isinstance(transaction.data, memoryview)
+        assert bytes(transaction.payload()) == bytes(transaction.data[0:transaction.dataLength])
+
+
+def test_decode_fields_in_any_order_and_unknown_fields():
+    buffer = bytes([0x2A, 0x02, 0xAA, 0xBB, 0x10, 0x04, 0x0D]) + (7).to_bytes(4, "little")
+    # Unknown fields: field 6 varint, field 7 fixed64, field 8 bytes, and a repeated token
+    buffer += bytes([0x30, 0x96, 0x01, 0x39]) + bytes(8) + bytes([0x42, 0x01, 0x00, 0x0D]) + (9).to_bytes(4, "little")
+    transaction = decode_transaction(buffer)
+    assert_same(transaction, parse(buffer))
+    assert transaction.token == 9
+    assert transaction.action == TransactionAction.SHARE_REQUEST
+
+
+def test_decode_rejects_what_protobuf_rejects():
+    for buffer in list(generate_messages())[0:50]:
+        # Truncated messages and trailing zero padding
+        for candidate in (buffer[0:length] for length in range(len(buffer))):
+            try:
+                expected = parse(candidate)
+            except Exception:
+                with pytest.raises(TransactionDecodeError):
+                    decode_transaction(candidate)
+            else:
+                assert_same(decode_transaction(candidate), expected)
+        with pytest.raises(Exception):
+            parse(buffer + bytes(2))
+        with pytest.raises(TransactionDecodeError):
+            decode_transaction(buffer + bytes(2))
+
+
+def test_token_generator_skips_zero():
+    tokens = TokenGenerator(start=0xfffffffd)
+    assert [tokens.next() for _ in range(4)] == [0xfffffffe, 0xffffffff, 1, 2]
+
+
+def test_compact_request():
+    buffer = encode_compact_request(0x01020304, TransactionAction.SHARE_REQUEST, 2)
+    assert len(buffer) == COMPACT_REQUEST_SIZE
+    message = parse(buffer)
+    assert (message.token, message.action, message.shareId, message.dataLength) == (0x01020304, TransactionAction.SHARE_REQUEST, 2, 0)
+    assert_same(decode_transaction(buffer), message)
+    # A share id of 0 is still written
+    buffer = encode_compact_request(7, TransactionAction.COMMON_REQUEST, 0)
+    assert len(buffer) == COMPACT_REQUEST_SIZE
+    assert_same(decode_transaction(buffer), parse(buffer))
+
+
+def test_decode_padded():
+    # A single frame payload, and messages whose last bytes are zero
+    for buffer in [encode_compact_request(9, TransactionAction.SHARE_REQUEST, 0x100)] + list(generate_messages())[0:50]:
+        expected = parse(buffer)
+        for padding in (0, 1, 50):
+            assert_same(decode_transaction(buffer + bytes(padding), padded=True), expected)
+    with pytest.raises(TransactionDecodeError):
+        decode_transaction(bytes([0x0D, 0x01, 0x02]), padded=True)
+
+
+def test_share_ids():
+    data = encode_share_ids([1, 6, 0xffffffff])
+    assert len(data) == 12
+    assert decode_share_ids(data) == [1, 6, 0xffffffff]
+    assert decode_share_ids(memoryview(data + bytes(2))) == [1, 6, 0xffffffff]
@@ -0,0 +1,70 @@
+import pytest
+
+# DropPolicy as imported by the transactions module
+from programmor_adapters.shared.transactions import DropPolicy, RequestRecord, TransactionTable
+from programmor_adapters.shared.clock import VirtualClock, ms_to_ns
+
+
+def generate_record(device_id: str, token: int) -> RequestRecord:
+    return RequestRecord(token, device_id, 0)
+
+
+def test_transaction_table_matches_by_device_and_token():
+    table = TransactionTable(clock=VirtualClock())
+    record = generate_record("device", 1)
+    assert table.add(record) is True
+    assert table.add(generate_record("other", 1)) is True
+
+    assert table.match("device", 2) is None
+    assert table.match("device", 1) is record
+    assert record.received_ns is not None
+    assert table.match("device", 1) is None
+    assert len(table) == 1
+    assert table.stats("device") == {"device": {"outstanding": 0, "completed": 1, "timeouts": 0, "late": 0, "dropped": 0}}
+
+
+def test_transaction_table_expires_and_counts_late_responses():
+    clock = VirtualClock()
+    table = TransactionTable(timeout_s=1, clock=clock)
+    table.add(generate_record("device", 1))
+    clock.set(0.5)
+    table.add(generate_record("device", 2))
+    assert table.next_deadline() == ms_to_ns(1000)
+
+    clock.set(1)
+    assert table.expire() == 1
+    assert table.next_deadline() == ms_to_ns(1500)
+    # The response arrives after the transaction timed out
+    late = table.match("device", 1)
+    assert late is not None and late.timed_out is True
+    assert table.match("device", 2).timed_out is False
+    assert table.stats()["device"] == {"outstanding": 0, "completed": 1, "timeouts": 1, "late": 1, "dropped": 0}
+
+
+def test_transaction_table_capacity():
+    table = TransactionTable(capacity=2, clock=VirtualClock())
+    for token in range(3):
+        table.add(generate_record("device", token))
+    assert table.match("device", 0) is None
+    assert table.stats()["device"]["dropped"] == 1
+    assert table.stats()["device"]["outstanding"] == 2
+
+    newest = TransactionTable(capacity=1, policy=DropPolicy.DROP_NEWEST, clock=VirtualClock())
+    assert newest.add(generate_record("device", 1)) is True
+    assert newest.add(generate_record("device", 2)) is False
+
+    with pytest.raises(ValueError):
+        TransactionTable(policy=DropPolicy.COALESCE)
+
+
+def test_transaction_table_discard_and_clear():
+    table = TransactionTable(clock=VirtualClock())
+    table.add(generate_record("device", 1))
+    table.add(generate_record("device", 2))
+    table.add(generate_record("other", 1))
+    assert table.discard("device", 1) is True
+    assert table.discard("device", 1) is False
+    table.clear_device("device")
+    assert len(table) == 1
+    assert table.stats()["device"]["outstanding"] == 0
+    assert table.stats()["device"]["timeouts"] == 0
@@ -0,0 +1,112 @@
+from itertools import count
+
+import pytest
+
+from programmor_adapters.shared.clock import NS_PER_S
+from programmor_adapters.shared.transfers import CHUNK_HEADER_STRUCT, CHUNK_SIZE, TRANSFER_MAX_SIZE, Transfer, TransferDirection
+
+SHARE = bytes(i % 251 for i in range(CHUNK_SIZE * 5 + 10))
+
+
+def chunk_response(offset: int, share: bytes = SHARE) -> bytes:
+    return CHUNK_HEADER_STRUCT.pack(offset, len(share)) + share[offset:offset + CHUNK_SIZE]
+
+
+def test_read_learns_size_from_first_chunk():
+    tokens = count(1)
+    transfer = Transfer("device", 7, TransferDirection.READ, window=4)
+    # Only the first chunk is requested until the size is known
+    assert transfer.take(0, NS_PER_S, tokens.__next__) == [(1, 0)]
+    assert transfer.take(0, NS_PER_S, tokens.__next__) == []
+    assert transfer.receive(1, chunk_response(0), 10) is True
+    assert transfer.chunk_count == 6
+    taken = transfer.take(10, NS_PER_S, tokens.__next__)
+    assert [offset for _, offset in taken] == [CHUNK_SIZE * i for i in range(1, 5)]
+    for token, offset in taken:
+        assert transfer.receive(token, chunk_response(offset), 20) is True
+    # Unknown tokens are ignored
+    assert transfer.receive(99, chunk_response(0), 20) is False
+    [(token, offset)] = transfer.take(20, NS_PER_S, tokens.__next__)
+    assert transfer.receive(token, chunk_response(offset), NS_PER_S) is True
+    assert transfer.future.result(0) == SHARE
+    assert transfer.throughput_bps(NS_PER_S) == len(SHARE)
+
+
+def test_chunk_sent_again_until_retries_exhausted():
+    tokens = count(1)
+    transfer = Transfer("device", 7, TransferDirection.READ, retries=1)
+    transfer.take(0, 100, tokens.__next__)
+    assert transfer.next_deadline() == 100
+    assert transfer.expire(99) == []
+    assert transfer.expire(100) == [1]
+    assert transfer.take(100, 100, tokens.__next__) == [(2, 0)]
+    # A late answer to the first attempt is ignored
+    assert transfer.receive(1, chunk_response(0), 150) is False
+    assert transfer.expire(200) == [2]
+    assert transfer.future.exception(0) is not None
+    assert transfer.take(200, 100, tokens.__next__) == []
+
+
+def test_resume_sends_missing_chunks():
+    tokens = count(1)
+    transfer = Transfer("device", 7, TransferDirection.READ)
+    [(token, _)] = transfer.take(0, 100, tokens.__next__)
+    transfer.receive(token, chunk_response(0), 10)
+    taken = transfer.take(10, 100, tokens.__next__)
+    for token, offset in taken[0:3]:
+        transfer.receive(token, chunk_response(offset), 20)
+    # The device goes away with two chunks in flight
+    assert sorted(transfer.fail(RuntimeError("disconnected"))) == [token for token, _ in taken[3:]]
+    failed_future = transfer.future
+    assert transfer.resume(1000) is True
+    assert transfer.future is not failed_future
+    retaken = transfer.take(1000, 100, tokens.__next__)
+    assert sorted(offset for _, offset in retaken) == [offset for _, offset in taken[3:]]
+    for token, offset in retaken:
+        transfer.receive(token, chunk_response(offset), 2000)
+    assert transfer.future.result(0) == SHARE
+    assert transfer.chunks == transfer.chunk_count
+    assert transfer.resume(3000) is False
+
+
+def test_read_fails_when_share_changes_size():
+    tokens = count(1)
+    transfer = Transfer("device", 7, TransferDirection.READ)
+    [(token, _)] = transfer.take(0, 100, tokens.__next__)
+    transfer.receive(token, chunk_response(0), 10)
+    token, offset = transfer.take(10, 100, tokens.__next__)[0]
+    assert transfer.receive(token, chunk_response(offset, SHARE + b"x"), 20) is False
+    assert transfer.future.exception(0) is not None
+    # A resume reads the share again from the start
+    transfer.resume(30)
+    assert transfer.total is None and transfer.bytes_done == 0
+
+
+def test_write_completes_on_acknowledgements():
+    tokens = count(1)
+    transfer = Transfer("device", 7, TransferDirection.WRITE, SHARE, window=16)
+    taken = transfer.take(0, 100, tokens.__next__)
+    assert len(taken) == transfer.chunk_count
+    assert bytes(transfer.chunk_data(taken[-1][1])) == SHARE[CHUNK_SIZE * 5:]
+    # An acknowledgement for the wrong offset is sent again
+    assert transfer.receive(taken[0][0], CHUNK_HEADER_STRUCT.pack(CHUNK_SIZE, len(SHARE)), 10) is False
+    for token, offset in taken[1:]:
+        assert transfer.receive(token, CHUNK_HEADER_STRUCT.pack(offset, len(SHARE)), 10) is True
+    assert transfer.future.done() is False
+    [(token, offset)] = transfer.take(10, 100, tokens.__next__)
+    assert offset == 0
+    transfer.receive(token, CHUNK_HEADER_STRUCT.pack(0, len(SHARE)), 20)
+    assert transfer.future.result(0) == SHARE
+    assert transfer.to_dict(20)["progress"] == 1
+
+
+def test_transfer_limits():
+    with pytest.raises(ValueError):
+        Transfer("device", 7, TransferDirection.WRITE)
+    with pytest.raises(ValueError):
+        Transfer("device", 7, TransferDirection.WRITE, bytes(TRANSFER_MAX_SIZE + 1))
+    # An empty share is a single empty chunk
+    transfer = Transfer("device", 7, TransferDirection.WRITE, b"")
+    [(token, offset)] = transfer.take(0, 100, count(1).__next__)
+    transfer.receive(token, CHUNK_HEADER_STRUCT.pack(0, 0), 10)
+    assert transfer.future.result(0) == b""
@@ -0,0 +1,66 @@
+"""Time to read a device configuration, a request per share against one batch request.
+
+Reads shares 2 to 6 of a loopback device with a round trip latency of LATENCY_S and
+FRAME_TIME_S per frame written: one request_message_sync per share, a request_message_future
+per share in flight together, and request_many.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/batch_requests.py
+"""
+import tempfile
+from statistics import median
+from time import perf_counter, sleep
+from typing import Callable, Dict, List
+
+from shared.api import API
+from shared.transaction_codec import Capability
+from shared.types import MessageType
+
+from loopback import LoopbackManager
+
+READS = 50
+SHARES = [2, 3, 4, 5, 6]
+LATENCY_S = 0.002
+FRAME_TIME_S = 0.001
+
+
+def read_sync(api: API, device_id: str) -> Dict[int, bytes]:
+    return {share_id: api.request_message_sync(device_id, MessageType.SHARE, share_id) for share_id in SHARES}
+
+
+def read_futures(api: API, device_id: str) -> Dict[int, bytes]:
+    futures = [(share_id, api.request_message_future(device_id, MessageType.SHARE, share_id)) for share_id in SHARES]
+    return {share_id: future.result(1) for share_id, future in futures}
+
+
+def read_many(api: API, device_id: str) -> Dict[int, bytes]:
+    return api.request_many(device_id, SHARES).result(1)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        api = API(LoopbackManager(latency_s=LATENCY_S, frame_time_s=FRAME_TIME_S), history_directory=f"{directory}/history")
+        api.start()
+        device_id = api.get_devices()[0]
+        api.connect_device(device_id)
+        while not api.has_capability(device_id, Capability.BATCH_REQUESTS):
+            sleep(0.001)
+        comm = api.get_device(device_id)
+        reads: List[Callable[[API, str], Dict[int, bytes]]] = [read_sync, read_futures, read_many]
+        for read in reads:
+            frames_before = comm.frames_written
+            durations = list()
+            for _ in range(READS):
+                start = perf_counter()
+                shares = read(api, device_id)
+                durations.append(perf_counter() - start)
+                assert len(shares) == len(SHARES)
+            frames = (comm.frames_written - frames_before) / READS
+            print(f"{read.__name__:<12}: {median(durations) * 1000:6.2f}ms per configuration read, {frames:.0f} frames written")
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+
+
+if __name__ == "__main__":
+    main()
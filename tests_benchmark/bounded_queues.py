@@ -0,0 +1,50 @@
+"""Queue occupancy when requests are sent faster than the link can write them.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/bounded_queues.py
+"""
+import tracemalloc
+from time import sleep
+
+from shared.api import API
+from shared.queues import DropPolicy, MessagePriority
+from shared.types import MessageType
+from test_adapter.test_device import TestDevice
+
+from loopback import LoopbackComm
+
+MESSAGES = 50000
+WRITE_OVERHEAD_S = 0.0005
+
+
+def measure(capacity: int, policy: DropPolicy) -> None:
+    comm = LoopbackComm(TestDevice(name="Loopback", device_id="loopback-0", id=2), write_overhead_s=WRITE_OVERHEAD_S,
+                        outgoing_capacity=capacity)
+    comm.messages_outgoing.policy = policy
+    comm.messages_outgoing.block_timeout_s = 0.001
+    comm.set_received_message_callback(lambda _: None)
+    comm.start()
+
+    poll_bytes = API._request_message(MessageType.SHARE, 2).SerializeToString()
+    tracemalloc.start()
+    for _ in range(MESSAGES):
+        comm.send_message(bytes(poll_bytes), MessagePriority.POLL)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sleep(0.1)
+
+    stats = comm.messages_outgoing.stats()
+    print(f"capacity {capacity:>4} {policy.name:<11}: peak {peak / 1024:8.1f}KiB, max occupancy {stats['max_occupancy']:>5}, "
+          f"dropped {stats['dropped']:>5}")
+    comm.stop()
+    comm.join()
+
+
+def main():
+    measure(0, DropPolicy.DROP_OLDEST)
+    for policy in (DropPolicy.DROP_OLDEST, DropPolicy.DROP_NEWEST, DropPolicy.BLOCK):
+        measure(256, policy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Compares the event driven Comm run loop against the previous 0.1 ms polling loop.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/comm_run_loop.py
+"""
+import statistics
+import threading
+from array import array
+from queue import Empty
+from time import perf_counter, process_time, sleep
+from typing import List
+
+from shared.api import API
+from shared.frame import FRAME_SIZE
+from shared.types import MessageType
+from test_adapter.test_device import TestDevice
+
+from loopback import LoopbackComm
+
+IDLE_S = 2
+REQUESTS = 200
+
+
+class PollingLoopbackComm(LoopbackComm):
+    """The previous run loop, a non blocking read polled every 0.1 ms
+    """
+    blocking_read = False
+
+    def read_into(self, buffer: "array[int]") -> int:
+        try:
+            _, frame_bytes = self.wire.get_nowait()
+        except Empty:
+            return 0
+        memoryview(buffer)[0:FRAME_SIZE] = frame_bytes
+        return FRAME_SIZE
+
+    def run(self) -> None:
+        while True:
+            if self.stop_flag:
+                break
+            self.process_incoming_frames()
+            self.process_outgoing_frames()
+            sleep(0.0001)  # 0.1ms
+
+
+def measure(comm: LoopbackComm) -> None:
+    received = threading.Event()
+    comm.set_received_message_callback(lambda _: received.set())
+    comm.start()
+    sleep(0.1)
+
+    # Idle cpu use
+    cpu_start = process_time()
+    wall_start = perf_counter()
+    sleep(IDLE_S)
+    idle_cpu = (process_time() - cpu_start) / (perf_counter() - wall_start) * 100
+
+    # Request latency
+    request = API._request_message(MessageType.SHARE, 2).SerializeToString()
+    latencies: List[float] = list()
+    for _ in range(REQUESTS):
+        received.clear()
+        start = perf_counter()
+        comm.send_message(request)
+        if not received.wait(1):
+            continue
+        latencies.append((perf_counter() - start) * 1000)
+
+    comm.stop()
+    comm.join()
+    latencies.sort()
+    print(f"{type(comm).__name__:>22}: idle cpu {idle_cpu:6.2f}%  latency mean {statistics.mean(latencies):.3f}ms "
+          f"p50 {latencies[len(latencies) // 2]:.3f}ms p99 {latencies[int(len(latencies) * 0.99)]:.3f}ms "
+          f"({len(latencies)}/{REQUESTS} answered)")
+
+
+def main():
+    measure(PollingLoopbackComm(TestDevice("Polling", "loopback-polling")))
+    measure(LoopbackComm(TestDevice("Event", "loopback-event")))
+
+
+if __name__ == "__main__":
+    main()
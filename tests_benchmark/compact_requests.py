@@ -0,0 +1,60 @@
+"""Frames and round trip latency of full and compact requests.
+
+A full request carries DATA_MAX_SIZE bytes of unused data and takes two frames, a compact
+request is a single frame. Loopback devices advertise COMPACT_REQUESTS in their Common1, the
+API uses it unless compact_requests is off. Each frame written takes FRAME_TIME_S on the
+wire, like a USB interrupt endpoint sending one frame per 1ms interval.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/compact_requests.py
+"""
+import tempfile
+from statistics import median, quantiles
+from time import perf_counter, sleep
+
+from shared.api import API
+from shared.transaction_codec import Capability
+from shared.types import MessageType
+
+from loopback import LoopbackManager
+
+REQUESTS = 500
+SHARES = (2, 3, 4, 6)
+FRAME_TIME_S = 0.001
+
+
+def run(compact_requests: bool, frame_time_s: float) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        api = API(LoopbackManager(frame_time_s=frame_time_s), history_directory=f"{directory}/history",
+                  compact_requests=compact_requests)
+        api.start()
+        device_id = api.get_devices()[0]
+        api.connect_device(device_id)
+        # Wait for the device's capabilities
+        while compact_requests and api.get_capabilities(device_id) == Capability.NO_CAPABILITIES:
+            sleep(0.001)
+        comm = api.get_device(device_id)
+        frames_before = comm.frames_written
+        latencies = list()
+        for i in range(REQUESTS):
+            start = perf_counter()
+            response = api.request_message_sync(device_id, MessageType.SHARE, SHARES[i % len(SHARES)])
+            latencies.append(perf_counter() - start)
+            assert len(response) > 0
+        frames = comm.frames_written - frames_before
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+    name = "compact" if compact_requests else "full"
+    print(f"{name:<7} frame time {frame_time_s * 1000:.0f}ms: {frames / REQUESTS:.2f} frames per request, "
+          f"round trip median {median(latencies) * 1e6:6.0f}us p99 {quantiles(latencies, n=100)[98] * 1e6:6.0f}us")
+
+
+def main():
+    for frame_time_s in (0, FRAME_TIME_S):
+        for compact_requests in (False, True):
+            run(compact_requests, frame_time_s)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Listing devices with get_devices_detailed when one device does not answer.
+
+DEVICE_COUNT loopback devices with a round trip latency of LATENCY_S are listed, the last
+UNRESPONSIVE of them never answer. Before, the devices were connected and read one after the other, each
+waiting up to a second for its Common1. Now all devices are read at once under one deadline
+and each device is reported as soon as it answers. Once every device has answered, listing
+them again is answered from the identity cache.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/device_listing.py
+"""
+import tempfile
+from time import perf_counter
+
+from shared.api import API
+from shared.types import MessageType
+
+from loopback import LoopbackManager
+
+DEVICE_COUNT = 8
+LATENCY_S = 0.02
+UNRESPONSIVE = 2
+
+
+def one_by_one(api: API) -> int:
+    # The listing before the devices were read concurrently
+    answered = 0
+    for device_id in api.get_devices():
+        api.connect_device(device_id)
+        if len(api.request_message_sync(device_id, MessageType.COMMON, 1)) > 0:
+            answered += 1
+        api.disconnect_device(device_id)
+    return answered
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        manager = LoopbackManager(DEVICE_COUNT, latency_s=LATENCY_S)
+        unresponsive = list(manager.devices.values())[-UNRESPONSIVE:]
+        for device in unresponsive:
+            device.process_data = lambda data: None
+        api = API(manager, history_directory=f"{directory}/history")
+        api.start()
+        start = perf_counter()
+        answered = one_by_one(api)
+        print(f"one by one : {answered} devices in {perf_counter() - start:.3f}s")
+        # Read every device again
+        for device_id in api.get_devices():
+            api.identities.invalidate(device_id)
+        reported = list()
+        start = perf_counter()
+        devices = api.get_devices_detailed(on_device=lambda _: reported.append(perf_counter() - start))
+        print(f"concurrent : {len(devices)} devices in {perf_counter() - start:.3f}s, "
+              f"first after {min(reported):.3f}s, last answer after {max(reported):.3f}s")
+        # The unresponsive devices answer again
+        for device in unresponsive:
+            del device.process_data
+        api.get_devices_detailed()
+        start = perf_counter()
+        devices = api.get_devices_detailed()
+        print(f"identities : {len(devices)} devices in {perf_counter() - start:.6f}s, {api.get_identity_stats()}")
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Recording and querying the share history.
+
+Appends RECORDS values of a share to the history, as received at RATE_HZ, then times range
+queries of several lengths. Before the history the received shares could not be recorded,
+an insert into the TinyDB JSON file rewrote the whole file.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/history.py
+"""
+import tempfile
+from time import perf_counter
+
+from shared.clock import NS_PER_S
+from shared.history import ShareHistory
+
+RECORDS = 1_000_000
+RATE_HZ = 1000
+RANGES_S = [0.1, 1, 10, 60]
+QUERIES = 100
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        history = ShareHistory(directory)
+        data = bytes(range(32))
+        interval_ns = NS_PER_S // RATE_HZ
+        start = perf_counter()
+        for i in range(RECORDS):
+            history.append("device", 2, data, i * interval_ns)
+        history.flush()
+        duration = perf_counter() - start
+        print(f"append: {RECORDS / duration:9.0f} records/s, {history.stats()[0]['segments']} segments")
+        span_ns = RECORDS * interval_ns
+        for range_s in RANGES_S:
+            length_ns = int(range_s * NS_PER_S)
+            records = 0
+            start = perf_counter()
+            for i in range(QUERIES):
+                first_ns = (span_ns - length_ns) * i // QUERIES
+                records += len(history.query("device", 2, first_ns, first_ns + length_ns))
+            duration = perf_counter() - start
+            print(f"query {range_s:5.1f}s: {duration / QUERIES * 1000:7.3f}ms, {records // QUERIES} records")
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
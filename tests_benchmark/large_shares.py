@@ -0,0 +1,65 @@
+"""Throughput of chunked transfers of shares larger than a message.
+
+Reads and writes the calibration table of a loopback device (share 7) at several sizes,
+with a round trip latency of LATENCY_S and FRAME_TIME_S per frame written, for transfer
+windows of 1 chunk (stop and wait) up to 8 chunks in flight. Before chunked transfers the
+largest share was DATA_MAX_SIZE bytes.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/large_shares.py
+"""
+import tempfile
+from time import perf_counter, sleep
+
+from shared.api import API
+from shared.transaction_codec import Capability
+from shared.transfers import CHUNK_SIZE, Transfer
+import test_adapter.proto.test_pb2 as test_pb2
+
+from loopback import LoopbackManager
+
+TABLE_SIZES = [4096, 16384, 65536]
+WINDOWS = [1, 4, 8]
+LATENCY_S = 0.002
+FRAME_TIME_S = 0.0001
+
+
+def main():
+    print(f"{CHUNK_SIZE} bytes per chunk, a chunk and its answer are 2 frames each")
+    for window in WINDOWS:
+        with tempfile.TemporaryDirectory() as directory:
+            manager = LoopbackManager(latency_s=LATENCY_S, frame_time_s=FRAME_TIME_S)
+            api = API(manager, history_directory=f"{directory}/history", transfer_window=window)
+            api.start()
+            device_id = api.get_devices()[0]
+            api.connect_device(device_id)
+            while not api.has_capability(device_id, Capability.STREAMING):
+                sleep(0.001)
+            device = manager.devices[device_id]
+            progress_calls = [0]
+
+            def on_progress(_: Transfer) -> None:
+                progress_calls[0] += 1
+
+            for size in TABLE_SIZES:
+                device.calibration_table = bytes(i % 256 for i in range(size))
+                start = perf_counter()
+                read = api.read_share(device_id, 7, on_progress)
+                table = test_pb2.Share7.FromString(read.future.result(30)).calibrationTable
+                read_s = perf_counter() - start
+                assert table == device.calibration_table
+                start = perf_counter()
+                write = api.write_share(device_id, 7, test_pb2.Share7(calibrationTable=table[::-1]).SerializeToString(), on_progress)
+                write.future.result(30)
+                write_s = perf_counter() - start
+                assert device.calibration_table == table[::-1]
+                print(f"window {window} {size // 1024:3d}KB: read {read.total / read_s / 1024:7.1f}KB/s ({read.resent} resent), "
+                      f"write {write.total / write_s / 1024:7.1f}KB/s ({write.resent} resent), {read.chunks + write.chunks} chunks")
+            assert progress_calls[0] > 0
+            api.disconnect_all_devices()
+            api.stop()
+            api.join()
+
+
+if __name__ == "__main__":
+    main()
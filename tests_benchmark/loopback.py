@@ -0,0 +1,208 @@
+"""Loopback stand-in for the Teensy test firmware.
+
+Frames written by the adapter are reassembled and handed to a TestDevice, the device's
+responses are framed and returned through an in-memory wire. Used by the benchmarks to
+exercise the full Comm framing path without hardware.
+"""
+import random
+import threading
+from array import array
+from math import ceil
+from queue import Queue, Empty
+from time import perf_counter, sleep
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+from shared.comm import Comm, OUTGOING_CAPACITY
+from shared.comms_manager import CommsManager, MultidropManager
+from shared.frame import Frame, FrameView, FRAME_SIZE, FRAME_PAYLOAD_SIZE, encode_many
+from shared.reassembly import Reassembler
+from test_adapter.test_device import TestDevice
+
+
+class LoopbackComm(Comm):
+    """Comm connected to a TestDevice over an in-memory wire
+    """
+    blocking_read = True
+    batch_write = True
+
+    def __init__(self, device: TestDevice, latency_s: float = 0, write_overhead_s: float = 0,
+                 outgoing_capacity: int = OUTGOING_CAPACITY, frame_time_s: float = 0) -> None:
+        super().__init__(receive_buffer_frames=1, outgoing_capacity=outgoing_capacity)
+        self.device = device
+        # Round trip latency of the link, responses are delivered this long after the request was written
+        self.latency_s = latency_s
+        # Fixed cost of each write, like the submission of a USB transfer
+        self.write_overhead_s = write_overhead_s
+        # Time on the wire of each frame written, like a USB interrupt endpoint taking a frame per interval
+        self.frame_time_s = frame_time_s
+        # Device -> Adapter frames with their delivery time
+        self.wire: Queue[Tuple[float, bytes]] = Queue()
+        self.device_lock = threading.Lock()
+        self.device_reassembler = Reassembler(self.on_device_message)
+        # Runs the device's timed work, set when a message may have changed it
+        self.device_event = threading.Event()
+        self.ticker = threading.Thread(target=self.tick_device, daemon=True)
+        # Counters
+        self.frames_written: int = 0
+        self.frames_read: int = 0
+        self.writes: int = 0
+
+    def start(self) -> None:
+        super().start()
+        self.ticker.start()
+
+    def stop(self) -> None:
+        super().stop()
+        self.device_event.set()
+
+    def tick_device(self) -> None:
+        # The firmware main loop, streaming subscribed shares
+        while not self.stop_event.is_set():
+            with self.device_lock:
+                self.device.tick()
+                self.send_device_data()
+            self.device_event.wait(self.device.time_to_next_tick())
+            self.device_event.clear()
+
+    def read_into(self, buffer: "array[int]") -> int:
+        try:
+            due, frame_bytes = self.wire.get(timeout=self.read_timeout_ms / 1000)
+        except Empty:
+            return 0
+        delay = due - perf_counter()
+        if delay > 0:
+            sleep(delay)
+        memoryview(buffer)[0:FRAME_SIZE] = frame_bytes
+        return FRAME_SIZE
+
+    def write(self, buffer: bytes) -> None:
+        self.writes += 1
+        write_time_s = self.write_overhead_s + self.frame_time_s * (len(buffer) // FRAME_SIZE)
+        if write_time_s > 0:
+            sleep(write_time_s)
+        with self.device_lock:
+            view = memoryview(buffer)
+            for offset in range(0, len(view), FRAME_SIZE):
+                frame = FrameView(view[offset:offset + FRAME_SIZE])
+                self.frames_written += 1
+                if frame.is_valid():
+                    self.device_reassembler.push(frame)
+
+    def on_device_message(self, message: memoryview) -> None:
+        self.device.process_data(message.tobytes())
+        self.send_device_data()
+        self.device_event.set()
+
+    def send_device_data(self, device: Optional[TestDevice] = None, source_address: int = 0x02) -> None:
+        device = self.device if device is None else device
+        while True:
+            response = device.get_data()
+            if len(response) == 0:
+                break
+            due = perf_counter() + self.latency_s
+            for frame_bytes in self.frame_response(response, source_address):
+                self.frames_read += 1
+                self.wire.put((due, frame_bytes))
+
+    @staticmethod
+    def frame_response(data: bytes, source_address: int = 0x02) -> List[bytes]:
+        required_frames = ceil(len(data) / FRAME_PAYLOAD_SIZE)
+        frame_id = random.getrandbits(32)
+        frames: List[Frame] = list()
+        for i in range(required_frames):
+            frame = Frame()
+            frame.destinationAddress = 0x01
+            frame.sourceAddress = source_address
+            frame.frameId = frame_id
+            frame.frameOrder = i + 1
+            frame.frameTotal = required_frames
+            frame.payload = data[i * FRAME_PAYLOAD_SIZE:(i + 1) * FRAME_PAYLOAD_SIZE]
+            frames.append(frame)
+        buffer = bytes(encode_many(frames))
+        return [buffer[offset:offset + FRAME_SIZE] for offset in range(0, len(buffer), FRAME_SIZE)]
+
+    def connect(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class LoopbackBus(LoopbackComm):
+    """Comm connected to a bus gateway with several TestDevices behind it, frames are
+    routed to the devices by their destination address and the wire is shared by all
+    """
+
+    def __init__(self, devices: Dict[int, TestDevice], latency_s: float = 0, frame_time_s: float = 0) -> None:
+        super().__init__(next(iter(devices.values())), latency_s, frame_time_s=frame_time_s)
+        self.devices = devices
+        self.device_reassemblers = {address: Reassembler(partial(self.on_bus_message, address)) for address in devices}
+
+    def tick_device(self) -> None:
+        while not self.stop_event.is_set():
+            with self.device_lock:
+                for address, device in self.devices.items():
+                    device.tick()
+                    self.send_device_data(device, address)
+            self.device_event.wait(min(device.time_to_next_tick() for device in self.devices.values()))
+            self.device_event.clear()
+
+    def write(self, buffer: bytes) -> None:
+        self.writes += 1
+        write_time_s = self.write_overhead_s + self.frame_time_s * (len(buffer) // FRAME_SIZE)
+        if write_time_s > 0:
+            sleep(write_time_s)
+        with self.device_lock:
+            view = memoryview(buffer)
+            for offset in range(0, len(view), FRAME_SIZE):
+                frame = FrameView(view[offset:offset + FRAME_SIZE])
+                self.frames_written += 1
+                reassembler = self.device_reassemblers.get(frame.destinationAddress)
+                if reassembler is not None and frame.is_valid():
+                    reassembler.push(frame)
+
+    def on_bus_message(self, address: int, message: memoryview) -> None:
+        self.devices[address].process_data(message.tobytes())
+        self.send_device_data(self.devices[address], address)
+        self.device_event.set()
+
+
+class LoopbackBusManager(MultidropManager):
+    """MultidropManager of loopback test devices behind one bus gateway, at addresses from 0x02
+    """
+
+    def __init__(self, device_count: int = 1, latency_s: float = 0, frame_time_s: float = 0) -> None:
+        self.devices: Dict[str, TestDevice] = dict()
+        bus_devices: Dict[int, TestDevice] = dict()
+        for i in range(device_count):
+            device_id = f"bus-{i}"
+            self.devices[device_id] = bus_devices[i + 2] = TestDevice(name=f"Bus {i}", device_id=device_id, id=i + 2)
+        super().__init__(lambda: LoopbackBus(bus_devices, latency_s, frame_time_s),
+                         {device_id: i + 2 for i, device_id in enumerate(self.devices)})
+
+
+class LoopbackManager(CommsManager):
+    """CommsManager of loopback test devices
+    """
+
+    def __init__(self, device_count: int = 1, latency_s: float = 0, frame_time_s: float = 0) -> None:
+        super().__init__()
+        self.latency_s = latency_s
+        self.frame_time_s = frame_time_s
+        self.devices: Dict[str, TestDevice] = dict()
+        for i in range(device_count):
+            device_id = f"loopback-{i}"
+            self.devices[device_id] = TestDevice(name=f"Loopback {i}", device_id=device_id, id=i + 2)
+
+    def get_devices(self) -> List[str]:
+        return list(self.devices.keys())
+
+    def connect_device(self, device_id: str, callback: Callable[[str, memoryview], None]) -> bool:
+        if self.check_device(device_id) or device_id not in self.devices:
+            return False
+        comm = LoopbackComm(self.devices[device_id], self.latency_s, frame_time_s=self.frame_time_s)
+        comm.set_received_message_callback(lambda data: callback(device_id, data))
+        comm.start()
+        self.connections[device_id] = comm
+        return comm.connect()
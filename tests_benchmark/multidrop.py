@@ -0,0 +1,73 @@
+"""Ten devices polled through ten links and through one multi-drop link.
+
+Share 2 of each of DEVICE_COUNT loopback devices is polled every INTERVAL_MS, once with a
+Comm per device and once with all devices behind a bus gateway sharing one Comm. Meanwhile
+the first device reads its calibration table (share 7) in chunks, which on the shared link
+must not starve the polls of the other devices. Prints the threads of the links, the
+aggregate poll rate and the slowest and fastest device's rate.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/multidrop.py
+"""
+import tempfile
+import threading
+from collections import Counter
+from time import perf_counter, sleep
+
+from shared.api import API
+from shared.comms_manager import CommsManager
+from shared.transaction_codec import Capability
+from shared.types import MessageType
+
+from loopback import LoopbackBusManager, LoopbackManager
+
+DEVICE_COUNT = 10
+INTERVAL_MS = 10
+DURATION_S = 3.0
+LATENCY_S = 0.001
+FRAME_TIME_S = 0.00005
+
+
+def run(name: str, manager: CommsManager) -> None:
+    # Wait for the threads of the previous run to finish
+    deadline = perf_counter() + 2
+    while threading.active_count() > 1 and perf_counter() < deadline:
+        sleep(0.01)
+    with tempfile.TemporaryDirectory() as directory:
+        api = API(manager, history_directory=f"{directory}/history")
+        received: Counter = Counter()
+        api.register_callback(lambda response: received.update([response["deviceId"]]))
+        api.start()
+        device_ids = api.get_devices()
+        threads_before = threading.active_count()
+        for device_id in device_ids:
+            api.connect_device(device_id)
+        for device_id in device_ids:
+            while not api.has_capability(device_id, Capability.STREAMING):
+                sleep(0.001)
+            api.set_scheduled_message(device_id, MessageType.SHARE, 2, INTERVAL_MS)
+        threads = threading.active_count() - threads_before
+        # Skip the start of the polls
+        sleep(0.1)
+        received.clear()
+        transfers = 0
+        start = perf_counter()
+        while perf_counter() - start < DURATION_S:
+            api.read_share(device_ids[0], 7).future.result(10)
+            transfers += 1
+        duration = perf_counter() - start
+        rates = [received[device_id] / duration for device_id in device_ids]
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+    print(f"{name:<9}: {threads:2d} threads, {sum(rates):5.0f} polls/s, per device {min(rates):4.0f}-{max(rates):4.0f} polls/s "
+          f"(expected {1000 / INTERVAL_MS:.0f}), {transfers / duration:4.1f} calibration tables/s")
+
+
+def main():
+    run("10 links", LoopbackManager(DEVICE_COUNT, LATENCY_S, FRAME_TIME_S))
+    run("1 bus", LoopbackBusManager(DEVICE_COUNT, LATENCY_S, FRAME_TIME_S))
+
+
+if __name__ == "__main__":
+    main()
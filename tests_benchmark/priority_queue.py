@@ -0,0 +1,56 @@
+"""Write latency of publishes while scheduled polls saturate the link.
+
+The polls are queued faster than the loopback can write them, publishes are queued every
+few milliseconds either in the poll class (a single FIFO) or in the publish class.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/priority_queue.py
+"""
+from time import sleep
+
+from shared.api import API
+from shared.queues import MessagePriority
+from shared.types import MessageType
+from test_adapter.test_device import TestDevice
+import test_adapter.proto.test_pb2 as test_pb2
+
+from loopback import LoopbackComm
+
+POLLS = 3000
+PUBLISHES = 20
+WRITE_OVERHEAD_S = 0.0005
+
+
+def measure(publish_priority: MessagePriority) -> None:
+    comm = LoopbackComm(TestDevice(name="Loopback", device_id="loopback-0", id=2), write_overhead_s=WRITE_OVERHEAD_S,
+                        outgoing_capacity=0)
+    comm.set_received_message_callback(lambda _: None)
+    comm.start()
+
+    poll_bytes = API._request_message(MessageType.SHARE, 2).SerializeToString()
+    share = test_pb2.Share4()  # type: ignore
+    share.welcomeText = "Hi"
+    publish_bytes = API._publish_message(MessageType.SHARE, 4, share.SerializeToString()).SerializeToString()
+    for _ in range(POLLS):
+        comm.send_message(poll_bytes, MessagePriority.POLL)
+    for _ in range(PUBLISHES):
+        comm.send_message(publish_bytes, publish_priority)
+        sleep(0.005)
+    while not comm.messages_outgoing.empty():
+        sleep(0.01)
+
+    stats = comm.messages_outgoing.stats()
+    latency = stats[publish_priority.name.lower()]
+    print(f"publishes as {publish_priority.name:<7}: mean {latency['mean_ms']:7.2f}ms max {latency['max_ms']:7.2f}ms, "
+          f"starved {stats['starved']}")
+    comm.stop()
+    comm.join()
+
+
+def main():
+    measure(MessagePriority.POLL)
+    measure(MessagePriority.PUBLISH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Loading a chart of the recent values of a share.
+
+Keeps CHART_S seconds of a share received at RATE_HZ in memory and reads the whole range back
+for a chart of WIDTH pixels: every value, decimated to one value per pixel, and the smallest
+and largest value per pixel. Before the ring buffers a chart could only be loaded from TinyDB.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/recent_shares.py
+"""
+import struct
+from math import sin
+from time import perf_counter
+
+from shared.clock import NS_PER_S
+from shared.ring_buffer import RecentShares
+
+CHART_S = 600
+RATE_HZ = 50
+WIDTH = 1000
+QUERIES = 20
+
+
+def value(data: bytes) -> float:
+    return struct.unpack_from("<f", data)[0]
+
+
+def main():
+    count = CHART_S * RATE_HZ
+    recent = RecentShares(capacity=count)
+    interval_ns = NS_PER_S // RATE_HZ
+    start = perf_counter()
+    for i in range(count):
+        recent.append("device", 2, struct.pack("<f", sin(i / 100)) + bytes(28), i * interval_ns)
+    duration = perf_counter() - start
+    ring = recent.rings[("device", 2)]
+    memory = len(ring.timestamps) * 8 + len(ring.lengths) + len(ring.payloads) + len(ring.values) * 8
+    print(f"append: {count / duration:8.0f} values/s, {memory / 1024 / 1024:.1f}MB for {CHART_S}s at {RATE_HZ}Hz")
+    for name, width, value_function in (("every value", 0, None), ("decimated", WIDTH, None), ("min-max", WIDTH, value)):
+        recent.set_value("device", 2, value_function)
+        start = perf_counter()
+        for _ in range(QUERIES):
+            shares = recent.query("device", 2, 0, count * interval_ns, width)
+        duration = perf_counter() - start
+        print(f"{name:<11}: {duration / QUERIES * 1000:6.2f}ms, {len(shares)} values")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Cost of creating and completing a transaction record.
+
+Compares the datetime based record the API used before, timed with diff_ms, with the slotted
+RequestRecord holding clock nanoseconds.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/records.py
+"""
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, List, Optional
+
+from shared.clock import MONOTONIC_CLOCK
+from shared.datetime import diff_ms
+from shared.transactions import RequestRecord
+
+RECORDS = 200000
+
+
+class DatetimeRecord():
+    id: int
+    device_id: str
+    sent_at: datetime = datetime.now()
+    received_at: Optional[datetime] = None
+
+    def get_processing_time_ms(self) -> int:
+        if self.sent_at is None or self.received_at is None:
+            return -1
+        return int(diff_ms(self.received_at, self.sent_at, 5))
+
+
+def run_datetime() -> List[DatetimeRecord]:
+    records: List[DatetimeRecord] = list()
+    for token in range(RECORDS):
+        record = DatetimeRecord()
+        record.id = token
+        record.device_id = "device"
+        record.sent_at = datetime.now()
+        record.received_at = datetime.now()
+        record.get_processing_time_ms()
+        records.append(record)
+    return records
+
+
+def run_slots() -> List[RequestRecord]:
+    clock = MONOTONIC_CLOCK
+    records: List[RequestRecord] = list()
+    for token in range(RECORDS):
+        record = RequestRecord(token, "device", clock.now_ns())
+        record.received_ns = clock.now_ns()
+        record.get_processing_time_ms()
+        records.append(record)
+    return records
+
+
+def measure(name: str, run: Callable[[], list]) -> None:
+    start = perf_counter()
+    run()
+    duration = perf_counter() - start
+    tracemalloc.start()
+    records = run()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<8}: {duration / RECORDS * 1e9:6.0f}ns per record, {memory / len(records):5.0f} bytes per record")
+
+
+def main():
+    measure("datetime", run_datetime)
+    measure("slots", run_slots)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""CPU cost of building and framing scheduled polls.
+
+Compares building a protobuf request with a uuid4 token and framing it in Comm.pack_message,
+as the API did before, with rendering the schedule's RequestTemplate and copying its frames.
+Then polls loopback devices at 1 kHz aggregate through the API and measures the CPU time of
+the API thread, which schedules, builds and queues the polls.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/request_template.py
+"""
+import tempfile
+from time import perf_counter, sleep, thread_time
+from timeit import repeat
+from typing import Any, Callable
+
+from shared.api import API, ScheduledRequest
+from shared.queues import MessagePriority
+from shared.request_template import RequestTemplate
+from shared.transaction_codec import TokenGenerator
+from shared.types import MessageType
+from test_adapter.test_device import TestDevice
+
+from loopback import LoopbackComm, LoopbackManager
+
+POLLS = 100000
+DEVICES = 4
+SHARES = (2, 3, 4, 6)
+INTERVAL_MS = 16
+DURATION_S = 3.0
+
+
+class MeasuredAPI(API):
+    """API measuring the CPU time of its thread
+    """
+    thread_cpu_s: float = 0
+
+    def run(self) -> None:
+        start = thread_time()
+        super().run()
+        self.thread_cpu_s = thread_time() - start
+
+
+class ProtobufPollAPI(MeasuredAPI):
+    """Scheduled polls built as protobuf requests, as before
+    """
+
+    def _request_scheduled_message(self, schedule: ScheduledRequest) -> None:
+        self.request_message(schedule.device_id, schedule.message_type, schedule.share_id, MessagePriority.POLL)
+
+
+def run_api(api_type: type) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        api = api_type(LoopbackManager(device_count=DEVICES), history_directory=f"{directory}/history")
+        received = [0]
+        api.register_callback(lambda _: received.__setitem__(0, received[0] + 1))
+        api.start()
+        for device_id in api.get_devices():
+            api.connect_device(device_id)
+            for share_id in SHARES:
+                api.set_scheduled_message(device_id, MessageType.SHARE, share_id, INTERVAL_MS)
+        start = perf_counter()
+        sleep(DURATION_S)
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+        duration = perf_counter() - start
+    requested = DEVICES * len(SHARES) * 1000 / INTERVAL_MS
+    print(f"{api_type.__name__:<16}: requested {requested:.0f} polls/s, {received[0] / duration:6.0f} responses/s, "
+          f"API thread cpu {api.thread_cpu_s / duration * 100:5.1f}%")
+
+
+def main():
+    comm = LoopbackComm(TestDevice(name="Loopback", device_id="loopback-0", id=2))
+    tokens = TokenGenerator()
+    template = RequestTemplate(API._request_message(MessageType.SHARE, 2).SerializeToString())
+
+    def protobuf_poll() -> int:
+        return comm.pack_message(API._request_message(MessageType.SHARE, 2).SerializeToString(), 0)
+
+    def template_poll() -> int:
+        return comm.pack_message(template.render(tokens.next()), 0)
+
+    for name, poll in (("protobuf", protobuf_poll), ("template", template_poll)):
+        poll_ns = measure(poll)
+        print(f"{name:<8}: {poll_ns:6.0f}ns per poll, {1e9 / poll_ns:8.0f} polls/s per core")
+
+    for api_type in (ProtobufPollAPI, MeasuredAPI):
+        run_api(api_type)
+
+
+def measure(fn: Callable[[], Any]) -> float:
+    # Best of five runs, in nanoseconds per poll
+    return min(repeat(fn, number=POLLS, repeat=5)) / POLLS * 1e9
+
+
+if __name__ == "__main__":
+    main()
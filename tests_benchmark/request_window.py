@@ -0,0 +1,54 @@
+"""Bulk share read throughput for different request window depths.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/request_window.py
+"""
+import tempfile
+import threading
+from time import perf_counter
+
+from shared.api import API
+from shared.types import MessageType
+
+from loopback import LoopbackManager
+
+REQUESTS = 500
+LATENCY_S = 0.002
+
+
+def measure(depth: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        api = API(LoopbackManager(latency_s=LATENCY_S), history_directory=f"{directory}/history", window_depth=depth)
+        api.start()
+        api.connect_device("loopback-0")
+        window = api.get_window("loopback-0")
+        assert window is not None
+        # Keep the depth fixed for the comparison
+        window.max_depth = depth
+        received = [0]
+        done = threading.Event()
+
+        def on_response(_):
+            received[0] += 1
+            if received[0] == REQUESTS:
+                done.set()
+
+        api.register_callback(on_response)
+        start = perf_counter()
+        for _ in range(REQUESTS):
+            api.request_message("loopback-0", MessageType.SHARE, 2)
+        done.wait(30)
+        duration = perf_counter() - start
+        print(f"depth {depth:>2}: {received[0]}/{REQUESTS} responses in {duration:.3f}s, {received[0] / duration:8.1f} responses/s, {window.stats()}")
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+
+
+def main():
+    for depth in (1, 2, 4, 8, 16):
+        measure(depth)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""CPU cost of scheduled polling against the amount of schedules.
+
+Compares walking a list of schedules with datetime arithmetic on every wakeup, as the API
+did before, with the heap Scheduler. Dispatching a due schedule is a no-op so only the
+scheduling overhead is measured.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/scheduler.py
+"""
+import random
+from datetime import datetime
+from time import perf_counter, perf_counter_ns, process_time, sleep
+from typing import List, Optional
+
+from shared.datetime import diff_ms
+from shared.clock import ns_to_s
+from shared.scheduler import Scheduler
+from shared.types import MessageType
+
+DURATION_S = 2.0
+
+
+class ListSchedule:
+    def __init__(self, share_id: int, interval_ms: int) -> None:
+        self.share_id = share_id
+        self.interval_ms = interval_ms
+        self.last_scheduled = datetime.now()
+
+
+def run_list(intervals: List[int]) -> int:
+    schedules = [ListSchedule(share_id, interval_ms) for share_id, interval_ms in enumerate(intervals)]
+    fired = 0
+    end = perf_counter() + DURATION_S
+    while perf_counter() < end:
+        wait_ms: Optional[float] = None
+        for schedule in schedules:
+            elapsed_ms = diff_ms(datetime.now(), schedule.last_scheduled)
+            if elapsed_ms > schedule.interval_ms:
+                fired += 1
+                schedule.last_scheduled = datetime.now()
+                elapsed_ms = 0
+            remaining_ms = schedule.interval_ms - elapsed_ms
+            if wait_ms is None or remaining_ms < wait_ms:
+                wait_ms = remaining_ms
+        sleep(max(wait_ms or 0, 0) / 1000)
+    return fired
+
+
+def run_heap(intervals: List[int]) -> int:
+    scheduler = Scheduler()
+    for share_id, interval_ms in enumerate(intervals):
+        scheduler.set("device", MessageType.SHARE, share_id, interval_ms)
+    fired = 0
+    end = perf_counter() + DURATION_S
+    while perf_counter() < end:
+        fired += len(scheduler.pop_due())
+        deadline = scheduler.next_deadline()
+        sleep(max(ns_to_s((deadline or 0) - perf_counter_ns()), 0))
+    return fired
+
+
+def main():
+    random.seed(1)
+    for count in (10, 100, 1000, 5000):
+        intervals = [random.randint(100, 1000) for _ in range(count)]
+        for name, run in (("list", run_list), ("heap", run_heap)):
+            start = process_time()
+            fired = run(intervals)
+            cpu = (process_time() - start) / DURATION_S
+            print(f"{count:>5} schedules {name}: {fired / DURATION_S:8.0f} polls/s, cpu {cpu * 100:5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Achieved polling rate and burst size of schedules created at the same moment.
+
+Compares rescheduling from the time a schedule fired, as the API did before, with the
+phase-aligned Scheduler, without and with staggering.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/scheduler_phase.py
+"""
+from time import perf_counter, perf_counter_ns, sleep
+from typing import List
+
+from shared.clock import ns_to_s
+from shared.scheduler import Scheduler
+from shared.types import MessageType
+
+DURATION_S = 2.0
+SCHEDULES = 8
+INTERVAL_MS = 20
+
+
+def run_rescheduled() -> None:
+    # Next deadline measured from when the schedule fired
+    deadlines = [perf_counter()] * SCHEDULES
+    fired = [0] * SCHEDULES
+    bursts: List[int] = list()
+    start = perf_counter()
+    end = start + DURATION_S
+    while perf_counter() < end:
+        now = perf_counter()
+        burst = 0
+        for i, deadline in enumerate(deadlines):
+            if deadline <= now:
+                fired[i] += 1
+                burst += 1
+                deadlines[i] = perf_counter() + INTERVAL_MS / 1000
+        bursts.append(burst)
+        sleep(max(min(deadlines) - perf_counter(), 0))
+    duration = perf_counter() - start
+    rates = [count / duration for count in fired]
+    report("rescheduled", rates, bursts)
+
+
+def run_scheduler(stagger: bool) -> None:
+    scheduler = Scheduler(stagger=stagger)
+    for share_id in range(SCHEDULES):
+        scheduler.set("device", MessageType.SHARE, share_id, INTERVAL_MS)
+    bursts: List[int] = list()
+    end = perf_counter() + DURATION_S
+    while perf_counter() < end:
+        bursts.append(len(scheduler.pop_due()))
+        deadline = scheduler.next_deadline()
+        sleep(max(ns_to_s((deadline or 0) - perf_counter_ns()), 0))
+    rates: List[float] = [stats["achievedHz"] for stats in scheduler.stats()]
+    report("staggered" if stagger else "aligned", rates, bursts)
+
+
+def report(name: str, rates: List[float], bursts: List[int]) -> None:
+    polls = sum(bursts)
+    grouped = sum(burst for burst in bursts if burst > 1)
+    print(f"{name:<11}: requested {1000 / INTERVAL_MS:.2f}Hz achieved {min(rates):.2f}-{max(rates):.2f}Hz, "
+          f"{grouped / polls * 100:5.1f}% of polls sent in bursts, max burst {max(bursts)}")
+
+
+def main():
+    run_rescheduled()
+    run_scheduler(False)
+    run_scheduler(True)
+
+
+if __name__ == "__main__":
+    main()
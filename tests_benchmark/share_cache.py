@@ -0,0 +1,62 @@
+"""Reads of a polled share by several clients, with and without the latest share cache.
+
+Share 2 of a loopback device is polled every POLL_MS while CLIENTS threads read it with
+request_message_sync, once always asking the device and once accepting a share up to
+MAX_AGE_MS old. Prints the reads per second, the read latency and the USB frames written.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/share_cache.py
+"""
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+
+from shared.api import API
+from shared.types import MessageType
+
+from loopback import LoopbackManager
+
+CLIENTS = 4
+POLL_MS = 10
+MAX_AGE_MS = 20
+DURATION_S = 2.0
+LATENCY_S = 0.002
+
+
+def run(name: str, max_age_ms: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        api = API(LoopbackManager(latency_s=LATENCY_S), history_directory=f"{directory}/history")
+        api.start()
+        device_id = api.get_devices()[0]
+        api.connect_device(device_id)
+        api.set_scheduled_message(device_id, MessageType.SHARE, 2, POLL_MS)
+        sleep(0.1)
+        comm = api.get_device(device_id)
+        frames_written = comm.frames_written
+
+        def client(_: int) -> int:
+            reads = 0
+            end = perf_counter() + DURATION_S
+            while perf_counter() < end:
+                assert len(api.request_message_sync(device_id, MessageType.SHARE, 2, max_age_ms=max_age_ms)) > 0
+                reads += 1
+            return reads
+
+        with ThreadPoolExecutor(CLIENTS) as executor:
+            reads = sum(executor.map(client, range(CLIENTS)))
+        frames_written = comm.frames_written - frames_written
+        stats = api.get_cache_stats()
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+    print(f"{name:<10}: {reads / DURATION_S:8.0f} reads/s, {DURATION_S * CLIENTS / reads * 1000:6.3f}ms per read, "
+          f"{frames_written / DURATION_S:5.0f} frames/s written, {stats['hits']} hits {stats['misses']} misses")
+
+
+def main():
+    run("device", 0)
+    run(f"{MAX_AGE_MS}ms cache", MAX_AGE_MS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""USB traffic and API load of polled and streamed shares.
+
+Four shares of a loopback device are sampled every INTERVAL_MS: polled through
+set_scheduled_message with full and with compact requests, then streamed by the device through
+subscribe. Counts the frames in each direction per sample and the CPU time of the API thread.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/subscriptions.py
+"""
+import tempfile
+from time import perf_counter, sleep, thread_time
+
+from shared.api import API
+from shared.transaction_codec import Capability
+from shared.types import MessageType
+
+from loopback import LoopbackManager
+
+SHARES = (2, 3, 4, 6)
+INTERVAL_MS = 10
+DURATION_S = 3.0
+
+
+class MeasuredAPI(API):
+    """API measuring the CPU time of its thread
+    """
+    thread_cpu_s: float = 0
+
+    def run(self) -> None:
+        start = thread_time()
+        super().run()
+        self.thread_cpu_s = thread_time() - start
+
+
+def run(name: str, subscribe: bool, compact_requests: bool) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        api = MeasuredAPI(LoopbackManager(), history_directory=f"{directory}/history", compact_requests=compact_requests)
+        received = [0]
+        api.register_callback(lambda _: received.__setitem__(0, received[0] + 1))
+        started = perf_counter()
+        api.start()
+        device_id = api.get_devices()[0]
+        api.connect_device(device_id)
+        while not api.has_capability(device_id, Capability.SUBSCRIPTIONS):
+            sleep(0.001)
+        comm = api.get_device(device_id)
+        for share_id in SHARES:
+            if subscribe:
+                api.subscribe(device_id, share_id, INTERVAL_MS)
+            else:
+                api.set_scheduled_message(device_id, MessageType.SHARE, share_id, INTERVAL_MS)
+        # Skip the start of the streams
+        sleep(0.1)
+        received[0] = 0
+        frames_written, frames_read = comm.frames_written, comm.frames_read
+        start = perf_counter()
+        sleep(DURATION_S)
+        duration = perf_counter() - start
+        samples = received[0]
+        frames_written, frames_read = comm.frames_written - frames_written, comm.frames_read - frames_read
+        lost = sum(stats["lost"] for stats in api.get_subscription_stats(device_id))
+        api.disconnect_all_devices()
+        api.stop()
+        api.join()
+        total_duration = perf_counter() - started
+    print(f"{name:<13}: {samples / duration:5.0f} samples/s, {frames_written / samples:.2f} frames out and {frames_read / samples:.2f} "
+          f"frames in per sample, {(frames_written + frames_read) / duration:5.0f} frames/s, lost {lost}, "
+          f"API thread cpu {api.thread_cpu_s / total_duration * 100:4.1f}%")
+
+
+def main():
+    run("poll full", False, False)
+    run("poll compact", False, True)
+    run("subscribe", True, True)
+
+
+if __name__ == "__main__":
+    main()
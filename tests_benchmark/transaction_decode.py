@@ -0,0 +1,64 @@
+"""Cost of decoding a received TransactionMessage.
+
+Compares TransactionMessage.ParseFromString, as the API did before, with decode_transaction,
+on a share response as it arrives from the reassembler. The receive path also reads the fields
+as often as API._on_receive does.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/transaction_decode.py
+"""
+from timeit import repeat
+from typing import Any, Callable, Tuple
+
+import shared.proto.transaction_pb2 as transaction_pb2
+from shared.api import DATA_MAX_SIZE, TRANSACTION_MESSAGE_SIZE
+from shared.transaction_codec import decode_transaction
+
+MESSAGES = 200000
+
+
+def generate_response() -> memoryview:
+    message = transaction_pb2.TransactionMessage()  # type: ignore
+    message.token = 0x12345678
+    message.action = transaction_pb2.TransactionMessage.SHARE_RESPONSE  # type: ignore
+    message.shareId = 2
+    message.dataLength = 8
+    message.data = bytes(range(8)) + bytes(DATA_MAX_SIZE - 8)
+    # Two reassembled frame payloads
+    buffer = bytearray(100)
+    serialised = message.SerializeToString()
+    buffer[0:len(serialised)] = serialised
+    return memoryview(buffer)
+
+
+def decode_protobuf(data: memoryview) -> Any:
+    response = transaction_pb2.TransactionMessage()  # type: ignore
+    response.ParseFromString(bytes(data[0:TRANSACTION_MESSAGE_SIZE]))
+    return response
+
+
+def decode_fast(data: memoryview) -> Any:
+    return decode_transaction(data[0:TRANSACTION_MESSAGE_SIZE])
+
+
+def receive(decode: Callable[[memoryview], Any], data: memoryview) -> Tuple[Any, ...]:
+    # Window, pending request and transaction lookups, then the response data
+    response = decode(data)
+    return (response.token, response.token, response.token, response.action, response.shareId,
+            bytes(response.data[0:response.dataLength]))
+
+
+def measure(fn: Callable[[], Any]) -> float:
+    # Best of five runs, in nanoseconds per message
+    return min(repeat(fn, number=MESSAGES, repeat=5)) / MESSAGES * 1e9
+
+
+def main():
+    data = generate_response()
+    assert receive(decode_protobuf, data) == receive(decode_fast, data)
+    for name, decode in (("protobuf", decode_protobuf), ("fast", decode_fast)):
+        print(f"{name:<8}: decode {measure(lambda: decode(data)):6.0f}ns, receive path {measure(lambda: receive(decode, data)):6.0f}ns per message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Request throughput with per-frame writes against batched writes.
+
+Each write to the loopback costs a fixed overhead, standing in for the submission of a
+USB bulk transfer to the Teensy test firmware.
+
+Run from the repository root:
+    PYTHONPATH=programmor_adapters python tests_benchmark/write_batching.py
+"""
+import threading
+from time import perf_counter
+
+from shared.api import API
+from shared.types import MessageType
+from test_adapter.test_device import TestDevice
+
+from loopback import LoopbackComm
+
+REQUESTS = 2000
+WRITE_OVERHEAD_S = 0.0002
+
+
+def measure(batch_write: bool) -> None:
+    comm = LoopbackComm(TestDevice(name="Loopback", device_id="loopback-0", id=2), write_overhead_s=WRITE_OVERHEAD_S,
+                        outgoing_capacity=0)
+    comm.batch_write = batch_write
+    received = [0]
+    done = threading.Event()
+
+    def on_message(_):
+        received[0] += 1
+        if received[0] == REQUESTS:
+            done.set()
+
+    comm.set_received_message_callback(on_message)
+    comm.start()
+
+    message_bytes = API._request_message(MessageType.SHARE, 2).SerializeToString()
+
+    start = perf_counter()
+    for _ in range(REQUESTS):
+        comm.send_message(message_bytes)
+    done.wait(60)
+    duration = perf_counter() - start
+    mode = "batched  " if batch_write else "per-frame"
+    print(f"{mode}: {received[0]}/{REQUESTS} responses in {duration:.3f}s, {received[0] / duration:8.1f} responses/s, "
+          f"{comm.frames_written} frames in {comm.writes} writes")
+    comm.stop()
+    comm.join()
+
+
+def main():
+    measure(False)
+    measure(True)
+
+
+if __name__ == "__main__":
+    main()